@@ -0,0 +1,104 @@
+import argparse
+import logging
+import sys
+
+from . import datagen, load, micro
+from .results import report
+
+
+def _generate(args) -> list[dict]:
+    rows = datagen.write_csv(args.out, args.rows, args.meters, args.source, args.seed)
+    print("Wrote %d rows to %s" % (rows, args.out), file=sys.stderr)
+    return []
+
+
+def _micro(args) -> list[dict]:
+    return micro.run(args.sizes, args.repeat)
+
+
+def _load(args) -> list[dict]:
+    server = None
+    if args.http:
+        call = load.http_call(args.http)
+        target = args.http
+    else:
+        target = args.grpc
+        if args.grpc is None:
+            # Imported lazily: the stub patches the servicer module.
+            from .stub import start_stub_server
+
+            server, port = start_stub_server(args.stub_rows, cache=args.cache)
+            target = "127.0.0.1:%d" % port
+        request = load.metrics_request(args.limit, args.columnar, args.meter)
+        call = load.grpc_call(target, args.method, request)
+    try:
+        result = load.drive(call, args.concurrency, args.duration, args.requests)
+    finally:
+        if server is not None:
+            server.stop(None)
+    name = "http" if args.http else args.method
+    return [
+        {
+            "name": "%s_%s" % (name, "stub" if server else "live"),
+            "target": target,
+            "limit": args.limit,
+            "columnar": args.columnar,
+            **result,
+        }
+    ]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write a synthetic seed CSV")
+    generate.add_argument("out")
+    generate.add_argument("--rows", type=int, default=1_000_000)
+    generate.add_argument("--meters", type=int, default=1)
+    generate.add_argument("--source", help="CSV whose values are replayed")
+    generate.add_argument("--seed", type=int, default=0)
+    generate.set_defaults(run=_generate)
+
+    micro_cmd = commands.add_parser("micro", help="encode/serialize micro-benchmarks")
+    micro_cmd.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    micro_cmd.add_argument("--repeat", type=int, default=20)
+    micro_cmd.set_defaults(run=_micro)
+
+    load_cmd = commands.add_parser("load", help="concurrent load test")
+    target = load_cmd.add_mutually_exclusive_group()
+    target.add_argument("--grpc", metavar="HOST:PORT", help="running gRPC server")
+    target.add_argument("--http", metavar="URL", help="frontend JSON endpoint")
+    load_cmd.add_argument(
+        "--stub-rows",
+        type=int,
+        default=100_000,
+        help="rows served by the in-memory stub (used without --grpc/--http)",
+    )
+    load_cmd.add_argument("--cache", action="store_true", help="keep response cache")
+    load_cmd.add_argument(
+        "--method", choices=("GetMetrics", "StreamMetrics"), default="GetMetrics"
+    )
+    load_cmd.add_argument("--limit", type=int, default=1_000)
+    load_cmd.add_argument("--columnar", action="store_true")
+    load_cmd.add_argument("--meter", action="append", default=[])
+    load_cmd.add_argument("--concurrency", type=int, default=8)
+    stop = load_cmd.add_mutually_exclusive_group()
+    stop.add_argument("--duration", type=float)
+    stop.add_argument("--requests", type=int)
+    load_cmd.set_defaults(run=_load)
+
+    args = parser.parse_args(argv)
+    if args.command == "load" and args.duration is None and args.requests is None:
+        args.duration = 10.0
+    logging.basicConfig(level=logging.WARNING)
+    results = args.run(args)
+    if results:
+        report(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import csv
+import math
+import random
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+
+from server.orm import parse_reading
+
+START = datetime(2019, 1, 1, 0, 15)
+STEP = timedelta(minutes=15)
+
+
+def load_profile(path: str) -> list[float]:
+    """Return the valid ``meterusage`` values of a source CSV, in file order."""
+    with open(path, newline="") as f:
+        readings = (
+            parse_reading(row.get("time"), row.get("meterusage"))
+            for row in csv.DictReader(f)
+        )
+        return [reading[1] for reading in readings if reading is not None]
+
+
+def _default_profile() -> list[float]:
+    # One day of 15-minute readings with a daytime peak.
+    return [50 + 25 * math.sin(math.pi * i / 96) ** 2 for i in range(96)]
+
+
+def iter_rows(
+    rows: int,
+    meters: int = 1,
+    profile: list[float] | None = None,
+    seed: int = 0,
+    start: datetime = START,
+    step: timedelta = STEP,
+) -> Iterator[tuple[str, float, str]]:
+    """Yield ``rows`` synthetic ``(time, meterusage, meter_id)`` readings.
+
+    Every timestamp gets one reading per meter. Values replay ``profile``
+    (e.g. the real ``meterusage.csv``) with ±10% per-meter noise, so the
+    value distribution stays realistic at any scale. Output is
+    deterministic for a given ``seed``.
+    """
+    profile = profile or _default_profile()
+    rng = random.Random(seed)
+    ids = ["meter-%04d" % m for m in range(meters)]
+    emitted = 0
+    tick = 0
+    while emitted < rows:
+        time = str(start + tick * step)
+        base = profile[tick % len(profile)]
+        for meter_id in ids[: rows - emitted]:
+            yield time, round(base * rng.uniform(0.9, 1.1), 2), meter_id
+        emitted += min(meters, rows - emitted)
+        tick += 1
+
+
+def write_csv(path: str, rows: int, meters: int = 1, source=None, seed=0) -> int:
+    """Write a seedable CSV with ``rows`` readings; return the row count."""
+    profile = load_profile(source) if source else None
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("time", "meterusage", "meter_id"))
+        writer.writerows(iter_rows(rows, meters, profile, seed))
+    return rows
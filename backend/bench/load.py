@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+import urllib.request
+
+import grpc
+import metrics_pb2
+import metrics_pb2_grpc
+
+from .results import latency_summary
+
+
+def drive(call, concurrency: int, duration: float | None = None, requests=None):
+    """Run ``call`` from ``concurrency`` threads until time or requests run out.
+
+    ``call`` returns the number of rows it received. Returns a result dict
+    with the latency summary, throughput in requests and rows per second,
+    and the error count; failed calls are not part of the latency summary.
+    """
+    if duration is None and requests is None:
+        raise ValueError("Either duration or requests is required.")
+    deadline = time.perf_counter() + duration if duration is not None else None
+    remaining = [requests]
+    lock = threading.Lock()
+    latencies: list[float] = []
+    totals = {"rows": 0, "errors": 0}
+
+    def take() -> bool:
+        if deadline is not None and time.perf_counter() >= deadline:
+            return False
+        with lock:
+            if remaining[0] is None:
+                return True
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker():
+        while take():
+            started = time.perf_counter()
+            try:
+                rows = call()
+            except Exception:
+                with lock:
+                    totals["errors"] += 1
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                totals["rows"] += rows
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    return {
+        "kind": "load",
+        "concurrency": concurrency,
+        **latency_summary(latencies),
+        "errors": totals["errors"],
+        "rows": totals["rows"],
+        "wall_s": wall,
+        "requests_per_sec": len(latencies) / wall,
+        "rows_per_sec": totals["rows"] / wall,
+    }
+
+
+def _rows(response) -> int:
+    return len(response.data) or len(response.columns.time_unix_ms)
+
+
+def grpc_call(target: str, method: str, request):
+    """Return a ``drive`` callable issuing ``method`` against ``target``."""
+    stub = metrics_pb2_grpc.MetricsServiceStub(grpc.insecure_channel(target))
+    if method == "StreamMetrics":
+        return lambda: sum(_rows(chunk) for chunk in stub.StreamMetrics(request))
+    rpc = getattr(stub, method)
+    return lambda: _rows(rpc(request))
+
+
+def http_call(url: str):
+    """Return a ``drive`` callable fetching a frontend JSON endpoint."""
+
+    def call():
+        with urllib.request.urlopen(url) as response:
+            return len(json.load(response)["data"])
+
+    return call
+
+
+def metrics_request(limit: int = 0, columnar: bool = False, meter_ids=()):
+    return metrics_pb2.MetricsRequest(
+        limit=limit, columnar=columnar, meter_ids=list(meter_ids)
+    )
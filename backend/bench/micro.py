@@ -0,0 +1,131 @@
+import importlib.util
+import json
+import struct
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import metrics_pb2
+
+from server.anomaly import AnomalyDetector
+from server.queries import unpack_columns
+from server.responses import build_response, columns_page_response
+
+from .datagen import iter_rows
+from .results import latency_summary
+
+FRONTEND_SERVER = Path(__file__).resolve().parents[2] / "frontend" / "server.py"
+
+
+def load_frontend():
+    """Import ``frontend/server.py`` under a name that can't clash with ``server``."""
+    spec = importlib.util.spec_from_file_location("frontend_server", FRONTEND_SERVER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(name: str, fn, rows: int, repeat: int) -> dict:
+    """Time ``fn`` ``repeat`` times after one warm-up call."""
+    fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    summary = latency_summary(timings)
+    median = summary["p50_ms"] / 1000
+    return {
+        "name": name,
+        "kind": "micro",
+        "rows": rows,
+        **summary,
+        "rows_per_sec": rows / median if median else None,
+    }
+
+
+def _fixtures(rows: int):
+    readings = [
+        (
+            datetime.fromisoformat(time).replace(tzinfo=timezone.utc),
+            value,
+            meter_id,
+        )
+        for time, value, meter_id in iter_rows(rows, meters=4)
+    ]
+    epoch_rows = [(int(t.timestamp()) * 1_000_000, v, m) for t, v, m in readings]
+    return readings, epoch_rows
+
+
+def copy_binary(epoch_rows, meter_ids) -> bytes:
+    """Encode rows the way ``get_reading_columns`` receives them from COPY."""
+    position = {meter: i for i, meter in enumerate(meter_ids, 1)}
+    if len(meter_ids) == 1:
+        body = b"".join(struct.pack(">hiqid", 2, 8, t, 8, v) for t, v, _ in epoch_rows)
+    else:
+        body = b"".join(
+            struct.pack(">hiqidii", 3, 8, t, 8, v, 4, position[m])
+            for t, v, m in epoch_rows
+        )
+    return b"PGCOPY\n\xff\r\n\x00" + bytes(8) + body + b"\xff\xff"
+
+
+def _binary_columns(data, request):
+    """Decode binary COPY output and build the response, as GetMetrics does."""
+    columns = unpack_columns(data, list(request.meter_ids))
+    return columns_page_response(request, *columns)
+
+
+def run(sizes=(1_000, 10_000, 100_000), repeat: int = 20) -> list[dict]:
+    """Benchmark row→protobuf building, serialization and frontend JSON encoding.
+
+    ``build_points`` is the per-row loop over datetimes, ``build_points_epoch``
+    the same loop over epoch microseconds, ``build_columns`` transposes fetched
+    row tuples and ``binary_columns`` decodes binary COPY output in bulk
+    (decoding included, where the row cases start from already-fetched rows).
+    ``detect_anomalies`` is the gap and spike pass run on every write.
+    """
+    frontend = load_frontend()
+    results = []
+    for rows in sizes:
+        readings, epoch_rows = _fixtures(rows)
+        points = build_response(readings)
+        columns = build_response(epoch_rows, columnar=True)
+        points_bytes = points.SerializeToString()
+        columns_bytes = columns.SerializeToString()
+        decoded = metrics_pb2.MetricsResponse.FromString(columns_bytes)
+        meter_ids = sorted({m for _, _, m in epoch_rows})
+        binary = copy_binary(epoch_rows, meter_ids)
+        columnar = metrics_pb2.MetricsRequest(columnar=True, meter_ids=meter_ids)
+
+        cases = (
+            ("build_points", lambda: build_response(readings)),
+            ("build_points_epoch", lambda: build_response(epoch_rows)),
+            ("build_columns", lambda: build_response(epoch_rows, columnar=True)),
+            ("binary_columns", lambda: _binary_columns(binary, columnar)),
+            ("detect_anomalies", lambda: AnomalyDetector().run(readings)),
+            ("serialize_points", points.SerializeToString),
+            ("serialize_columns", columns.SerializeToString),
+            (
+                "parse_columns",
+                lambda: metrics_pb2.MetricsResponse.FromString(columns_bytes),
+            ),
+            (
+                "frontend_columns_to_json",
+                lambda: json.dumps(
+                    {"data": frontend._columns_to_json_points(decoded.columns, [])}
+                ),
+            ),
+            (
+                "frontend_points_to_json",
+                lambda: json.dumps({"data": frontend._to_json_points(points)}),
+            ),
+        )
+        for name, fn in cases:
+            result = measure(name, fn, rows, repeat)
+            if name.startswith("serialize"):
+                result["bytes"] = len(
+                    points_bytes if name.endswith("points") else columns_bytes
+                )
+            results.append(result)
+    return results
@@ -0,0 +1,59 @@
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    """Summarize per-operation latencies (seconds) in milliseconds."""
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p95_ms": percentile(ordered, 95) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+    }
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(benchmarks: list[dict], output: str | None = None) -> dict:
+    """Wrap results with run metadata and write them as JSON.
+
+    ``output=None`` prints to stdout. The commit hash makes runs on
+    different commits directly comparable.
+    """
+    document = {
+        "commit": _commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "benchmarks": benchmarks,
+    }
+    text = json.dumps(document, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+    return document
@@ -0,0 +1,154 @@
+import bisect
+from concurrent import futures
+from datetime import datetime, timedelta, timezone
+
+import grpc
+import metrics_pb2_grpc
+
+from server import servicer
+from server.anomaly import AnomalyDetector
+from server.cache import PreserializedResponseInterceptor, response_cache
+from server.monitoring import MetricsInterceptor
+from server.servicer import MetricsServicer
+from server.timefmt import EPOCH
+
+from .datagen import iter_rows
+
+
+class StubStore:
+    """In-memory stand-in for the read functions of :mod:`server.orm`.
+
+    Applies the same filters, ordering and keyset semantics to a sorted
+    list, so the servicer, interceptors and serialization can be load-tested
+    without a database.
+    """
+
+    def __init__(self, rows: int, meters: int = 4) -> None:
+        self.rows = [
+            (datetime.fromisoformat(t).replace(tzinfo=timezone.utc), v, m)
+            for t, v, m in iter_rows(rows, meters)
+        ]
+        self.keys = [(t, m) for t, _, m in self.rows]
+        self._anomalies = None
+
+    def _select(self, start, end, meter_ids, after, after_meter, limit, epoch_us):
+        lo = 0
+        if after is not None:
+            position = (after, after_meter) if after_meter else (after, "\uffff")
+            lo = bisect.bisect_right(self.keys, position)
+        if start is not None:
+            lo = max(lo, bisect.bisect_left(self.keys, (start, "")))
+        hi = len(self.keys)
+        if end is not None:
+            hi = bisect.bisect_left(self.keys, (end, ""))
+        meters = set(meter_ids or ())
+        emitted = 0
+        for t, v, m in self.rows[lo:hi]:
+            if meters and m not in meters:
+                continue
+            if limit and emitted >= limit:
+                return
+            emitted += 1
+            if epoch_us:
+                t = (t - EPOCH) // timedelta(microseconds=1)
+            yield t, v, m
+
+    def get_readings(
+        self,
+        start=None,
+        end=None,
+        meter_ids=None,
+        after=None,
+        after_meter=None,
+        limit=None,
+        epoch_us=False,
+    ):
+        return list(
+            self._select(start, end, meter_ids, after, after_meter, limit, epoch_us)
+        )
+
+    def get_reading_columns(
+        self, meter_ids, start=None, end=None, after=None, after_meter=None, limit=None
+    ):
+        rows = list(
+            self._select(start, end, meter_ids, after, after_meter, limit, True)
+        )
+        times, values, meters = map(list, zip(*rows)) if rows else ([], [], [])
+        return times, values, meters if len(meter_ids) > 1 else None
+
+    def iter_readings(
+        self,
+        start=None,
+        end=None,
+        meter_ids=None,
+        after=None,
+        after_meter=None,
+        limit=None,
+        epoch_us=False,
+        itersize=None,
+    ):
+        return self._select(start, end, meter_ids, after, after_meter, limit, epoch_us)
+
+    def get_summary(self, start=None, end=None, meter_ids=None):
+        # Scans the readings; the server combines per-day rollups instead.
+        summaries = {}
+        for t, v, m in self._select(start, end, meter_ids, None, None, None, False):
+            total, count, low, high, peak = summaries.get(m, (0.0, 0, v, v, t))
+            if v > high:
+                peak = t
+            summaries[m] = (total + v, count + 1, min(low, v), max(high, v), peak)
+        return [(m, *summary) for m, summary in sorted(summaries.items())]
+
+    def get_anomalies(
+        self, start=None, end=None, meter_ids=None, kinds=None, limit=None
+    ):
+        # Detected once over all rows; the server flags them as rows are written.
+        if self._anomalies is None:
+            self._anomalies = sorted(
+                AnomalyDetector().run(self.rows), key=lambda a: (a[2], a[0], a[1])
+            )
+        meters = set(meter_ids or ())
+        selected = [
+            a
+            for a in self._anomalies
+            if (start is None or a[3] > start)
+            and (end is None or a[2] < end)
+            and (not meters or a[0] in meters)
+            and (not kinds or a[1] in kinds)
+        ]
+        return selected[:limit] if limit else selected
+
+    def list_meters(self):
+        return sorted({m for _, _, m in self.rows})
+
+    def data_version(self):
+        # The stub is never written to.
+        return "stub-%d" % len(self.rows)
+
+
+def start_stub_server(rows: int, workers: int = 10, cache: bool = False):
+    """Serve MetricsServicer over ``rows`` in-memory readings on a free port.
+
+    The response cache is disabled unless ``cache`` is set, so repeated
+    identical requests measure the build path. Returns ``(server, port)``.
+    """
+    store = StubStore(rows)
+    servicer.get_readings = store.get_readings
+    servicer.get_reading_columns = store.get_reading_columns
+    servicer.iter_readings = store.iter_readings
+    servicer.get_summary = store.get_summary
+    servicer.get_anomalies = store.get_anomalies
+    servicer.list_meters = store.list_meters
+    servicer.data_version = store.data_version
+    if not cache:
+        response_cache.max_bytes = 0
+    response_cache.clear()
+
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=workers),
+        interceptors=[MetricsInterceptor(), PreserializedResponseInterceptor()],
+    )
+    metrics_pb2_grpc.add_MetricsServiceServicer_to_server(MetricsServicer(), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    return server, port
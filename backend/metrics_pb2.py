@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: metrics.proto
+# Protobuf Python Version: 7.35.1
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    7,
+    35,
+    1,
+    '',
+    'metrics.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+from google.protobuf import duration_pb2 as google_dot_protobuf_dot_duration__pb2
+from google.protobuf import timestamp_pb2 as google_dot_protobuf_dot_timestamp__pb2
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rmetrics.proto\x12\x07metrics\x1a\x1egoogle/protobuf/duration.proto\x1a\x1fgoogle/protobuf/timestamp.proto\"\xac\x01\n\x0eMetricsRequest\x12)\n\x05start\x18\x01 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\'\n\x03\x65nd\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\r\n\x05limit\x18\x03 \x01(\r\x12\x12\n\npage_token\x18\x04 \x01(\t\x12\x10\n\x08\x63olumnar\x18\x05 \x01(\x08\x12\x11\n\tmeter_ids\x18\x06 \x03(\t\"\xf6\x01\n\x10\x41ggregateRequest\x12)\n\x05start\x18\x01 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\'\n\x03\x65nd\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\x31\n\x0c\x62ucket_width\x18\x03 \x01(\x0b\x32\x19.google.protobuf.DurationH\x00\x12\x17\n\rbucket_months\x18\x04 \x01(\rH\x00\x12%\n\taggregate\x18\x05 \x01(\x0e\x32\x12.metrics.Aggregate\x12\x11\n\tmeter_ids\x18\x06 \x03(\tB\x08\n\x06\x62ucket\"A\n\x0bMetricPoint\x12\x0c\n\x04time\x18\x01 \x01(\t\x12\x12\n\nmeterusage\x18\x02 \x01(\x01\x12\x10\n\x08meter_id\x18\x03 \x01(\t\"K\n\rMetricColumns\x12\x14\n\x0ctime_unix_ms\x18\x01 \x03(\x03\x12\x12\n\nmeterusage\x18\x02 \x03(\x01\x12\x10\n\x08meter_id\x18\x03 \x03(\t\"w\n\x0fMetricsResponse\x12\"\n\x04\x64\x61ta\x18\x01 \x03(\x0b\x32\x14.metrics.MetricPoint\x12\x17\n\x0fnext_page_token\x18\x02 \x01(\t\x12\'\n\x07\x63olumns\x18\x03 \x01(\x0b\x32\x16.metrics.MetricColumns\"3\n\rIngestRequest\x12\"\n\x04\x64\x61ta\x18\x01 \x03(\x0b\x32\x14.metrics.MetricPoint\"4\n\x0eIngestResponse\x12\x10\n\x08\x61\x63\x63\x65pted\x18\x01 \x01(\x04\x12\x10\n\x08rejected\x18\x02 \x01(\x04\"\x13\n\x11ListMetersRequest\"\'\n\x12ListMetersResponse\x12\x11\n\tmeter_ids\x18\x01 \x03(\t\"\x14\n\x12\x44\x61taVersionRequest\"&\n\x13\x44\x61taVersionResponse\x12\x0f\n\x07version\x18\x01 \x01(\t\"w\n\x0eSummaryRequest\x12)\n\x05start\x18\x01 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\'\n\x03\x65nd\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\x11\n\tmeter_ids\x18\x03 \x03(\t\"\x84\x01\n\x0cMeterSummary\x12\x10\n\x08meter_id\x18\x01 \x01(\t\x12\r\n\x05total\x18\x02 \x01(\x01\x12\x10\n\x08readings\x18\x03 \x01(\x04\x12\x0c\n\x04mean\x18\x04 \x01(\x01\x12\x0f\n\x07minimum\x18\x05 \x01(\x01\x12\x0f\n\x07maximum\x18\x06 \x01(\x01\x12\x11\n\tpeak_time\x18\x07 \x01(\t\";\n\x0fSummaryResponse\x12(\n\tsummaries\x18\x01 \x03(\x0b\x32\x15.metrics.MeterSummary\"\xad\x01\n\x10\x41nomaliesRequest\x12)\n\x05start\x18\x01 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\'\n\x03\x65nd\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\x11\n\tmeter_ids\x18\x03 \x03(\t\x12#\n\x05kinds\x18\x04 \x03(\x0e\x32\x14.metrics.AnomalyKind\x12\r\n\x05limit\x18\x05 \x01(\r\"y\n\x07\x41nomaly\x12\x10\n\x08meter_id\x18\x01 \x01(\t\x12\"\n\x04kind\x18\x02 \x01(\x0e\x32\x14.metrics.AnomalyKind\x12\r\n\x05start\x18\x03 \x01(\t\x12\x0b\n\x03\x65nd\x18\x04 \x01(\t\x12\r\n\x05value\x18\x05 \x01(\x01\x12\r\n\x05score\x18\x06 \x01(\x01\"8\n\x11\x41nomaliesResponse\x12#\n\tanomalies\x18\x01 \x03(\x0b\x32\x10.metrics.Anomaly*D\n\tAggregate\x12\x07\n\x03\x41VG\x10\x00\x12\x07\n\x03MIN\x10\x01\x12\x07\n\x03MAX\x10\x02\x12\x07\n\x03SUM\x10\x03\x12\t\n\x05\x43OUNT\x10\x04\x12\x08\n\x04LAST\x10\x05*!\n\x0b\x41nomalyKind\x12\x07\n\x03GAP\x10\x00\x12\t\n\x05SPIKE\x10\x01\x32\xc0\x04\n\x0eMetricsService\x12?\n\nGetMetrics\x12\x17.metrics.MetricsRequest\x1a\x18.metrics.MetricsResponse\x12\x44\n\rStreamMetrics\x12\x17.metrics.MetricsRequest\x1a\x18.metrics.MetricsResponse0\x01\x12G\n\x10\x41ggregateMetrics\x12\x19.metrics.AggregateRequest\x1a\x18.metrics.MetricsResponse\x12\x42\n\rIngestMetrics\x12\x16.metrics.IngestRequest\x1a\x17.metrics.IngestResponse(\x01\x12\x45\n\nListMeters\x12\x1a.metrics.ListMetersRequest\x1a\x1b.metrics.ListMetersResponse\x12K\n\x0eGetDataVersion\x12\x1b.metrics.DataVersionRequest\x1a\x1c.metrics.DataVersionResponse\x12?\n\nGetSummary\x12\x17.metrics.SummaryRequest\x1a\x18.metrics.SummaryResponse\x12\x45\n\x0cGetAnomalies\x12\x19.metrics.AnomaliesRequest\x1a\x1a.metrics.AnomaliesResponseb\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'metrics_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_AGGREGATE']._serialized_start=1685
+  _globals['_AGGREGATE']._serialized_end=1753
+  _globals['_ANOMALYKIND']._serialized_start=1755
+  _globals['_ANOMALYKIND']._serialized_end=1788
+  _globals['_METRICSREQUEST']._serialized_start=92
+  _globals['_METRICSREQUEST']._serialized_end=264
+  _globals['_AGGREGATEREQUEST']._serialized_start=267
+  _globals['_AGGREGATEREQUEST']._serialized_end=513
+  _globals['_METRICPOINT']._serialized_start=515
+  _globals['_METRICPOINT']._serialized_end=580
+  _globals['_METRICCOLUMNS']._serialized_start=582
+  _globals['_METRICCOLUMNS']._serialized_end=657
+  _globals['_METRICSRESPONSE']._serialized_start=659
+  _globals['_METRICSRESPONSE']._serialized_end=778
+  _globals['_INGESTREQUEST']._serialized_start=780
+  _globals['_INGESTREQUEST']._serialized_end=831
+  _globals['_INGESTRESPONSE']._serialized_start=833
+  _globals['_INGESTRESPONSE']._serialized_end=885
+  _globals['_LISTMETERSREQUEST']._serialized_start=887
+  _globals['_LISTMETERSREQUEST']._serialized_end=906
+  _globals['_LISTMETERSRESPONSE']._serialized_start=908
+  _globals['_LISTMETERSRESPONSE']._serialized_end=947
+  _globals['_DATAVERSIONREQUEST']._serialized_start=949
+  _globals['_DATAVERSIONREQUEST']._serialized_end=969
+  _globals['_DATAVERSIONRESPONSE']._serialized_start=971
+  _globals['_DATAVERSIONRESPONSE']._serialized_end=1009
+  _globals['_SUMMARYREQUEST']._serialized_start=1011
+  _globals['_SUMMARYREQUEST']._serialized_end=1130
+  _globals['_METERSUMMARY']._serialized_start=1133
+  _globals['_METERSUMMARY']._serialized_end=1265
+  _globals['_SUMMARYRESPONSE']._serialized_start=1267
+  _globals['_SUMMARYRESPONSE']._serialized_end=1326
+  _globals['_ANOMALIESREQUEST']._serialized_start=1329
+  _globals['_ANOMALIESREQUEST']._serialized_end=1502
+  _globals['_ANOMALY']._serialized_start=1504
+  _globals['_ANOMALY']._serialized_end=1625
+  _globals['_ANOMALIESRESPONSE']._serialized_start=1627
+  _globals['_ANOMALIESRESPONSE']._serialized_end=1683
+  _globals['_METRICSSERVICE']._serialized_start=1791
+  _globals['_METRICSSERVICE']._serialized_end=2367
+# @@protoc_insertion_point(module_scope)
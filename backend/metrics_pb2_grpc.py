@@ -0,0 +1,406 @@
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+import warnings
+
+import metrics_pb2 as metrics__pb2
+
+GRPC_GENERATED_VERSION = '1.84.0'
+GRPC_VERSION = grpc.__version__
+_version_not_supported = False
+
+try:
+    from grpc._utilities import first_version_is_lower
+    _version_not_supported = first_version_is_lower(GRPC_VERSION, GRPC_GENERATED_VERSION)
+except ImportError:
+    _version_not_supported = True
+
+if _version_not_supported:
+    raise RuntimeError(
+        f'The grpc package installed is at version {GRPC_VERSION},'
+        + ' but the generated code in metrics_pb2_grpc.py depends on'
+        + f' grpcio>={GRPC_GENERATED_VERSION}.'
+        + f' Please upgrade your grpc module to grpcio>={GRPC_GENERATED_VERSION}'
+        + f' or downgrade your generated code using grpcio-tools<={GRPC_VERSION}.'
+    )
+
+
+class MetricsServiceStub:
+    """Missing associated documentation comment in .proto file."""
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.GetMetrics = channel.unary_unary(
+                '/metrics.MetricsService/GetMetrics',
+                request_serializer=metrics__pb2.MetricsRequest.SerializeToString,
+                response_deserializer=metrics__pb2.MetricsResponse.FromString,
+                _registered_method=True)
+        self.StreamMetrics = channel.unary_stream(
+                '/metrics.MetricsService/StreamMetrics',
+                request_serializer=metrics__pb2.MetricsRequest.SerializeToString,
+                response_deserializer=metrics__pb2.MetricsResponse.FromString,
+                _registered_method=True)
+        self.AggregateMetrics = channel.unary_unary(
+                '/metrics.MetricsService/AggregateMetrics',
+                request_serializer=metrics__pb2.AggregateRequest.SerializeToString,
+                response_deserializer=metrics__pb2.MetricsResponse.FromString,
+                _registered_method=True)
+        self.IngestMetrics = channel.stream_unary(
+                '/metrics.MetricsService/IngestMetrics',
+                request_serializer=metrics__pb2.IngestRequest.SerializeToString,
+                response_deserializer=metrics__pb2.IngestResponse.FromString,
+                _registered_method=True)
+        self.ListMeters = channel.unary_unary(
+                '/metrics.MetricsService/ListMeters',
+                request_serializer=metrics__pb2.ListMetersRequest.SerializeToString,
+                response_deserializer=metrics__pb2.ListMetersResponse.FromString,
+                _registered_method=True)
+        self.GetDataVersion = channel.unary_unary(
+                '/metrics.MetricsService/GetDataVersion',
+                request_serializer=metrics__pb2.DataVersionRequest.SerializeToString,
+                response_deserializer=metrics__pb2.DataVersionResponse.FromString,
+                _registered_method=True)
+        self.GetSummary = channel.unary_unary(
+                '/metrics.MetricsService/GetSummary',
+                request_serializer=metrics__pb2.SummaryRequest.SerializeToString,
+                response_deserializer=metrics__pb2.SummaryResponse.FromString,
+                _registered_method=True)
+        self.GetAnomalies = channel.unary_unary(
+                '/metrics.MetricsService/GetAnomalies',
+                request_serializer=metrics__pb2.AnomaliesRequest.SerializeToString,
+                response_deserializer=metrics__pb2.AnomaliesResponse.FromString,
+                _registered_method=True)
+
+
+class MetricsServiceServicer:
+    """Missing associated documentation comment in .proto file."""
+
+    def GetMetrics(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamMetrics(self, request, context):
+        """Same data as GetMetrics, delivered as a sequence of bounded chunks.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def AggregateMetrics(self, request, context):
+        """Downsampled readings: one point per time bucket, computed in the database.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def IngestMetrics(self, request_iterator, context):
+        """Client-streaming ingest of live readings from field gateways.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ListMeters(self, request, context):
+        """Distinct meter ids present in the database.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetDataVersion(self, request, context):
+        """Opaque version of the stored readings; changes whenever data is written.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetSummary(self, request, context):
+        """Total, mean, extremes and peak reading per meter over a time window,
+        combined from per-day partial aggregates.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetAnomalies(self, request, context):
+        """Gaps and spikes flagged as readings were written, ordered by start time.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_MetricsServiceServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'GetMetrics': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetMetrics,
+                    request_deserializer=metrics__pb2.MetricsRequest.FromString,
+                    response_serializer=metrics__pb2.MetricsResponse.SerializeToString,
+            ),
+            'StreamMetrics': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamMetrics,
+                    request_deserializer=metrics__pb2.MetricsRequest.FromString,
+                    response_serializer=metrics__pb2.MetricsResponse.SerializeToString,
+            ),
+            'AggregateMetrics': grpc.unary_unary_rpc_method_handler(
+                    servicer.AggregateMetrics,
+                    request_deserializer=metrics__pb2.AggregateRequest.FromString,
+                    response_serializer=metrics__pb2.MetricsResponse.SerializeToString,
+            ),
+            'IngestMetrics': grpc.stream_unary_rpc_method_handler(
+                    servicer.IngestMetrics,
+                    request_deserializer=metrics__pb2.IngestRequest.FromString,
+                    response_serializer=metrics__pb2.IngestResponse.SerializeToString,
+            ),
+            'ListMeters': grpc.unary_unary_rpc_method_handler(
+                    servicer.ListMeters,
+                    request_deserializer=metrics__pb2.ListMetersRequest.FromString,
+                    response_serializer=metrics__pb2.ListMetersResponse.SerializeToString,
+            ),
+            'GetDataVersion': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetDataVersion,
+                    request_deserializer=metrics__pb2.DataVersionRequest.FromString,
+                    response_serializer=metrics__pb2.DataVersionResponse.SerializeToString,
+            ),
+            'GetSummary': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetSummary,
+                    request_deserializer=metrics__pb2.SummaryRequest.FromString,
+                    response_serializer=metrics__pb2.SummaryResponse.SerializeToString,
+            ),
+            'GetAnomalies': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetAnomalies,
+                    request_deserializer=metrics__pb2.AnomaliesRequest.FromString,
+                    response_serializer=metrics__pb2.AnomaliesResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'metrics.MetricsService', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('metrics.MetricsService', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class MetricsService:
+    """Missing associated documentation comment in .proto file."""
+
+    @staticmethod
+    def GetMetrics(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/metrics.MetricsService/GetMetrics',
+            metrics__pb2.MetricsRequest.SerializeToString,
+            metrics__pb2.MetricsResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def StreamMetrics(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/metrics.MetricsService/StreamMetrics',
+            metrics__pb2.MetricsRequest.SerializeToString,
+            metrics__pb2.MetricsResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def AggregateMetrics(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/metrics.MetricsService/AggregateMetrics',
+            metrics__pb2.AggregateRequest.SerializeToString,
+            metrics__pb2.MetricsResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def IngestMetrics(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/metrics.MetricsService/IngestMetrics',
+            metrics__pb2.IngestRequest.SerializeToString,
+            metrics__pb2.IngestResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ListMeters(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/metrics.MetricsService/ListMeters',
+            metrics__pb2.ListMetersRequest.SerializeToString,
+            metrics__pb2.ListMetersResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetDataVersion(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/metrics.MetricsService/GetDataVersion',
+            metrics__pb2.DataVersionRequest.SerializeToString,
+            metrics__pb2.DataVersionResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetSummary(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/metrics.MetricsService/GetSummary',
+            metrics__pb2.SummaryRequest.SerializeToString,
+            metrics__pb2.SummaryResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetAnomalies(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/metrics.MetricsService/GetAnomalies',
+            metrics__pb2.AnomaliesRequest.SerializeToString,
+            metrics__pb2.AnomaliesResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -1,33 +1,107 @@
+import asyncio
 import logging
+import threading
 from concurrent import futures
 
 import grpc
 import metrics_pb2_grpc
 
+from . import aio_db
+from .aio_servicer import AsyncMetricsServicer
+from .cache import (
+    AsyncPreserializedResponseInterceptor,
+    PreserializedResponseInterceptor,
+)
 from .db import close_pool, init_pool, wait_for_db
-from .orm import setup_db
+from .monitoring import AsyncMetricsInterceptor, MetricsInterceptor
+from .orm import seed_db, setup_db
 from .servicer import MetricsServicer
-from .settings import GRPC_PORT, GRPC_WORKERS
+from .settings import GRPC_ASYNC, GRPC_PORT, GRPC_WORKERS, METRICS_PORT
+from .telemetry import start_http_server
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 log = logging.getLogger(__name__)
 
+# Accept the frontend's keepalive pings (GRPC_KEEPALIVE_SECONDS, 30 s by
+# default) even between calls; by default gRPC answers pings more frequent
+# than every 5 minutes on an idle connection with GOAWAY.
+SERVER_OPTIONS = (
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.min_recv_ping_interval_without_data_ms", 10_000),
+)
+
+
+def _run_seed(adopt: bool) -> None:
+    try:
+        seed_db(adopt)
+    except Exception:
+        log.exception("Seeding failed; serving the data loaded so far.")
+
 
 def serve() -> None:
     wait_for_db()
     init_pool()
-    setup_db()
+    adopt = setup_db()
 
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=GRPC_WORKERS))
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=GRPC_WORKERS),
+        interceptors=[MetricsInterceptor(), PreserializedResponseInterceptor()],
+        options=SERVER_OPTIONS,
+    )
     metrics_pb2_grpc.add_MetricsServiceServicer_to_server(MetricsServicer(), server)
     server.add_insecure_port(f"[::]:{GRPC_PORT}")
     server.start()
     log.info("gRPC server listening on port %d", GRPC_PORT)
+    # Load the CSV while already serving; each batch is visible once committed.
+    threading.Thread(target=_run_seed, args=(adopt,), name="seed", daemon=True).start()
     try:
         server.wait_for_termination()
     finally:
         close_pool()
 
 
+async def serve_async() -> None:
+    """Run the grpc.aio server; seeding runs on the sync pool in a worker thread."""
+    wait_for_db()
+    init_pool()
+    try:
+        adopt = setup_db()
+    except BaseException:
+        close_pool()
+        raise
+
+    def seed():
+        try:
+            _run_seed(adopt)
+        finally:
+            close_pool()
+
+    await aio_db.init_pool()
+    server = grpc.aio.server(
+        interceptors=[
+            AsyncMetricsInterceptor(),
+            AsyncPreserializedResponseInterceptor(),
+        ],
+        options=SERVER_OPTIONS,
+    )
+    metrics_pb2_grpc.add_MetricsServiceServicer_to_server(
+        AsyncMetricsServicer(), server
+    )
+    server.add_insecure_port(f"[::]:{GRPC_PORT}")
+    await server.start()
+    log.info("gRPC asyncio server listening on port %d", GRPC_PORT)
+    threading.Thread(target=seed, name="seed", daemon=True).start()
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(None)
+        await aio_db.close_pool()
+
+
 if __name__ == "__main__":
-    serve()
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+    if GRPC_ASYNC:
+        asyncio.run(serve_async())
+    else:
+        serve()
@@ -0,0 +1,178 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+from .db import REPLICA_LAG_SQL, ReplicaRouter, replica_address
+from .settings import (
+    DB_HOST,
+    DB_NAME,
+    DB_PASS,
+    DB_POOL_ACQUIRE_TIMEOUT,
+    DB_POOL_MAX_AGE_SECONDS,
+    DB_POOL_MAX_CONN,
+    DB_POOL_MIN_CONN,
+    DB_POOL_PRE_PING,
+    DB_PORT,
+    DB_REPLICA_HOSTS,
+    DB_USER,
+)
+from .telemetry import Gauge, Histogram, observe_stage, register
+
+log = logging.getLogger(__name__)
+
+_pool: AsyncConnectionPool | None = None
+_replicas: list[AsyncConnectionPool] = []
+_router = ReplicaRouter(0)
+
+
+def _stat(name: str) -> int:
+    pools = ([_pool] if _pool else []) + _replicas
+    return sum(p.get_stats().get(name, 0) for p in pools)
+
+
+ACQUIRE_SECONDS = register(
+    Histogram(
+        "db_async_pool_acquire_seconds",
+        "Time spent waiting for an async DB connection.",
+    )
+)
+register(
+    Gauge(
+        "db_async_pool_connections_in_use",
+        "Async DB connections currently checked out.",
+        lambda: _stat("pool_size") - _stat("pool_available"),
+    )
+)
+register(
+    Gauge(
+        "db_async_pool_connections_idle",
+        "Open async DB connections waiting in the pool.",
+        lambda: _stat("pool_available"),
+    )
+)
+register(
+    Gauge(
+        "db_async_pool_waiters",
+        "Coroutines queued for an async DB connection.",
+        lambda: _stat("requests_waiting"),
+    )
+)
+
+
+def _observe_acquire(seconds: float) -> None:
+    ACQUIRE_SECONDS.observe(seconds)
+    observe_stage("acquire", seconds)
+
+
+def _make_pool(host: str, port: str, min_size: int) -> AsyncConnectionPool:
+    conninfo = make_conninfo(
+        host=host, port=port, dbname=DB_NAME, user=DB_USER, password=DB_PASS
+    )
+    return AsyncConnectionPool(
+        conninfo,
+        min_size=min_size,
+        max_size=DB_POOL_MAX_CONN,
+        timeout=DB_POOL_ACQUIRE_TIMEOUT,
+        max_lifetime=DB_POOL_MAX_AGE_SECONDS or float("inf"),
+        check=AsyncConnectionPool.check_connection if DB_POOL_PRE_PING else None,
+        open=False,
+    )
+
+
+async def init_pool() -> None:
+    global _pool, _replicas, _router
+    if _pool is not None:
+        return
+    _pool = _make_pool(DB_HOST, DB_PORT, DB_POOL_MIN_CONN)
+    await _pool.open(wait=True)
+    _replicas = [
+        _make_pool(*replica_address(entry), min_size=0) for entry in DB_REPLICA_HOSTS
+    ]
+    for replica in _replicas:
+        await replica.open()
+    _router = ReplicaRouter(len(_replicas))
+    log.info(
+        "Initialized async DB connection pool (min=%d, max=%d, replicas=%d).",
+        DB_POOL_MIN_CONN,
+        DB_POOL_MAX_CONN,
+        len(_replicas),
+    )
+
+
+async def close_pool() -> None:
+    global _pool, _replicas
+    if _pool is not None:
+        for replica in _replicas:
+            await replica.close()
+        _replicas = []
+        await _pool.close()
+        _pool = None
+        log.info("Closed async DB connection pool.")
+
+
+@asynccontextmanager
+async def connection():
+    """Borrow a connection for an ``async with`` block.
+
+    The block runs in a transaction that is committed on success and rolled
+    back on error; the connection returns to the pool afterwards. Callers
+    beyond ``DB_POOL_MAX_CONN`` wait on the pool (up to
+    ``DB_POOL_ACQUIRE_TIMEOUT``) instead of holding a thread.
+    """
+    if _pool is None:
+        raise RuntimeError("Async DB pool is not initialized.")
+    started = time.monotonic()
+    async with _pool.connection() as conn:
+        _observe_acquire(time.monotonic() - started)
+        yield conn
+
+
+async def _replica_lag(conn) -> float | None:
+    try:
+        cur = await conn.execute(REPLICA_LAG_SQL)
+        lag = (await cur.fetchone())[0]
+        await conn.rollback()
+        return lag
+    except psycopg.Error as exc:
+        log.warning("Replica lag check failed: %s", exc)
+        return None
+
+
+@asynccontextmanager
+async def read_connection():
+    """Borrow a connection for read-only queries.
+
+    Async counterpart of :func:`server.db.get_read_conn`: replicas are tried
+    round-robin and the primary serves the read when none is within
+    ``DB_REPLICA_MAX_LAG_SECONDS``.
+    """
+    if _pool is None:
+        raise RuntimeError("Async DB pool is not initialized.")
+    for index in _router.order():
+        probe = _router.claim_probe(index)
+        if not probe and not _router.healthy(index):
+            continue
+        replica = _replicas[index]
+        started = time.monotonic()
+        try:
+            conn = await replica.getconn()
+        except (PoolTimeout, psycopg.Error) as exc:
+            log.warning("Replica %d unavailable: %s", index, exc)
+            _router.record(index, None)
+            continue
+        _observe_acquire(time.monotonic() - started)
+        if probe and not _router.record(index, await _replica_lag(conn)):
+            await replica.putconn(conn)
+            continue
+        try:
+            yield conn
+        finally:
+            await replica.putconn(conn)
+        return
+
+    async with connection() as conn:
+        yield conn
@@ -0,0 +1,233 @@
+import io
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+
+from .aio_db import connection, read_connection
+from .anomaly import AnomalyDetector
+from .cache import response_cache
+from .queries import (
+    BUMP_VERSION_SQL,
+    CREATE_STAGING_SQL,
+    DATA_VERSION_SQL,
+    DELETE_ANOMALIES_SQL,
+    INSERT_ANOMALY_SQL,
+    LIST_METERS_SQL,
+    LOCK_ANOMALY_STATE_SQL,
+    LOCK_METERS_SQL,
+    MERGE_STAGING_SQL,
+    RESCAN_PAGE_SQL,
+    SAVE_ANOMALY_STATE_SQL,
+    WINDOW_BEFORE_SQL,
+    Rescan,
+    aggregate_query,
+    anomalies_query,
+    anomaly_readings,
+    as_utc,
+    columns_query,
+    format_version,
+    late_spans,
+    readings_query,
+    summary_query,
+    unpack_columns,
+)
+from .settings import ANOMALY_DETECTION, ANOMALY_WINDOW, STREAM_ITERSIZE
+from .telemetry import stage
+
+# SQL comes from server.queries, like the threaded server's; only the driver
+# calls differ. Schema setup and seeding stay synchronous (run at startup).
+
+
+async def get_readings(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+    after: datetime | None = None,
+    after_meter: str | None = None,
+    limit: int | None = None,
+    epoch_us: bool = False,
+) -> list[tuple]:
+    """Async version of :func:`server.orm.get_readings`."""
+    sql, params = readings_query(
+        start, end, meter_ids, after, after_meter, limit, epoch_us
+    )
+    async with read_connection() as conn:
+        with stage("execute"):
+            cur = await conn.execute(sql, params)
+        with stage("fetch"):
+            return await cur.fetchall()
+
+
+async def get_reading_columns(
+    meter_ids: list[str],
+    start: datetime | None = None,
+    end: datetime | None = None,
+    after: datetime | None = None,
+    after_meter: str | None = None,
+    limit: int | None = None,
+) -> tuple[list, list, list | None]:
+    """Async version of :func:`server.orm.get_reading_columns`."""
+    sql, params = columns_query(meter_ids, start, end, after, after_meter, limit)
+    buffer = io.BytesIO()
+    async with read_connection() as conn:
+        async with conn.cursor() as cur:
+            with stage("fetch"):
+                # psycopg binds COPY parameters client-side.
+                async with cur.copy(
+                    f"COPY ({sql}) TO STDOUT WITH (FORMAT binary)", params
+                ) as copy:
+                    async for data in copy:
+                        buffer.write(data)
+    with stage("decode"):
+        return unpack_columns(buffer.getbuffer(), meter_ids)
+
+
+async def iter_readings(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+    after: datetime | None = None,
+    after_meter: str | None = None,
+    limit: int | None = None,
+    epoch_us: bool = False,
+    itersize: int = STREAM_ITERSIZE,
+) -> AsyncIterator[tuple]:
+    """Async version of :func:`server.orm.iter_readings`.
+
+    Rows come from a server-side cursor ``itersize`` at a time; the
+    connection is held until the iterator is exhausted or closed.
+    """
+    sql, params = readings_query(
+        start, end, meter_ids, after, after_meter, limit, epoch_us
+    )
+    async with read_connection() as conn:
+        async with conn.cursor(name="meter_readings_stream") as cur:
+            cur.itersize = itersize
+            with stage("execute"):
+                await cur.execute(sql, params)
+            async for row in cur:
+                yield row
+
+
+async def list_meters() -> list[str]:
+    """Async version of :func:`server.orm.list_meters`."""
+    async with read_connection() as conn:
+        with stage("execute"):
+            cur = await conn.execute(LIST_METERS_SQL)
+        with stage("fetch"):
+            return [row[0] for row in await cur.fetchall()]
+
+
+async def data_version() -> str:
+    """Async version of :func:`server.orm.data_version`."""
+    async with read_connection() as conn:
+        with stage("execute"):
+            cur = await conn.execute(DATA_VERSION_SQL)
+        return format_version(await cur.fetchone())
+
+
+async def aggregate_readings(
+    aggregate: str = "avg",
+    bucket_width: timedelta | None = None,
+    bucket_months: int = 0,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+) -> list[tuple]:
+    """Async version of :func:`server.orm.aggregate_readings`.
+
+    Raises ValueError for an unknown aggregate or a non-positive bucket.
+    """
+    sql, params = aggregate_query(
+        aggregate, bucket_width, bucket_months, start, end, meter_ids
+    )
+    async with read_connection() as conn:
+        with stage("execute"):
+            cur = await conn.execute(sql, params)
+        with stage("fetch"):
+            return await cur.fetchall()
+
+
+async def get_summary(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+) -> list[tuple]:
+    """Async version of :func:`server.orm.get_summary`."""
+    sql, params = summary_query(start, end, meter_ids)
+    async with read_connection() as conn:
+        with stage("execute"):
+            cur = await conn.execute(sql, params)
+        with stage("fetch"):
+            return await cur.fetchall()
+
+
+async def get_anomalies(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+    kinds: list[str] | None = None,
+    limit: int | None = None,
+) -> list[tuple]:
+    """Async version of :func:`server.orm.get_anomalies`."""
+    sql, params = anomalies_query(start, end, meter_ids, kinds, limit)
+    async with read_connection() as conn:
+        with stage("execute"):
+            cur = await conn.execute(sql, params)
+        with stage("fetch"):
+            return await cur.fetchall()
+
+
+async def _rescan(cur, meter_id: str, first: datetime, last: datetime, end) -> Rescan:
+    """Async version of :func:`server.orm._rescan`."""
+    await cur.execute(WINDOW_BEFORE_SQL, (meter_id, first, ANOMALY_WINDOW))
+    rescan = Rescan(meter_id, last, end, await cur.fetchall())
+    while True:
+        await cur.execute(
+            RESCAN_PAGE_SQL, (meter_id, rescan.until, end, STREAM_ITERSIZE)
+        )
+        if rescan.feed(await cur.fetchall()):
+            break
+    await cur.execute(DELETE_ANOMALIES_SQL, (meter_id, rescan.after, rescan.until))
+    if rescan.flagged:
+        await cur.executemany(INSERT_ANOMALY_SQL, rescan.flagged)
+    return rescan
+
+
+async def _detect_anomalies(cur, rows) -> None:
+    """Async version of :func:`server.orm._detect_anomalies`."""
+    readings, meters = anomaly_readings(rows)
+    with stage("detect"):
+        await cur.execute(LOCK_METERS_SQL, (meters,))
+        await cur.execute(LOCK_ANOMALY_STATE_SQL, (meters,))
+        states = {state[0]: state for state in await cur.fetchall()}
+        for meter_id, first, last in late_spans(readings, states):
+            rescan = await _rescan(cur, meter_id, first, last, states[meter_id][1])
+            states[meter_id] = rescan.state() or states[meter_id]
+        detector = AnomalyDetector(states.values())
+        flagged = detector.run(readings)
+        if flagged:
+            await cur.executemany(INSERT_ANOMALY_SQL, flagged)
+        await cur.executemany(SAVE_ANOMALY_STATE_SQL, detector.states())
+
+
+async def insert_readings(rows) -> int:
+    """Async version of :func:`server.orm.insert_readings`."""
+    count = 0
+    async with connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(CREATE_STAGING_SQL)
+            async with cur.copy(
+                "COPY meter_readings_staging (time, meterusage, meter_id) FROM STDIN;"
+            ) as copy:
+                for row in rows:
+                    await copy.write_row(row)
+                    count += 1
+            if count:
+                await cur.execute(MERGE_STAGING_SQL)
+                if ANOMALY_DETECTION:
+                    await _detect_anomalies(cur, rows)
+                await cur.execute(BUMP_VERSION_SQL)
+    if count:
+        times = [as_utc(row[0]) for row in rows]
+        response_cache.invalidate(min(times), max(times), {row[2] for row in rows})
+    return count
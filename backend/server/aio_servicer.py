@@ -0,0 +1,151 @@
+import logging
+
+import grpc
+import metrics_pb2_grpc
+
+from . import aio_orm
+from .cache import cache_key, response_cache
+from .ingest import AsyncIngestBuffer
+from .responses import (
+    DataVersionResponse,
+    IngestResponse,
+    ListMetersResponse,
+    aggregate_filters,
+    aggregate_response,
+    anomalies_response,
+    anomaly_filters,
+    anomaly_scope,
+    build_response,
+    cache_lookup,
+    cache_store,
+    columns_page_response,
+    flight_result,
+    page_response,
+    parse_read_filters,
+    request_selection,
+    summary_response,
+    time_format,
+)
+from .settings import STREAM_CHUNK_SIZE
+from .singleflight import aio_flight
+
+log = logging.getLogger(__name__)
+
+
+async def _read_filters(request, context) -> dict:
+    try:
+        return parse_read_filters(request)
+    except ValueError as exc:
+        await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(exc))
+
+
+async def _cached(context, key: tuple, selection: dict, build):
+    """Async version of :func:`server.servicer._cached`; ``build`` is awaited."""
+    if (data := cache_lookup(context, key)) is not None:
+        return data
+
+    async def miss():
+        generation = response_cache.generation()
+        response = await build()
+        return response, cache_store(key, selection, response, generation)
+
+    (response, data), shared = await aio_flight.do(key, miss)
+    return flight_result(context, response, data, shared)
+
+
+class AsyncMetricsServicer(metrics_pb2_grpc.MetricsServiceServicer):
+    """``grpc.aio`` servicer backed by :mod:`server.aio_orm`.
+
+    Responses, pagination and caching match :class:`MetricsServicer`; DB
+    waits suspend the coroutine instead of blocking a worker thread.
+    """
+
+    async def GetMetrics(self, request, context):
+        filters = await _read_filters(request, context)
+        key = cache_key(
+            "GetMetrics", **filters, limit=request.limit, columnar=request.columnar
+        )
+
+        async def build():
+            limit = request.limit
+            # Fetch one extra row to learn whether another page exists.
+            limit = limit + 1 if limit else None
+            if request.columnar and request.meter_ids:
+                columns = await aio_orm.get_reading_columns(**filters, limit=limit)
+                return columns_page_response(request, *columns)
+            query = time_format(filters, request.columnar)
+            rows = await aio_orm.get_readings(**query, limit=limit)
+            return page_response(request, rows)
+
+        return await _cached(context, key, filters, build)
+
+    async def StreamMetrics(self, request, context):
+        filters = time_format(await _read_filters(request, context), request.columnar)
+        meter_column = len(request.meter_ids) != 1
+        batch = []
+        async for row in aio_orm.iter_readings(**filters, limit=request.limit or None):
+            batch.append(row)
+            if len(batch) >= STREAM_CHUNK_SIZE:
+                yield build_response(batch, request.columnar, meter_column)
+                batch = []
+        if batch:
+            yield build_response(batch, request.columnar, meter_column)
+
+    async def AggregateMetrics(self, request, context):
+        aggregate, filters = aggregate_filters(request)
+        key = cache_key("AggregateMetrics", aggregate=aggregate, **filters)
+
+        async def build():
+            rows = await aio_orm.aggregate_readings(aggregate, **filters)
+            return aggregate_response(rows)
+
+        try:
+            return await _cached(context, key, filters, build)
+        except ValueError as exc:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(exc))
+
+    async def IngestMetrics(self, request_iterator, context):
+        buffer = AsyncIngestBuffer()
+        await buffer.consume(request.data async for request in request_iterator)
+
+        log.info(
+            "Ingest stream finished: %d accepted, %d rejected.",
+            buffer.accepted,
+            buffer.rejected,
+        )
+        return IngestResponse(accepted=buffer.accepted, rejected=buffer.rejected)
+
+    async def ListMeters(self, request, context):
+        async def build():
+            return ListMetersResponse(meter_ids=await aio_orm.list_meters())
+
+        return await _cached(context, cache_key("ListMeters"), {}, build)
+
+    async def GetDataVersion(self, request, context):
+        async def build():
+            return DataVersionResponse(version=await aio_orm.data_version())
+
+        return await _cached(context, cache_key("GetDataVersion"), {}, build)
+
+    async def GetSummary(self, request, context):
+        selection = request_selection(request)
+
+        async def build():
+            return summary_response(await aio_orm.get_summary(**selection))
+
+        return await _cached(
+            context, cache_key("GetSummary", **selection), selection, build
+        )
+
+    async def GetAnomalies(self, request, context):
+        filters = anomaly_filters(request)
+
+        async def build():
+            return anomalies_response(await aio_orm.get_anomalies(**filters))
+
+        return await _cached(
+            context,
+            cache_key("GetAnomalies", **filters),
+            anomaly_scope(filters),
+            build,
+        )
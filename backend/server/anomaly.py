@@ -0,0 +1,155 @@
+import math
+from bisect import bisect_left, insort
+from collections import deque
+from datetime import datetime, timedelta
+
+from .settings import ANOMALY_CADENCE_SECONDS, ANOMALY_WINDOW, ANOMALY_Z_THRESHOLD
+
+GAP = "gap"
+SPIKE = "spike"
+
+_ZERO = timedelta(0)
+
+
+class _Window:
+    """The last ``size`` values of one meter, in arrival order and sorted.
+
+    The sorted copy gives the median by index and running sums give the
+    standard deviation, so a push costs two bisections instead of a sort.
+    The sums are taken relative to a recent mean (``shift``), which keeps
+    the variance exact for large readings, and are recomputed once every
+    ``size`` pushes, so rounding errors cannot accumulate.
+    """
+
+    __slots__ = ("size", "values", "ordered", "shift", "total", "squares", "pushes")
+
+    def __init__(self, size: int, values=()) -> None:
+        self.size = size
+        self.values = deque(list(values)[-size:])
+        self.ordered = sorted(self.values)
+        self.pushes = 0
+        self._resum()
+
+    def _resum(self) -> None:
+        n = len(self.values)
+        self.shift = math.fsum(self.values) / n if n else 0.0
+        deltas = [v - self.shift for v in self.values]
+        self.total = math.fsum(deltas)
+        self.squares = math.fsum(d * d for d in deltas)
+
+    def score(self, value: float) -> float | None:
+        """Return the z-score of ``value``, or None until the window is full."""
+        n = len(self.values)
+        if n < self.size:
+            return None
+        mean = self.total / n
+        stddev = math.sqrt(max(self.squares / n - mean * mean, 0.0))
+        if not stddev:
+            return None
+        mid, odd = divmod(n, 2)
+        ordered = self.ordered
+        median = ordered[mid] if odd else (ordered[mid - 1] + ordered[mid]) / 2
+        return (value - median) / stddev
+
+    def push(self, value: float) -> None:
+        if len(self.values) == self.size:
+            old = self.values.popleft()
+            del self.ordered[bisect_left(self.ordered, old)]
+            old -= self.shift
+            self.total -= old
+            self.squares -= old * old
+        self.values.append(value)
+        insort(self.ordered, value)
+        value -= self.shift
+        self.total += value
+        self.squares += value * value
+        self.pushes += 1
+        if self.pushes == self.size:
+            self.pushes = 0
+            self._resum()
+
+
+class AnomalyDetector:
+    """Single-pass gap and spike detection over per-meter reading streams.
+
+    Only the last reading time and a window of recent values are kept per
+    meter, so memory is bounded by meters × ``window`` however much data
+    flows through. :meth:`states` exports that state and the constructor
+    takes it back, so detection resumes where the last write left off.
+
+    * A ``gap`` is flagged when at least one whole ``cadence`` interval is
+      missing between consecutive readings. It spans ``[last + cadence,
+      time)`` and scores the number of missing intervals.
+    * A ``spike`` is a reading whose z-score against the window (distance
+      from the window's median in units of its standard deviation) reaches
+      ``threshold``. The score is signed, so dips are negative. Nothing is
+      scored until the window is full.
+
+    Readings must arrive in time order per meter; readings at or before a
+    meter's last reading (late or duplicate) are skipped.
+    """
+
+    def __init__(
+        self,
+        states=(),
+        cadence: timedelta = timedelta(seconds=ANOMALY_CADENCE_SECONDS),
+        window: int = ANOMALY_WINDOW,
+        threshold: float = ANOMALY_Z_THRESHOLD,
+    ) -> None:
+        self.cadence = cadence
+        self.window = window
+        self.threshold = threshold
+        # Shorter steps round to zero missing intervals.
+        self._gap_after = cadence * 1.5
+        self._meters: dict[str, list] = {
+            meter_id: [last_time, _Window(window, recent)]
+            for meter_id, last_time, recent in states
+        }
+
+    def feed(self, time: datetime, value: float, meter_id: str) -> list[tuple]:
+        """Return the anomalies flagged by one reading.
+
+        Anomalies are ``(meter_id, kind, start, end, value, score)`` tuples;
+        ``value`` is None for gaps.
+        """
+        flagged = []
+        self._feed(time, value, meter_id, flagged)
+        return flagged
+
+    def run(self, readings) -> list[tuple]:
+        """Feed ``(time, value, meter_id)`` readings; return all anomalies.
+
+        The readings are put in per-meter time order first.
+        """
+        flagged = []
+        for time, value, meter_id in sorted(readings, key=lambda r: (r[2], r[0])):
+            self._feed(time, value, meter_id, flagged)
+        return flagged
+
+    def _feed(self, time, value, meter_id, flagged: list) -> None:
+        state = self._meters.get(meter_id)
+        if state is None:
+            state = self._meters[meter_id] = [None, _Window(self.window)]
+        last, window = state
+        if last is not None:
+            step = time - last
+            if step <= _ZERO:
+                return
+            if step >= self._gap_after:
+                missing = round(step / self.cadence) - 1
+                flagged.append(
+                    (meter_id, GAP, last + self.cadence, time, None, float(missing))
+                )
+        score = window.score(value)
+        if score is not None and abs(score) >= self.threshold:
+            flagged.append((meter_id, SPIKE, time, time + self.cadence, value, score))
+        window.push(value)
+        state[0] = time
+
+    def states(self) -> list[tuple]:
+        """Return ``(meter_id, last_time, recent values)`` for every known meter."""
+        return [
+            (meter_id, last, list(window.values))
+            for meter_id, (last, window) in sorted(self._meters.items())
+            if last is not None
+        ]
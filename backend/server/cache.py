@@ -0,0 +1,270 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+import grpc
+
+from .settings import RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL_SECONDS
+from .telemetry import Counter, Gauge, register
+
+log = logging.getLogger(__name__)
+
+
+def cache_key(method: str, **params) -> tuple:
+    """Build a hashable key from normalized request parameters.
+
+    Parameter order is irrelevant, list values (meter ids) are deduplicated
+    and sorted, and ``None`` values are dropped.
+    """
+    items = []
+    for name, value in sorted(params.items()):
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set, frozenset)):
+            value = tuple(sorted(set(value)))
+        items.append((name, value))
+    return (method, tuple(items))
+
+
+# Invalidations remembered for puts that started before them; a put older
+# than all of them is rejected.
+_RECENT_INVALIDATIONS = 256
+
+
+def _overlaps(start, end, meters, first, last, written) -> bool:
+    """Whether an entry over ``[start, end)`` and ``meters`` covers a write."""
+    return (
+        (first is None or end is None or end > first)
+        and (last is None or start is None or start <= last)
+        and (written is None or meters is None or bool(meters & written))
+    )
+
+
+class _Entry:
+    __slots__ = ("data", "expires", "start", "end", "meters")
+
+    def __init__(self, data, expires, start, end, meters):
+        self.data = data
+        self.expires = expires
+        self.start = start
+        self.end = end
+        self.meters = meters
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of serialized responses.
+
+    Entries expire after ``ttl`` seconds and the total size of cached
+    payloads is bounded by ``max_bytes``. Each entry remembers the time range
+    ``[start, end)`` and meters it covers, so writes only evict the responses
+    they can affect. ``max_bytes=0`` disables caching.
+
+    A response built from a query that ran before a write committed must not
+    be cached after the write's invalidation. Callers therefore take
+    :meth:`generation` before querying and pass it to :meth:`put`, which
+    drops the response if an overlapping invalidation happened since. A
+    response read from a replica may miss writes for as long as the replica
+    lags, so :meth:`put` also takes that ``lag``.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+        clock=time.monotonic,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rejections = 0
+        self._generation = 0
+        self._recent: deque = deque(maxlen=_RECENT_INVALIDATIONS)
+
+    def get(self, key: tuple) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= self._clock():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.data
+
+    def generation(self) -> int:
+        """Return the number of invalidations so far, to pass to :meth:`put`."""
+        with self._lock:
+            return self._generation
+
+    def put(
+        self,
+        key: tuple,
+        data: bytes,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        meter_ids=None,
+        generation: int | None = None,
+        lag: float = 0.0,
+    ) -> None:
+        """Cache ``data`` for ``key``; ``meter_ids=None`` means all meters.
+
+        With ``generation``, ``data`` is dropped if an invalidation since
+        then, or in the last ``lag`` seconds, overlaps it.
+        """
+        if len(data) > self.max_bytes:
+            return
+        meters = frozenset(meter_ids) if meter_ids else None
+        with self._lock:
+            if generation is not None and self._invalidated_since(
+                generation, self._clock() - lag, start, end, meters
+            ):
+                self.rejections += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(
+                data, self._clock() + self.ttl, start, end, meters
+            )
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(
+        self,
+        first: datetime | None = None,
+        last: datetime | None = None,
+        meter_ids=None,
+    ) -> int:
+        """Drop entries overlapping writes in ``[first, last]`` for ``meter_ids``.
+
+        Omitted bounds or meters match everything. Returns the number of
+        entries dropped.
+        """
+        meters = frozenset(meter_ids) if meter_ids else None
+        with self._lock:
+            self._generation += 1
+            self._recent.append((self._generation, self._clock(), first, last, meters))
+            stale = [
+                key
+                for key, entry in self._entries.items()
+                if _overlaps(entry.start, entry.end, entry.meters, first, last, meters)
+            ]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+        if stale:
+            log.debug("Invalidated %d cached responses.", len(stale))
+        return len(stale)
+
+    def clear(self) -> None:
+        self.invalidate()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "rejections": self.rejections,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def _invalidated_since(
+        self, generation: int, after: float, start, end, meters
+    ) -> bool:
+        recent = self._recent
+        if not recent or (generation == self._generation and recent[-1][1] <= after):
+            return False
+        oldest, at = recent[0][:2]
+        if oldest > generation + 1 or (len(recent) == recent.maxlen and at > after):
+            # Invalidations since then were forgotten; assume the worst.
+            return True
+        return any(
+            _overlaps(start, end, meters, first, last, written)
+            for seen, at, first, last, written in recent
+            if seen > generation or at > after
+        )
+
+    def _remove(self, key: tuple) -> None:
+        self._size -= len(self._entries.pop(key).data)
+
+
+response_cache = ResponseCache()
+
+for _stat, _help in (
+    ("hits", "Response cache lookups answered from the cache."),
+    ("misses", "Response cache lookups that had to build the response."),
+    ("evictions", "Cached responses evicted to stay within the byte budget."),
+    ("invalidations", "Cached responses dropped because of overlapping writes."),
+    ("rejections", "Responses not cached because a write overlapped their query."),
+):
+    register(
+        Counter(
+            f"response_cache_{_stat}_total",
+            _help,
+            fn=lambda stat=_stat: response_cache.stats()[stat],
+        )
+    )
+register(
+    Gauge(
+        "response_cache_entries",
+        "Responses currently cached.",
+        lambda: response_cache.stats()["entries"],
+    )
+)
+register(
+    Gauge(
+        "response_cache_bytes",
+        "Serialized bytes currently cached.",
+        lambda: response_cache.stats()["bytes"],
+    )
+)
+
+
+def _passthrough(serializer):
+    def serialize(message):
+        return message if isinstance(message, bytes) else serializer(message)
+
+    return serialize
+
+
+def _preserialized(handler):
+    if handler is None or handler.unary_unary is None:
+        return handler
+    return grpc.unary_unary_rpc_method_handler(
+        handler.unary_unary,
+        request_deserializer=handler.request_deserializer,
+        response_serializer=_passthrough(handler.response_serializer),
+    )
+
+
+class PreserializedResponseInterceptor(grpc.ServerInterceptor):
+    """Let unary-unary handlers return already-serialized response bytes.
+
+    Cached responses are stored as bytes; this skips re-serializing them on
+    every hit while leaving ordinary message responses untouched.
+    """
+
+    def intercept_service(self, continuation, handler_call_details):
+        return _preserialized(continuation(handler_call_details))
+
+
+class AsyncPreserializedResponseInterceptor(grpc.aio.ServerInterceptor):
+    """``grpc.aio`` counterpart of :class:`PreserializedResponseInterceptor`."""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        return _preserialized(await continuation(handler_call_details))
@@ -1,25 +1,330 @@
 import logging
+import threading
 import time
+from collections import deque
+from contextlib import contextmanager
 
 import psycopg2
-from psycopg2 import pool
+from psycopg2 import extensions, pool
 
 from .settings import (
     DB_HOST,
     DB_NAME,
     DB_PASS,
+    DB_POOL_ACQUIRE_TIMEOUT,
+    DB_POOL_MAX_AGE_SECONDS,
     DB_POOL_MAX_CONN,
     DB_POOL_MIN_CONN,
+    DB_POOL_PRE_PING,
     DB_PORT,
+    DB_REPLICA_CHECK_SECONDS,
+    DB_REPLICA_HOSTS,
+    DB_REPLICA_MAX_LAG_SECONDS,
     DB_USER,
 )
+from .telemetry import Gauge, Histogram, register
 
 log = logging.getLogger(__name__)
 
-_pool: pool.ThreadedConnectionPool | None = None
 
+class PoolTimeout(pool.PoolError):
+    """No connection became free within the acquire timeout."""
 
-def wait_for_db(retries: int = 20, delay: int = 3) -> None:
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool that queues callers instead of failing.
+
+    When all ``maxconn`` connections are checked out, :meth:`getconn` waits up
+    to ``acquire_timeout`` seconds for one to be returned before raising
+    :class:`PoolTimeout`. Checked-out connections are validated: ones older
+    than ``max_age`` seconds are replaced, and with ``pre_ping`` a
+    ``SELECT 1`` weeds out sockets killed by a database restart. Connections
+    returned closed or in a broken state are dropped rather than reused.
+    """
+
+    def __init__(
+        self,
+        minconn: int,
+        maxconn: int,
+        acquire_timeout: float = DB_POOL_ACQUIRE_TIMEOUT,
+        max_age: float = DB_POOL_MAX_AGE_SECONDS,
+        pre_ping: bool = DB_POOL_PRE_PING,
+        clock=time.monotonic,
+        **connect_kwargs,
+    ) -> None:
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.max_age = max_age
+        self.pre_ping = pre_ping
+        self._clock = clock
+        self._connect_kwargs = connect_kwargs
+        self._cond = threading.Condition()
+        self._idle: deque = deque()
+        self._born: dict[int, float] = {}
+        self._size = 0
+        self._closed = False
+        self.in_use = 0
+        self.waiters = 0
+        for _ in range(minconn):
+            self._idle.append(self._connect())
+            self._size += 1
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def owns(self, conn) -> bool:
+        return id(conn) in self._born
+
+    def getconn(self, timeout: float | None = None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        started = self._clock()
+        deadline = started + timeout
+        with self._cond:
+            waiting = False
+            try:
+                while (
+                    not self._closed and not self._idle and self._size >= self.maxconn
+                ):
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            "No database connection became free within %.1fs." % timeout
+                        )
+                    if not waiting:
+                        waiting = True
+                        self.waiters += 1
+                    self._cond.wait(remaining)
+            finally:
+                if waiting:
+                    self.waiters -= 1
+            if self._closed:
+                raise pool.PoolError("Connection pool is closed.")
+            if self._idle:
+                # LIFO: the most recently used connection is the warmest.
+                conn = self._idle.pop()
+            else:
+                conn = None
+                self._size += 1
+            self.in_use += 1
+
+        try:
+            if conn is not None and not self._usable(conn):
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self.in_use -= 1
+                self._cond.notify()
+            raise
+        ACQUIRE_SECONDS.observe(self._clock() - started)
+        return conn
+
+    def putconn(self, conn, close: bool = False) -> None:
+        keep = not close and not conn.closed and not self._expired(conn)
+        if keep:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                keep = False
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    keep = False
+
+        with self._cond:
+            self.in_use -= 1
+            keep = keep and not self._closed
+            if keep:
+                self._idle.append(conn)
+            else:
+                self._size -= 1
+            self._cond.notify()
+        if not keep:
+            self._discard(conn)
+
+    def closeall(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        self._born[id(conn)] = self._clock()
+        return conn
+
+    def _discard(self, conn) -> None:
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _expired(self, conn) -> bool:
+        born = self._born.get(id(conn), self._clock())
+        return bool(self.max_age) and self._clock() - born >= self.max_age
+
+    def _usable(self, conn) -> bool:
+        if conn.closed or self._expired(conn):
+            return False
+        if not self.pre_ping:
+            return True
+        # In autocommit the ping is a single round trip with no BEGIN/ROLLBACK.
+        autocommit = conn.autocommit
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.autocommit = autocommit
+            return True
+        except psycopg2.Error as exc:
+            log.warning("Discarding dead pooled connection: %s", exc)
+            return False
+
+
+# Seconds the node replays behind its primary; 0 on a primary, or on a replica
+# that has replayed everything it received (an idle primary sends nothing).
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END::float8;
+"""
+
+
+class ReplicaRouter:
+    """Round-robin order over read replicas, skipping ones that lag too far.
+
+    The router only keeps bookkeeping; callers probe replicas with
+    ``REPLICA_LAG_SQL`` when :meth:`claim_probe` tells them to and report the
+    result with :meth:`record`. Each replica is probed at most once per
+    ``check_interval``, and unreachable or lagging replicas are left out
+    until their next probe.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        max_lag: float = DB_REPLICA_MAX_LAG_SECONDS,
+        check_interval: float = DB_REPLICA_CHECK_SECONDS,
+        clock=time.monotonic,
+    ) -> None:
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._clock = clock
+        self._count = count
+        self._next = 0
+        self._lag: list[float | None] = [None] * count
+        self._checked = [float("-inf")] * count
+        self._lock = threading.Lock()
+
+    def order(self) -> list[int]:
+        """Return the replica indices worth trying, rotated for round-robin.
+
+        A replica is included when its last probe found it usable or when a
+        new probe is due; callers then call :meth:`claim_probe` on it.
+        """
+        with self._lock:
+            if not self._count:
+                return []
+            start, self._next = self._next, (self._next + 1) % self._count
+            now = self._clock()
+            indices = [(start + offset) % self._count for offset in range(self._count)]
+            return [i for i in indices if self.healthy(i) or self._due(i, now)]
+
+    def claim_probe(self, index: int) -> bool:
+        """Return True if the caller should probe ``index`` now.
+
+        Only one caller per ``check_interval`` wins; the rest use the lag
+        recorded by the last probe.
+        """
+        with self._lock:
+            now = self._clock()
+            if not self._due(index, now):
+                return False
+            self._checked[index] = now
+            return True
+
+    def _due(self, index: int, now: float) -> bool:
+        return now - self._checked[index] >= self.check_interval
+
+    def record(self, index: int, lag: float | None) -> bool:
+        """Store a probe result (``None`` = unreachable); return True if usable."""
+        self._lag[index] = lag
+        if lag is not None and lag > self.max_lag:
+            log.warning("Replica %d is %.1fs behind; reading elsewhere.", index, lag)
+        return self.healthy(index)
+
+    def healthy(self, index: int) -> bool:
+        lag = self._lag[index]
+        return lag is not None and lag <= self.max_lag
+
+
+_pool: ConnectionPool | None = None
+_replicas: list[ConnectionPool] = []
+_router = ReplicaRouter(0)
+
+ACQUIRE_SECONDS = register(
+    Histogram("db_pool_acquire_seconds", "Time spent waiting for a DB connection.")
+)
+register(
+    Gauge(
+        "db_replicas_healthy",
+        "Read replicas currently within DB_REPLICA_MAX_LAG_SECONDS.",
+        lambda: sum(_router.healthy(i) for i in range(len(_replicas))),
+    )
+)
+register(
+    Gauge(
+        "db_pool_connections_in_use",
+        "DB connections currently checked out, across all nodes.",
+        lambda: sum(p.in_use for p in _pools()),
+    )
+)
+register(
+    Gauge(
+        "db_pool_connections_idle",
+        "Open DB connections waiting in the pools, across all nodes.",
+        lambda: sum(p.idle for p in _pools()),
+    )
+)
+register(
+    Gauge(
+        "db_pool_waiters",
+        "Callers queued for a DB connection, across all nodes.",
+        lambda: sum(p.waiters for p in _pools()),
+    )
+)
+
+
+def _pools() -> list[ConnectionPool]:
+    return ([_pool] if _pool else []) + _replicas
+
+
+def replica_address(entry: str) -> tuple[str, str]:
+    """Split a ``DB_REPLICA_HOSTS`` entry into host and port."""
+    host, sep, port = entry.rpartition(":")
+    return (host, port) if sep and port.isdigit() else (entry, DB_PORT)
+
+
+def wait_for_db(retries: int = 20, delay: float = 0.1, max_delay: float = 5.0) -> None:
+    """Block until the primary accepts connections.
+
+    Retries back off exponentially from ``delay`` up to ``max_delay`` seconds,
+    so a database that is already up costs one connection attempt and one
+    that is still starting is polled often at first.
+    """
     for attempt in range(1, retries + 1):
         try:
             conn = psycopg2.connect(
@@ -34,44 +339,113 @@ def wait_for_db(retries: int = 20, delay: int = 3) -> None:
             return
         except psycopg2.OperationalError as exc:
             log.warning("Attempt %d/%d – DB not ready: %s", attempt, retries, exc)
-            time.sleep(delay)
+            if attempt < retries:
+                time.sleep(min(delay * 2 ** (attempt - 1), max_delay))
     raise RuntimeError("Could not connect to the database after %d attempts." % retries)
 
 
-def init_pool() -> None:
-    global _pool
-    if _pool is not None:
-        return
-    _pool = pool.ThreadedConnectionPool(
-        minconn=DB_POOL_MIN_CONN,
+def _make_pool(host: str, port: str, minconn: int = DB_POOL_MIN_CONN):
+    return ConnectionPool(
+        minconn=minconn,
         maxconn=DB_POOL_MAX_CONN,
-        host=DB_HOST,
-        port=DB_PORT,
+        host=host,
+        port=port,
         dbname=DB_NAME,
         user=DB_USER,
         password=DB_PASS,
     )
+
+
+def init_pool() -> None:
+    global _pool, _replicas, _router
+    if _pool is not None:
+        return
+    _pool = _make_pool(DB_HOST, DB_PORT)
+    # Replica pools open lazily so an unreachable replica cannot block startup.
+    _replicas = [
+        _make_pool(*replica_address(entry), minconn=0) for entry in DB_REPLICA_HOSTS
+    ]
+    _router = ReplicaRouter(len(_replicas))
     log.info(
-        "Initialized DB connection pool (min=%d, max=%d).",
+        "Initialized DB connection pool (min=%d, max=%d, replicas=%d).",
         DB_POOL_MIN_CONN,
         DB_POOL_MAX_CONN,
+        len(_replicas),
     )
 
 
 def close_pool() -> None:
-    global _pool
+    global _pool, _replicas
     if _pool is not None:
+        for replica in _replicas:
+            replica.closeall()
+        _replicas = []
         _pool.closeall()
         _pool = None
         log.info("Closed DB connection pool.")
 
 
 def get_conn():
+    """Borrow a connection to the primary; use for writes and DDL."""
     if _pool is None:
         raise RuntimeError("DB pool is not initialized.")
     return _pool.getconn()
 
 
+def get_read_conn():
+    """Borrow a connection for a read-only query.
+
+    Replicas are tried round-robin, skipping unreachable ones and ones more
+    than ``DB_REPLICA_MAX_LAG_SECONDS`` behind; the primary serves the read
+    when no replica qualifies. Return it with :func:`put_conn`.
+    """
+    if _pool is None:
+        raise RuntimeError("DB pool is not initialized.")
+    for index in _router.order():
+        probe = _router.claim_probe(index)
+        if not probe and not _router.healthy(index):
+            continue
+        replica = _replicas[index]
+        try:
+            conn = replica.getconn()
+        except (pool.PoolError, psycopg2.Error) as exc:
+            log.warning("Replica %d unavailable: %s", index, exc)
+            _router.record(index, None)
+            continue
+        if probe:
+            lag = _replica_lag(conn)
+            if not _router.record(index, lag):
+                replica.putconn(conn, close=lag is None)
+                continue
+        return conn
+    return _pool.getconn()
+
+
+def _replica_lag(conn) -> float | None:
+    """Return the replication lag seen on ``conn``, or None if the check fails."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute(REPLICA_LAG_SQL)
+            lag = cur.fetchone()[0]
+        conn.rollback()
+        return lag
+    except psycopg2.Error as exc:
+        log.warning("Replica lag check failed: %s", exc)
+        return None
+
+
 def put_conn(conn) -> None:
+    """Return a connection from :func:`get_conn` or :func:`get_read_conn`."""
     if _pool is not None and conn is not None:
-        _pool.putconn(conn)
+        owner = next((r for r in _replicas if r.owns(conn)), _pool)
+        owner.putconn(conn)
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection for the duration of a ``with`` block."""
+    conn = get_conn()
+    try:
+        yield conn
+    finally:
+        put_conn(conn)
@@ -0,0 +1,156 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+
+from . import aio_orm
+from .orm import insert_readings, parse_reading
+from .settings import INGEST_FLUSH_ROWS, INGEST_FLUSH_SECONDS
+
+log = logging.getLogger(__name__)
+
+
+class IngestBuffer:
+    """Collects validated points from one ingest stream and writes them in batches.
+
+    Buffered rows are written once ``flush_rows`` points have accumulated or
+    ``flush_seconds`` have passed since the last write, whichever comes first.
+    :meth:`consume` also checks the time threshold while the stream is quiet
+    and writes the remainder when it ends; with :meth:`add` alone thresholds
+    are checked as points arrive.
+    """
+
+    def __init__(
+        self,
+        flush_rows: int = INGEST_FLUSH_ROWS,
+        flush_seconds: float = INGEST_FLUSH_SECONDS,
+        clock=time.monotonic,
+    ) -> None:
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._clock = clock
+        self._rows: list[tuple[str, float, str]] = []
+        self._last_flush = clock()
+        self.accepted = 0
+        self.rejected = 0
+        # The timer thread of consume() flushes too.
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._error: Exception | None = None
+
+    def consume(self, batches) -> None:
+        """Add every batch of points from ``batches``, then flush.
+
+        A timer thread writes the buffered rows once ``flush_seconds`` pass
+        without a batch arriving; if that write fails, the error is raised
+        here.
+        """
+        timer = None
+        if self.flush_seconds > 0:
+            # Copied so stage() timings are attributed to the ingest RPC.
+            context = contextvars.copy_context()
+            timer = threading.Thread(
+                target=context.run,
+                args=(self._flush_when_due,),
+                name="ingest-flush",
+                daemon=True,
+            )
+            timer.start()
+        try:
+            for points in batches:
+                self.add(points)
+            self.flush()
+        finally:
+            self._done.set()
+            if timer is not None:
+                timer.join()
+
+    def add(self, points) -> None:
+        with self._lock:
+            if self._accept(points):
+                self._write()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._write()
+
+    def _write(self) -> None:
+        if self._error is not None:
+            raise self._error
+        if self._rows:
+            self.accepted += insert_readings(self._rows)
+            log.debug("Flushed %d ingested rows.", len(self._rows))
+            self._rows = []
+        self._last_flush = self._clock()
+
+    def _flush_when_due(self) -> None:
+        while not self._done.wait(self._until_due()):
+            with self._lock:
+                if not self._due():
+                    continue
+                try:
+                    self._write()
+                except Exception as exc:
+                    log.exception("Timed flush of ingested rows failed.")
+                    self._error = exc
+                    return
+
+    def _until_due(self) -> float:
+        return max(self._last_flush + self.flush_seconds - self._clock(), 0.0)
+
+    def _due(self) -> bool:
+        return self._clock() - self._last_flush >= self.flush_seconds
+
+    def _accept(self, points) -> bool:
+        """Buffer the valid points; return True when a flush is due."""
+        for point in points:
+            row = parse_reading(point.time, point.meterusage, point.meter_id)
+            if row is None:
+                self.rejected += 1
+            else:
+                self._rows.append(row)
+        return len(self._rows) >= self.flush_rows or self._due()
+
+
+class AsyncIngestBuffer(IngestBuffer):
+    """:class:`IngestBuffer` whose writes go through the async pool."""
+
+    async def consume(self, batches) -> None:
+        """Async version of :meth:`IngestBuffer.consume`.
+
+        Instead of a timer, the wait for the next batch is cut short when a
+        flush is due. The read itself is not cancelled, so no batch is lost.
+        """
+        batches = aiter(batches)
+        pending = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(anext(batches))
+                timeout = self._until_due() if self.flush_seconds > 0 else None
+                done, _ = await asyncio.wait((pending,), timeout=timeout)
+                if not done:
+                    await self.flush()
+                    continue
+                try:
+                    points = pending.result()
+                except StopAsyncIteration:
+                    break
+                pending = None
+                await self.add(points)
+        finally:
+            if pending is not None:
+                pending.cancel()
+        await self.flush()
+
+    async def add(self, points) -> None:
+        if self._accept(points):
+            await self.flush()
+
+    async def flush(self) -> None:
+        if self._rows:
+            self.accepted += await aio_orm.insert_readings(self._rows)
+            log.debug("Flushed %d ingested rows.", len(self._rows))
+            self._rows = []
+        self._last_flush = self._clock()
@@ -0,0 +1,210 @@
+import time
+
+import grpc
+
+from .telemetry import (
+    SIZE_BUCKETS,
+    STAGE_SECONDS,
+    Counter,
+    Gauge,
+    Histogram,
+    current_rpc,
+    register,
+)
+
+RPC_SECONDS = register(
+    Histogram(
+        "grpc_server_handling_seconds",
+        "Wall time from handler start to its last response.",
+        labelnames=("method",),
+    )
+)
+RPC_TOTAL = register(
+    Counter(
+        "grpc_server_handled_total",
+        "Completed RPCs by status code.",
+        labelnames=("method", "code"),
+    )
+)
+RPC_IN_FLIGHT = register(
+    Gauge(
+        "grpc_server_in_flight",
+        "RPCs currently being handled.",
+        labelnames=("method",),
+    )
+)
+RESPONSE_BYTES = register(
+    Histogram(
+        "grpc_server_response_bytes",
+        "Serialized size of each response message.",
+        labelnames=("method",),
+        buckets=SIZE_BUCKETS,
+    )
+)
+RESPONSE_ROWS = register(
+    Histogram(
+        "grpc_server_response_rows",
+        "Points carried by each built response message.",
+        labelnames=("method",),
+        buckets=SIZE_BUCKETS,
+    )
+)
+
+
+def observe_rows(response) -> None:
+    """Record the number of points in a MetricsResponse for the current RPC."""
+    rows = len(response.data) or len(response.columns.time_unix_ms)
+    RESPONSE_ROWS.observe(rows, method=current_rpc.get() or "none")
+
+
+def _method_name(handler_call_details) -> str:
+    return handler_call_details.method.rsplit("/", 1)[-1]
+
+
+def _code(context, error) -> str:
+    code = context.code() if hasattr(context, "code") else None
+    if code is None:
+        code = grpc.StatusCode.UNKNOWN if error else grpc.StatusCode.OK
+    return code.name
+
+
+class _Call:
+    """Bookkeeping for one RPC: in-flight gauge, duration and status."""
+
+    def __init__(self, method: str) -> None:
+        self.method = method
+        self._token = current_rpc.set(method)
+        self._started = time.perf_counter()
+        RPC_IN_FLIGHT.inc(method=method)
+
+    def finish(self, context, error: BaseException | None) -> None:
+        RPC_IN_FLIGHT.dec(method=self.method)
+        RPC_SECONDS.observe(time.perf_counter() - self._started, method=self.method)
+        RPC_TOTAL.inc(method=self.method, code=_code(context, error))
+        current_rpc.reset(self._token)
+
+
+def _timed_serializer(method: str, serializer):
+    def serialize(message):
+        started = time.perf_counter()
+        data = serializer(message) if serializer else message
+        RESPONSE_BYTES.observe(len(data), method=method)
+        if not isinstance(message, bytes):
+            # Runs after the handler returned, so current_rpc is already reset.
+            STAGE_SECONDS.observe(
+                time.perf_counter() - started, method=method, stage="serialize"
+            )
+        return data
+
+    return serialize
+
+
+_FACTORIES = (
+    ("unary_unary", grpc.unary_unary_rpc_method_handler),
+    ("unary_stream", grpc.unary_stream_rpc_method_handler),
+    ("stream_unary", grpc.stream_unary_rpc_method_handler),
+    ("stream_stream", grpc.stream_stream_rpc_method_handler),
+)
+
+
+def _rebuild(handler, method: str, wrap_unary, wrap_stream):
+    for kind, factory in _FACTORIES:
+        behavior = getattr(handler, kind)
+        if behavior is not None:
+            wrap = wrap_stream if kind.endswith("_stream") else wrap_unary
+            return factory(
+                wrap(behavior, method),
+                request_deserializer=handler.request_deserializer,
+                response_serializer=_timed_serializer(
+                    method, handler.response_serializer
+                ),
+            )
+    return handler
+
+
+def _unary(behavior, method):
+    def handle(request, context):
+        call = _Call(method)
+        error = None
+        try:
+            return behavior(request, context)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            call.finish(context, error)
+
+    return handle
+
+
+def _stream(behavior, method):
+    def handle(request, context):
+        call = _Call(method)
+        error = None
+        try:
+            yield from behavior(request, context)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            call.finish(context, error)
+
+    return handle
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """Record duration, status, in-flight count and response sizes per RPC.
+
+    The RPC name is also published in ``telemetry.current_rpc`` while the
+    handler runs, so ``telemetry.stage`` timings in the ORM and servicer are
+    attributed to it.
+    """
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = _method_name(handler_call_details)
+        return _rebuild(handler, method, _unary, _stream)
+
+
+def _async_unary(behavior, method):
+    async def handle(request, context):
+        call = _Call(method)
+        error = None
+        try:
+            return await behavior(request, context)
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            call.finish(context, error)
+
+    return handle
+
+
+def _async_stream(behavior, method):
+    async def handle(request, context):
+        call = _Call(method)
+        error = None
+        try:
+            async for response in behavior(request, context):
+                yield response
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            call.finish(context, error)
+
+    return handle
+
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """``grpc.aio`` counterpart of :class:`MetricsInterceptor`."""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = _method_name(handler_call_details)
+        return _rebuild(handler, method, _async_unary, _async_stream)
@@ -1,15 +1,77 @@
 import csv
+import glob
+import hashlib
+import io
 import logging
 import math
+import multiprocessing
+import os
+import tempfile
+from collections.abc import Iterator
+from concurrent import futures
+from datetime import datetime, timedelta
+from itertools import islice
 
-from .db import get_conn, put_conn
-from .settings import CSV_PATH
+from .anomaly import AnomalyDetector
+from .cache import response_cache
+from .db import get_conn, get_read_conn, put_conn
+from .queries import (
+    BUMP_VERSION_SQL,
+    CREATE_STAGING_SQL,
+    DAILY_AGGREGATES,
+    DATA_VERSION_SQL,
+    DELETE_ANOMALIES_SQL,
+    INSERT_ANOMALY_SQL,
+    LIST_METERS_SQL,
+    LOCK_ANOMALY_STATE_SQL,
+    LOCK_METERS_SQL,
+    MERGE_STAGING_SQL,
+    NEVER,
+    RESCAN_PAGE_SQL,
+    ROLLUPS,
+    SAVE_ANOMALY_STATE_SQL,
+    WINDOW_BEFORE_SQL,
+    Rescan,
+    aggregate_query,
+    anomalies_query,
+    anomaly_readings,
+    as_utc,
+    columns_query,
+    format_version,
+    late_spans,
+    readings_query,
+    summary_query,
+    unpack_columns,
+)
+from .settings import (
+    ANOMALY_DETECTION,
+    ANOMALY_WINDOW,
+    CHUNK_TIME_INTERVAL,
+    COMPRESS_AFTER,
+    COMPRESSION,
+    CONTINUOUS_AGGREGATES,
+    CSV_PATH,
+    DB_POOL_MAX_CONN,
+    DEFAULT_METER_ID,
+    METER_PARTITIONS,
+    RETENTION,
+    SEED_BATCH_SIZE,
+    SEED_WORKERS,
+    STREAM_ITERSIZE,
+)
+from .telemetry import stage
 
 log = logging.getLogger(__name__)
 
 
-def setup_db() -> None:
-    """Create the hypertable and seed it from CSV if empty."""
+def setup_db() -> bool:
+    """Create the hypertable and its bookkeeping tables.
+
+    Only DDL runs here, so startup does not depend on the size of the data;
+    loading the CSV is left to :func:`seed_db`. Returns whether the seed file
+    is to be adopted, decided before any RPC can write (see
+    :func:`_adoptable`); pass it on to :func:`seed_db`.
+    """
     conn = get_conn()
     cur = None
     try:
@@ -18,28 +80,67 @@ def setup_db() -> None:
         cur.execute("""
             CREATE TABLE IF NOT EXISTS meter_readings (
                 time        TIMESTAMPTZ NOT NULL,
+                meter_id    TEXT NOT NULL,
                 meterusage  DOUBLE PRECISION NOT NULL
             );
         """)
 
-        cur.execute("""
+        # Tables created before meter_id existed hold a single meter's data.
+        cur.execute(
+            "ALTER TABLE meter_readings ADD COLUMN IF NOT EXISTS"
+            " meter_id TEXT NOT NULL DEFAULT %s;",
+            (DEFAULT_METER_ID,),
+        )
+
+        cur.execute(
+            """
             SELECT create_hypertable(
                 'meter_readings', 'time',
-                if_not_exists => TRUE,
-                migrate_data   => TRUE
+                partitioning_column => 'meter_id',
+                number_partitions   => %s,
+                chunk_time_interval => %s::interval,
+                if_not_exists       => TRUE,
+                migrate_data        => TRUE
+            );
+            """,
+            (METER_PARTITIONS, CHUNK_TIME_INTERVAL),
+        )
+        _add_space_dimension(cur)
+
+        # One-row write counter; see data_version().
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS data_version (
+                id       BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                created  TIMESTAMPTZ NOT NULL DEFAULT now(),
+                version  BIGINT NOT NULL DEFAULT 0
             );
         """)
+        cur.execute("INSERT INTO data_version DEFAULT VALUES ON CONFLICT DO NOTHING;")
 
-        cur.execute("SELECT COUNT(*) FROM meter_readings;")
-        result = cur.fetchone()
-        count = result[0] if result else 0
+        # Source files loaded so far; see _seed_source().
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS seed_state (
+                checksum     TEXT PRIMARY KEY,
+                source       TEXT NOT NULL,
+                size         BIGINT NOT NULL,
+                mtime        DOUBLE PRECISION NOT NULL,
+                rows_loaded  BIGINT NOT NULL DEFAULT 0,
+                completed    BOOLEAN NOT NULL DEFAULT FALSE,
+                updated      TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
+
+        _create_summary(cur)
+        _create_unique_index(cur)
+        _create_anomaly_tables(cur)
+        _configure_storage(cur)
 
-        if count == 0:
-            _seed(cur)
-        else:
-            log.info("Database already contains %d rows – skipping seed.", count)
+        if CONTINUOUS_AGGREGATES:
+            _create_rollups(cur)
 
+        adopt = _adoptable(cur)
         conn.commit()
+        return adopt
     except Exception:
         conn.rollback()
         raise
@@ -49,31 +150,1032 @@ def setup_db() -> None:
         put_conn(conn)
 
 
-def _seed(cur) -> None:
-    log.info("Seeding database from %s …", CSV_PATH)
-    rows = []
-    with open(CSV_PATH, newline="") as f:
-        for row in csv.DictReader(f):
+def _adoptable(cur) -> bool:
+    """Whether the stored readings predate ``seed_state`` and the seed file.
+
+    Only a single seed file can be taken as their source. Ingested readings
+    would look the same, so this is decided before the server takes writes.
+    """
+    if len(_seed_paths(CSV_PATH)) != 1:
+        return False
+    cur.execute(
+        "SELECT NOT EXISTS (SELECT 1 FROM seed_state)"
+        " AND EXISTS (SELECT 1 FROM meter_readings);"
+    )
+    return cur.fetchone()[0]
+
+
+def _add_space_dimension(cur) -> None:
+    """Partition a hypertable created before ``meter_id`` existed by meter too.
+
+    ``create_hypertable`` leaves an existing hypertable as it is, and
+    TimescaleDB only adds dimensions to empty hypertables, so one holding
+    data stays partitioned by time alone.
+    """
+    cur.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM timescaledb_information.dimensions
+            WHERE hypertable_name = 'meter_readings' AND column_name = 'meter_id'
+        );
+    """)
+    if cur.fetchone()[0]:
+        return
+    cur.execute("SELECT EXISTS (SELECT 1 FROM meter_readings);")
+    if cur.fetchone()[0]:
+        log.warning(
+            "meter_readings holds data and is not partitioned by meter_id;"
+            " reload it into a new table to add the dimension."
+        )
+        return
+    cur.execute(
+        "SELECT add_dimension('meter_readings', 'meter_id',"
+        " number_partitions => %s, if_not_exists => TRUE);",
+        (METER_PARTITIONS,),
+    )
+
+
+def _create_summary(cur) -> None:
+    """Create the per-day rollup behind :func:`get_summary`.
+
+    Writes keep it current (see ``MERGE_STAGING_SQL``); readings stored
+    before the table existed are folded in once, when it is created.
+    """
+    cur.execute("SELECT to_regclass('meter_daily_summary') IS NULL;")
+    created = cur.fetchone()[0]
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS meter_daily_summary (
+            meter_id   TEXT NOT NULL,
+            day        TIMESTAMPTZ NOT NULL,
+            total      DOUBLE PRECISION NOT NULL,
+            readings   BIGINT NOT NULL,
+            minimum    DOUBLE PRECISION NOT NULL,
+            maximum    DOUBLE PRECISION NOT NULL,
+            peak_time  TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (meter_id, day)
+        );
+    """)
+    if created:
+        cur.execute(_BACKFILL_SUMMARY_SQL)
+        log.info("Backfilled meter_daily_summary from existing readings.")
+
+
+def _create_unique_index(cur) -> None:
+    """Make readings unique per meter and time.
+
+    Writes skip readings that are already stored (see ``MERGE_STAGING_SQL``),
+    so overlapping seed files and re-sent ingest batches are loaded once.
+    The unique index replaces the plain ``(meter_id, time)`` index. When it
+    is created, duplicates stored before it existed are deleted and the
+    daily summary is rebuilt without them.
+    """
+    cur.execute("SELECT to_regclass('meter_readings_meter_id_time_key') IS NULL;")
+    if not cur.fetchone()[0]:
+        return
+    # Equal (meter_id, time) rows live in the same chunk, where ctid is unique.
+    cur.execute(
+        "DELETE FROM meter_readings a USING meter_readings b"
+        " WHERE a.meter_id = b.meter_id AND a.time = b.time AND a.ctid > b.ctid;"
+    )
+    duplicates = cur.rowcount
+    cur.execute("""
+        CREATE UNIQUE INDEX meter_readings_meter_id_time_key
+        ON meter_readings (meter_id, time DESC);
+    """)
+    cur.execute("DROP INDEX IF EXISTS meter_readings_meter_id_time_idx;")
+    if duplicates > 0:
+        cur.execute("TRUNCATE meter_daily_summary;")
+        cur.execute(_BACKFILL_SUMMARY_SQL)
+        log.warning("Deleted %d duplicate readings.", duplicates)
+
+
+def _create_anomaly_tables(cur) -> None:
+    """Create the flagged intervals and the detector state behind them."""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS meter_anomalies (
+            meter_id    TEXT NOT NULL,
+            kind        TEXT NOT NULL,
+            start_time  TIMESTAMPTZ NOT NULL,
+            end_time    TIMESTAMPTZ NOT NULL,
+            value       DOUBLE PRECISION,
+            score       DOUBLE PRECISION NOT NULL,
+            detected    TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (meter_id, start_time, kind)
+        );
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS meter_anomalies_start_time_idx
+        ON meter_anomalies (start_time);
+    """)
+    # Last reading time and rolling window per meter; see _detect_anomalies().
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS meter_anomaly_state (
+            meter_id   TEXT PRIMARY KEY,
+            last_time  TIMESTAMPTZ NOT NULL,
+            recent     DOUBLE PRECISION[] NOT NULL
+        );
+    """)
+    # Time spans seed batches wrote per meter, until _detect_backlog() has
+    # checked them. Append-only, so concurrent loaders never wait on it.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS meter_seed_spans (
+            meter_id    TEXT NOT NULL,
+            first_time  TIMESTAMPTZ NOT NULL,
+            last_time   TIMESTAMPTZ NOT NULL
+        );
+    """)
+
+
+def _configure_storage(cur) -> None:
+    """Apply the chunk interval, compression and retention settings.
+
+    Policies are replaced on every boot so the settings stay authoritative.
+    Compressed chunks stay readable and writable through ``meter_readings``,
+    so the queries below need no changes.
+    """
+    # Existing hypertables keep their chunks; only new ones get the width.
+    cur.execute(
+        "SELECT set_chunk_time_interval('meter_readings', %s::interval);",
+        (CHUNK_TIME_INTERVAL,),
+    )
+
+    cur.execute(
+        "SELECT remove_compression_policy('meter_readings', if_exists => TRUE);"
+    )
+    if COMPRESSION:
+        # Altering the settings fails once chunks are compressed, so only
+        # enable compression the first time.
+        cur.execute("""
+            SELECT compression_enabled FROM timescaledb_information.hypertables
+            WHERE hypertable_name = 'meter_readings';
+        """)
+        row = cur.fetchone()
+        if not (row and row[0]):
+            # One compressed segment per meter, ordered like the reads scan it.
+            cur.execute("""
+                ALTER TABLE meter_readings SET (
+                    timescaledb.compress,
+                    timescaledb.compress_segmentby = 'meter_id',
+                    timescaledb.compress_orderby   = 'time DESC'
+                );
+            """)
+        cur.execute(
+            "SELECT add_compression_policy('meter_readings', %s::interval);",
+            (COMPRESS_AFTER,),
+        )
+
+    # Retention runs as a job of its own rather than a retention policy, so
+    # the daily summary and the data version follow the dropped chunks.
+    cur.execute("SELECT remove_retention_policy('meter_readings', if_exists => TRUE);")
+    cur.execute(
+        "SELECT delete_job(job_id) FROM timescaledb_information.jobs"
+        " WHERE proc_name = 'meter_readings_retention';"
+    )
+    if RETENTION:
+        cur.execute(_RETENTION_PROCEDURE_SQL)
+        cur.execute(
+            "SELECT add_job('meter_readings_retention', '1 day',"
+            " config => jsonb_build_object('drop_after', %s::text));",
+            (RETENTION,),
+        )
+
+
+# Drops the chunks past the retention horizon and the summary days no raw
+# chunk covers any more, and bumps the data version if anything went.
+_RETENTION_PROCEDURE_SQL = """
+    CREATE OR REPLACE PROCEDURE meter_readings_retention(job_id INT, config JSONB)
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        dropped INT;
+    BEGIN
+        SELECT count(*) INTO dropped FROM drop_chunks(
+            'meter_readings', older_than => (config->>'drop_after')::interval
+        );
+        IF dropped > 0 THEN
+            DELETE FROM meter_daily_summary
+            WHERE day + interval '1 day' <= coalesce(
+                (SELECT min(range_start) FROM timescaledb_information.chunks
+                 WHERE hypertable_name = 'meter_readings'),
+                'infinity'
+            );
+            UPDATE data_version SET version = version + 1;
+        END IF;
+    END
+    $$;
+"""
+
+
+def _compress_chunks(cur) -> None:
+    """Compress every chunk already past ``COMPRESS_AFTER``.
+
+    The policy job only runs periodically; calling this after a seed makes
+    loaded history compact right away.
+    """
+    cur.execute(
+        """
+        SELECT count(compress_chunk(
+            format('%%I.%%I', chunk_schema, chunk_name)::regclass
+        ))
+        FROM timescaledb_information.chunks
+        WHERE hypertable_name = 'meter_readings'
+          AND NOT is_compressed
+          AND range_end < now() - %s::interval;
+        """,
+        (COMPRESS_AFTER,),
+    )
+    compressed = cur.fetchone()[0]
+    cur.connection.commit()
+    if compressed:
+        log.info("Compressed %d chunks older than %s.", compressed, COMPRESS_AFTER)
+
+
+def seed_db(adopt: bool = False) -> None:
+    """Load the ``CSV_PATH`` files not loaded yet, then refresh the rollups.
+
+    ``CSV_PATH`` names a file, a directory of ``.csv`` files or a glob.
+    Safe to run while the server is answering RPCs: every batch commits on
+    its own and drops the cached responses it may have made stale. With
+    ``adopt``, as returned by :func:`setup_db`, the seed file is recorded as
+    loaded instead.
+    """
+    paths = _seed_paths(CSV_PATH)
+    if not paths:
+        log.warning("No seed file matches %s – skipping seed.", CSV_PATH)
+    conn = get_conn()
+    cur = None
+    try:
+        cur = conn.cursor()
+        pending = _pending_sources(cur, paths)
+        # Only read; don't sit idle in a transaction while the files load.
+        conn.commit()
+        if pending:
+            _seed_files(pending, adopt=adopt)
+        if ANOMALY_DETECTION:
+            _detect_backlog(cur)
+        if COMPRESSION:
+            _compress_chunks(cur)
+        if CONTINUOUS_AGGREGATES:
+            _refresh_rollups(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if cur is not None:
+            cur.close()
+        put_conn(conn)
+
+
+def _create_rollups(cur) -> None:
+    """Create the continuous aggregates and their refresh policies.
+
+    Rollups created before ``meter_id`` existed are dropped and created
+    again, empty; :func:`seed_db` materializes them.
+    """
+    for view, width, start_offset in ROLLUPS:
+        cur.execute(
+            "SELECT to_regclass(%s) IS NOT NULL AND NOT EXISTS ("
+            " SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass(%s)"
+            " AND attname = 'meter_id' AND NOT attisdropped);",
+            (view, view),
+        )
+        if cur.fetchone()[0]:
+            log.warning("Recreating %s, which predates meter_id.", view)
+            cur.execute(f"DROP MATERIALIZED VIEW {view} CASCADE;")
+        sql = f"""
+            CREATE MATERIALIZED VIEW IF NOT EXISTS {view}
+            WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+            SELECT time_bucket(%s::interval, time) AS bucket,
+                   meter_id,
+                   sum(meterusage)         AS total,
+                   count(*)                AS readings,
+                   min(meterusage)         AS minimum,
+                   max(meterusage)         AS maximum,
+                   last(meterusage, time)  AS latest
+            FROM meter_readings
+            GROUP BY bucket, meter_id
+            WITH NO DATA;
+        """
+        cur.execute(sql, (width,))
+        cur.execute(
+            """
+            SELECT add_continuous_aggregate_policy(%s,
+                start_offset      => %s,
+                end_offset        => %s,
+                schedule_interval => %s,
+                if_not_exists     => TRUE
+            );
+            """,
+            (view, start_offset, width, width),
+        )
+
+
+def _refresh_rollups(conn) -> None:
+    """Materialize everything the refresh policies' windows do not cover.
+
+    The policies only refresh recent buckets, so seeded history has to be
+    materialized once here. ``refresh_continuous_aggregate`` cannot run inside
+    a transaction block, hence autocommit; whatever the caller left open (a
+    read that did not commit) is committed first, as psycopg2 refuses to
+    switch inside a transaction. Regions that are already up to date are
+    skipped by TimescaleDB, so this is cheap on subsequent boots.
+    """
+    conn.commit()
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        for view, _, _ in ROLLUPS:
+            cur.execute("CALL refresh_continuous_aggregate(%s, NULL, NULL);", (view,))
+    finally:
+        cur.close()
+        conn.autocommit = False
+    log.info("Refreshed continuous aggregates.")
+
+
+class _CopyStream:
+    """Read-only file object that renders reading rows as CSV lines.
+
+    Lets ``copy_expert`` pull rows lazily from any iterable, so nothing larger
+    than one read buffer is materialized. ``count`` is the number of rows
+    consumed so far.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._pending = ""
+        self.count = 0
+
+    def read(self, size: int = -1) -> str:
+        parts, length = [self._pending], len(self._pending)
+        while size < 0 or length < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = "%s,%r,%s\n" % row
+            parts.append(line)
+            length += len(line)
+            self.count += 1
+        data = "".join(parts)
+        if size < 0:
+            self._pending = ""
+            return data
+        self._pending = data[size:]
+        return data[:size]
+
+
+_BACKFILL_SUMMARY_SQL = (
+    f"INSERT INTO meter_daily_summary SELECT {DAILY_AGGREGATES}"
+    " FROM meter_readings GROUP BY 1, 2;"
+)
+
+
+def _copy_rows(cur, rows) -> int:
+    """COPY ``(time, meterusage, meter_id)`` rows into the hypertable.
+
+    The rows are copied into a staging table first, so the statement that
+    moves them into ``meter_readings`` also updates ``meter_daily_summary``.
+    With ``ANOMALY_DETECTION`` they are then checked for gaps and spikes.
+    Returns the number of rows copied.
+    """
+    if ANOMALY_DETECTION:
+        rows = list(rows)
+    stream = _CopyStream(rows)
+    _copy_staging(cur, stream)
+    if stream.count:
+        cur.execute(MERGE_STAGING_SQL)
+        if ANOMALY_DETECTION:
+            _detect_anomalies(cur, rows)
+    return stream.count
+
+
+def _copy_lines(cur, lines: list[str]) -> int:
+    """COPY CSV lines written by :func:`_clean_file` into the hypertable.
+
+    Like :func:`_copy_rows`, without anomaly detection: seed files load
+    concurrently and out of time order, so :func:`_detect_backlog` catches
+    up afterwards from the spans logged here. Returns the number of rows
+    copied.
+    """
+    if lines:
+        _copy_staging(cur, io.StringIO("".join(lines)))
+        cur.execute(MERGE_STAGING_SQL)
+        if ANOMALY_DETECTION:
+            cur.execute(_LOG_SEED_SPANS_SQL)
+    return len(lines)
+
+
+def _copy_staging(cur, stream) -> None:
+    cur.execute(CREATE_STAGING_SQL)
+    cur.copy_expert(
+        "COPY meter_readings_staging (time, meterusage, meter_id)"
+        " FROM STDIN WITH (FORMAT csv);",
+        stream,
+    )
+
+
+def _detect_anomalies(cur, rows) -> None:
+    """Run freshly written rows through the anomaly detector.
+
+    The meters' detector state is loaded, advanced over the rows and saved
+    in the caller's transaction together with what it flagged, so detection
+    is incremental and a rolled-back write leaves no trace. Rows at or
+    before a meter's state are late: the stored readings around them are
+    detected again first (see :func:`_rescan`).
+    """
+    readings, meters = anomaly_readings(rows)
+    with stage("detect"):
+        cur.execute(LOCK_METERS_SQL, (meters,))
+        cur.execute(LOCK_ANOMALY_STATE_SQL, (meters,))
+        states = {state[0]: state for state in cur.fetchall()}
+        for meter_id, first, last in late_spans(readings, states):
+            rescan = _rescan(cur, meter_id, first, last, states[meter_id][1])
+            states[meter_id] = rescan.state() or states[meter_id]
+        detector = AnomalyDetector(states.values())
+        flagged = detector.run(readings)
+        if flagged:
+            cur.executemany(INSERT_ANOMALY_SQL, flagged)
+        cur.executemany(SAVE_ANOMALY_STATE_SQL, detector.states())
+
+
+# Readings of one meter after its detector state, in time order.
+_UNDETECTED_SQL = (
+    "SELECT time, meterusage, meter_id FROM meter_readings"
+    " WHERE meter_id = %s AND time > %s ORDER BY time;"
+)
+
+
+_LOG_SEED_SPANS_SQL = (
+    "INSERT INTO meter_seed_spans (meter_id, first_time, last_time)"
+    " SELECT meter_id, min(time), max(time) FROM meter_readings_staging"
+    " GROUP BY meter_id;"
+)
+# Takes the spans logged for one meter so far, merged into one.
+_CLAIM_SEED_SPANS_SQL = """
+    WITH claimed AS (
+        DELETE FROM meter_seed_spans WHERE meter_id = %s
+        RETURNING first_time, last_time
+    )
+    SELECT min(first_time), max(last_time) FROM claimed;
+"""
+
+
+def _rescan(cur, meter_id: str, first: datetime, last: datetime, end) -> Rescan:
+    """Detect the anomalies of ``meter_id`` again around readings written late.
+
+    Readings in ``[first, last]`` were written after detection had passed
+    them, so gaps they fill and spikes scored without them are stale. The
+    anomalies the replay covers are deleted and flagged again in the
+    caller's transaction.
+    """
+    cur.execute(WINDOW_BEFORE_SQL, (meter_id, first, ANOMALY_WINDOW))
+    rescan = Rescan(meter_id, last, end, cur.fetchall())
+    while True:
+        cur.execute(RESCAN_PAGE_SQL, (meter_id, rescan.until, end, STREAM_ITERSIZE))
+        if rescan.feed(cur.fetchall()):
+            break
+    cur.execute(DELETE_ANOMALIES_SQL, (meter_id, rescan.after, rescan.until))
+    if rescan.flagged:
+        cur.executemany(INSERT_ANOMALY_SQL, rescan.flagged)
+    return rescan
+
+
+def _detect_backlog(cur) -> None:
+    """Run stored readings that detection has not seen yet through it.
+
+    Seed files written behind a meter's saved state are rescanned first
+    (see :func:`_rescan`). Then the meter's readings after its state are fed
+    in time order through a server-side cursor, ``STREAM_ITERSIZE`` at a
+    time, and the meter's state and anomalies are committed together. When
+    anomalies were flagged, the commit also bumps the data version and the
+    meter's cached responses are dropped, as for any other write; so they
+    are after a rescan, which may only have deleted stale gaps. Meters that
+    are up to date cost two indexed lookups.
+    """
+    conn = cur.connection
+    cur.execute(LIST_METERS_SQL)
+    for (meter_id,) in cur.fetchall():
+        with stage("detect"):
+            cur.execute(LOCK_METERS_SQL, ([meter_id],))
+            cur.execute(LOCK_ANOMALY_STATE_SQL, ([meter_id],))
+            states = cur.fetchall()
+            cur.execute(_CLAIM_SEED_SPANS_SQL, (meter_id,))
+            first, last = cur.fetchone()
+            fed = flagged = 0
+            # A rescan may delete anomalies without flagging new ones.
+            rescanned = bool(states) and first is not None and first <= states[0][1]
+            if rescanned:
+                end = states[0][1]
+                rescan = _rescan(cur, meter_id, first, min(last, end), end)
+                fed, flagged = rescan.fed, len(rescan.flagged)
+                states = [rescan.state() or states[0]]
+            detector = AnomalyDetector(states)
+            since = states[0][1] if states else NEVER
+            readings = conn.cursor(name="meter_readings_backlog")
             try:
-                val = float(row["meterusage"])
-                if not math.isnan(val):
-                    rows.append((row["time"], val))
-            except (ValueError, KeyError):
-                pass
-    cur.executemany(
-        "INSERT INTO meter_readings (time, meterusage) VALUES (%s, %s);", rows
+                readings.execute(_UNDETECTED_SQL, (meter_id, since))
+                while batch := readings.fetchmany(STREAM_ITERSIZE):
+                    fed += len(batch)
+                    anomalies = detector.run(batch)
+                    if anomalies:
+                        flagged += len(anomalies)
+                        cur.executemany(INSERT_ANOMALY_SQL, anomalies)
+            finally:
+                readings.close()
+            if fed:
+                cur.executemany(SAVE_ANOMALY_STATE_SQL, detector.states())
+                log.info("Ran anomaly detection over %d readings of %s.", fed, meter_id)
+            if flagged or rescanned:
+                cur.execute(BUMP_VERSION_SQL)
+            conn.commit()
+            if flagged or rescanned:
+                response_cache.invalidate(meter_ids=[meter_id])
+
+
+def parse_reading(time, value, meter_id=None) -> tuple[str, float, str] | None:
+    """Validate one reading; return ``(time, value, meter_id)`` or None if unusable.
+
+    ``time`` must be an ISO 8601 string and ``value`` a number other than NaN.
+    The time is returned re-rendered with an explicit offset (naive times
+    are UTC), because ``fromisoformat`` accepts forms Postgres does not,
+    some with a comma (``00:00:00,5``) that would split the COPY line.
+    A missing ``meter_id`` falls back to ``DEFAULT_METER_ID``. Meter ids are
+    written to CSV unquoted, so ids containing CSV metacharacters are
+    rejected.
+    """
+    try:
+        val = float(value)
+        dt = datetime.fromisoformat(time)
+    except (ValueError, TypeError):
+        return None
+    if math.isnan(val):
+        return None
+    meter_id = meter_id or DEFAULT_METER_ID
+    if any(c in meter_id for c in ',"\r\n'):
+        return None
+    return as_utc(dt).isoformat(" "), val, meter_id
+
+
+def _iter_csv_rows(path: str) -> Iterator[tuple[str, float, str]]:
+    """Yield valid reading rows, skipping NaN and unparseable ones.
+
+    The ``meter_id`` column is optional; files without it belong to the
+    default meter.
+    """
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            reading = parse_reading(
+                row.get("time"), row.get("meterusage"), row.get("meter_id")
+            )
+            if reading is not None:
+                yield reading
+
+
+def insert_readings(rows) -> int:
+    """Write a sequence of validated ``(time, meterusage, meter_id)`` rows.
+
+    The rows are copied in one transaction; cached responses overlapping the
+    written time span and meters are invalidated once it commits.
+    """
+    with stage("acquire"):
+        conn = get_conn()
+    cur = None
+    try:
+        cur = conn.cursor()
+        with stage("copy"):
+            count = _copy_rows(cur, rows)
+            if count:
+                cur.execute(BUMP_VERSION_SQL)
+            conn.commit()
+        if count:
+            times = [as_utc(row[0]) for row in rows]
+            response_cache.invalidate(min(times), max(times), {row[2] for row in rows})
+        return count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if cur is not None:
+            cur.close()
+        put_conn(conn)
+
+
+def _file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _seed_paths(pattern: str) -> list[str]:
+    """Expand ``CSV_PATH``: a file, every ``*.csv`` in a directory, or a glob."""
+    if os.path.isfile(pattern):
+        return [pattern]
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.csv")
+    return sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+
+
+def _source(path: str) -> tuple[str, int, float]:
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime
+
+
+def _pending_sources(cur, paths: list[str]) -> list[str]:
+    """Return the ``paths`` that ``seed_state`` does not record as loaded.
+
+    A completed entry with the same path, size and mtime skips even the
+    hashing, so a restart costs one query however many files there are.
+    """
+    cur.execute("SELECT source, size, mtime FROM seed_state WHERE completed;")
+    loaded = set(cur.fetchall())
+    pending = [path for path in paths if _source(path) not in loaded]
+    if len(pending) < len(paths):
+        log.info(
+            "%d of %d seed files are already loaded.",
+            len(paths) - len(pending),
+            len(paths),
+        )
+    return pending
+
+
+def _clean_file(path: str, cleaned: str) -> str:
+    """Write the valid rows of ``path`` to ``cleaned`` as COPY-ready CSV lines.
+
+    Runs in a seed worker process, so parsing and validation use every core.
+    Returns the checksum of ``path``.
+    """
+    checksum = _file_checksum(path)
+    stream = _CopyStream(_iter_csv_rows(path))
+    with open(cleaned, "w") as f:
+        while chunk := stream.read(1 << 16):
+            f.write(chunk)
+    return checksum
+
+
+def _seed_files(paths: list[str], adopt: bool = False) -> None:
+    """Parse ``paths`` in a process pool and load them concurrently.
+
+    Each file is cleaned by :func:`_clean_file` into a temporary file, which
+    a loader thread then copies in over its own pool connection, so the
+    backfill scales with cores rather than files. Loaders take at most half
+    of the ``DB_POOL_MAX_CONN`` connections, so reads are still served while
+    a backfill runs. A file that fails is logged and the others still load;
+    the seed then fails as a whole, so the next start retries it.
+    """
+    workers = min(SEED_WORKERS or os.cpu_count() or 1, len(paths))
+    loaders = max(1, min(workers, DB_POOL_MAX_CONN // 2))
+    log.info(
+        "Seeding %d files with %d parsers and %d loaders …",
+        len(paths),
+        workers,
+        loaders,
     )
-    log.info("Inserted %d rows.", len(rows))
+    failed = 0
+    # Forking a process that runs gRPC threads is unsafe; spawn fresh workers.
+    context = multiprocessing.get_context("spawn")
+    with (
+        tempfile.TemporaryDirectory(prefix="seed-") as tmp,
+        futures.ProcessPoolExecutor(workers, mp_context=context) as parsers,
+        futures.ThreadPoolExecutor(loaders, thread_name_prefix="seed") as pool,
+    ):
+        cleaned = {}
+        for i, path in enumerate(paths):
+            target = os.path.join(tmp, "%d.csv" % i)
+            cleaned[parsers.submit(_clean_file, path, target)] = (path, target)
+        loads = {
+            pool.submit(_load_file, *cleaned[parsed], parsed, adopt): cleaned[parsed][0]
+            for parsed in futures.as_completed(cleaned)
+        }
+        for done, load in enumerate(futures.as_completed(loads), 1):
+            try:
+                load.result()
+            except Exception:
+                failed += 1
+                log.exception("Seeding %s failed.", loads[load])
+            log.info("Seeded %d of %d files.", done, len(paths))
+    if failed:
+        raise RuntimeError("%d of %d seed files failed to load." % (failed, len(paths)))
 
 
-def get_readings() -> list[tuple]:
-    """Return all meter readings ordered by time."""
+def _load_file(path: str, cleaned: str, parsed, adopt: bool = False) -> None:
+    """Load one cleaned seed file over a connection of its own."""
+    checksum = parsed.result()
     conn = get_conn()
     cur = None
     try:
         cur = conn.cursor()
-        cur.execute("SELECT time, meterusage FROM meter_readings ORDER BY time;")
-        return cur.fetchall()
+        _seed_source(cur, path, cleaned, checksum, adopt)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if cur is not None:
+            cur.close()
+        put_conn(conn)
+        # Frees the disk space before the other files finish.
+        os.unlink(cleaned)
+
+
+_SEED_STATE_SQL = "SELECT rows_loaded, completed FROM seed_state WHERE checksum = %s;"
+
+
+def _seed_source(
+    cur, path: str, cleaned: str, checksum: str, adopt: bool = False
+) -> None:
+    """Load ``cleaned``, the valid rows of ``path``, unless already loaded.
+
+    Files are identified by content checksum, so a moved or touched file is
+    not loaded twice. An interrupted load resumes after the last committed
+    batch. With ``adopt``, a new file is recorded as loaded: the database was
+    seeded from it before ``seed_state`` existed.
+    """
+    cur.execute(_SEED_STATE_SQL, (checksum,))
+    state = cur.fetchone()
+    source = _source(path)
+    if state is None:
+        # A concurrent loader may record an identical file first; its row
+        # then decides whether this one is already seeded or resumes.
+        cur.execute(
+            "INSERT INTO seed_state (checksum, source, size, mtime, completed)"
+            " VALUES (%s, %s, %s, %s, %s) ON CONFLICT (checksum) DO NOTHING"
+            " RETURNING rows_loaded, completed;",
+            (checksum, *source, adopt),
+        )
+        state = cur.fetchone()
+        if state is None:
+            cur.execute(_SEED_STATE_SQL, (checksum,))
+            state = cur.fetchone()
+    else:
+        cur.execute(
+            "UPDATE seed_state SET source = %s, size = %s, mtime = %s"
+            " WHERE checksum = %s;",
+            (*source, checksum),
+        )
+    cur.connection.commit()
+
+    rows_loaded, completed = state
+    if completed:
+        log.info("%s is already loaded – skipping it.", path)
+        return
+    _seed(cur, path, cleaned, checksum, rows_loaded)
+    cur.execute(
+        "UPDATE seed_state SET completed = TRUE, updated = now() WHERE checksum = %s;",
+        (checksum,),
+    )
+    cur.connection.commit()
+
+
+def _seed(cur, path: str, cleaned: str, checksum: str, skip: int = 0) -> None:
+    """Copy the lines of ``cleaned`` into the hypertable, committing every batch.
+
+    Each batch commits together with its ``seed_state`` progress, so after a
+    crash the first ``skip`` valid rows are known to be loaded and are not
+    copied again.
+    """
+    if skip:
+        log.info("Resuming seed from %s after %d rows …", path, skip)
+    else:
+        log.info("Seeding database from %s …", path)
+    total = skip
+    with open(cleaned) as f:
+        lines = islice(f, skip, None)
+        while inserted := _copy_lines(cur, list(islice(lines, SEED_BATCH_SIZE))):
+            cur.execute(BUMP_VERSION_SQL)
+            cur.execute(
+                "UPDATE seed_state SET rows_loaded = rows_loaded + %s,"
+                " updated = now() WHERE checksum = %s;",
+                (inserted, checksum),
+            )
+            cur.connection.commit()
+            # Reads are served while seeding, so drop what this batch made stale.
+            response_cache.clear()
+            total += inserted
+            log.info("%s: inserted %d rows so far.", path, total)
+    log.info("%s: inserted %d rows.", path, total)
+
+
+def get_readings(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+    after: datetime | None = None,
+    after_meter: str | None = None,
+    limit: int | None = None,
+    epoch_us: bool = False,
+) -> list[tuple]:
+    """Return ``(time, meterusage, meter_id)`` rows ordered by time and meter.
+
+    Rows are restricted to ``[start, end)``, to ``meter_ids`` when given, and
+    to positions after the ``(after, after_meter)`` keyset cursor.
+    """
+    sql, params = readings_query(
+        start, end, meter_ids, after, after_meter, limit, epoch_us
+    )
+    with stage("acquire"):
+        conn = get_read_conn()
+    cur = None
+    try:
+        cur = conn.cursor()
+        with stage("execute"):
+            cur.execute(sql, params)
+        with stage("fetch"):
+            return cur.fetchall()
+    finally:
+        if cur is not None:
+            cur.close()
+        put_conn(conn)
+
+
+def get_reading_columns(
+    meter_ids: list[str],
+    start: datetime | None = None,
+    end: datetime | None = None,
+    after: datetime | None = None,
+    after_meter: str | None = None,
+    limit: int | None = None,
+) -> tuple[list, list, list | None]:
+    """Return the readings of ``meter_ids`` as ``(epoch µs, values, meters)`` columns.
+
+    Same selection and order as ``get_readings(..., epoch_us=True)``, but
+    fetched with ``COPY ... TO STDOUT (FORMAT binary)`` and decoded in bulk,
+    so no tuple is built per row. ``meters`` is None for a single meter.
+    """
+    sql, params = columns_query(meter_ids, start, end, after, after_meter, limit)
+    with stage("acquire"):
+        conn = get_read_conn()
+    cur = None
+    try:
+        cur = conn.cursor()
+        buffer = io.BytesIO()
+        with stage("fetch"):
+            query = cur.mogrify(sql, params).decode()
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buffer)
+        with stage("decode"):
+            return unpack_columns(buffer.getbuffer(), meter_ids)
+    finally:
+        if cur is not None:
+            cur.close()
+        put_conn(conn)
+
+
+def iter_readings(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+    after: datetime | None = None,
+    after_meter: str | None = None,
+    limit: int | None = None,
+    epoch_us: bool = False,
+    itersize: int = STREAM_ITERSIZE,
+) -> Iterator[tuple]:
+    """Yield meter readings ordered by time through a server-side cursor.
+
+    Takes the same filters as :func:`get_readings`. Rows are fetched from
+    Postgres ``itersize`` at a time, so memory use is bounded by the batch
+    size rather than the size of the table.
+    """
+    sql, params = readings_query(
+        start, end, meter_ids, after, after_meter, limit, epoch_us
+    )
+    with stage("acquire"):
+        conn = get_read_conn()
+    cur = None
+    try:
+        cur = conn.cursor(name="meter_readings_stream")
+        cur.itersize = itersize
+        with stage("execute"):
+            cur.execute(sql, params)
+        yield from cur
+    finally:
+        if cur is not None:
+            cur.close()
+        put_conn(conn)
+
+
+def list_meters() -> list[str]:
+    """Return the distinct meter ids in ascending order.
+
+    The cost grows with the number of meters rather than the number of
+    readings (see ``LIST_METERS_SQL``).
+    """
+    with stage("acquire"):
+        conn = get_read_conn()
+    cur = None
+    try:
+        cur = conn.cursor()
+        with stage("execute"):
+            cur.execute(LIST_METERS_SQL)
+        with stage("fetch"):
+            return [row[0] for row in cur.fetchall()]
+    finally:
+        if cur is not None:
+            cur.close()
+        put_conn(conn)
+
+
+def data_version() -> str:
+    """Return an opaque version string of the stored readings.
+
+    It changes with every committed write through this module, so clients
+    can use it to validate cached results without counting rows.
+    """
+    with stage("acquire"):
+        conn = get_read_conn()
+    cur = None
+    try:
+        cur = conn.cursor()
+        with stage("execute"):
+            cur.execute(DATA_VERSION_SQL)
+        return format_version(cur.fetchone())
+    finally:
+        if cur is not None:
+            cur.close()
+        put_conn(conn)
+
+
+def aggregate_readings(
+    aggregate: str = "avg",
+    bucket_width: timedelta | None = None,
+    bucket_months: int = 0,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+) -> list[tuple]:
+    """Return ``(bucket_start, value, meter_id)`` rows, one per meter and bucket.
+
+    Buckets are computed with ``time_bucket``. When continuous aggregates are
+    enabled, the query is routed to the coarsest rollup view that can answer
+    it instead of the raw hypertable.
+    Exactly one of ``bucket_width`` or ``bucket_months`` must be given.
+    Raises ValueError for an unknown aggregate or a non-positive bucket.
+    """
+    sql, params = aggregate_query(
+        aggregate, bucket_width, bucket_months, start, end, meter_ids
+    )
+    with stage("acquire"):
+        conn = get_read_conn()
+    cur = None
+    try:
+        cur = conn.cursor()
+        with stage("execute"):
+            cur.execute(sql, params)
+        with stage("fetch"):
+            return cur.fetchall()
+    finally:
+        if cur is not None:
+            cur.close()
+        put_conn(conn)
+
+
+def get_summary(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+) -> list[tuple]:
+    """Return ``(meter_id, total, readings, min, max, peak_time)`` per meter.
+
+    Covers the readings in ``[start, end)`` of ``meter_ids`` (all meters when
+    empty); ``peak_time`` is the time of the highest reading. Meters without
+    readings in the window are left out.
+    """
+    sql, params = summary_query(start, end, meter_ids)
+    with stage("acquire"):
+        conn = get_read_conn()
+    cur = None
+    try:
+        cur = conn.cursor()
+        with stage("execute"):
+            cur.execute(sql, params)
+        with stage("fetch"):
+            return cur.fetchall()
+    finally:
+        if cur is not None:
+            cur.close()
+        put_conn(conn)
+
+
+def get_anomalies(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+    kinds: list[str] | None = None,
+    limit: int | None = None,
+) -> list[tuple]:
+    """Return flagged ``(meter_id, kind, start, end, value, score)`` intervals.
+
+    Intervals overlapping ``[start, end)`` are returned in start order,
+    restricted to ``meter_ids`` and ``kinds`` (``"gap"``, ``"spike"``) when
+    given.
+    """
+    sql, params = anomalies_query(start, end, meter_ids, kinds, limit)
+    with stage("acquire"):
+        conn = get_read_conn()
+    cur = None
+    try:
+        cur = conn.cursor()
+        with stage("execute"):
+            cur.execute(sql, params)
+        with stage("fetch"):
+            return cur.fetchall()
     finally:
         if cur is not None:
             cur.close()
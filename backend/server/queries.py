@@ -0,0 +1,536 @@
+import struct
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+from .anomaly import AnomalyDetector
+from .settings import CONTINUOUS_AGGREGATES, STREAM_ITERSIZE
+
+# SQL and query builders shared by the threaded (server.orm) and asyncio
+# (server.aio_orm) drivers; only the driver calls differ between them.
+
+
+# One row of meter_daily_summary per meter and UTC day of the selected
+# readings. last(time, meterusage) is the time of the highest reading.
+DAILY_AGGREGATES = (
+    "meter_id, time_bucket('1 day', time), sum(meterusage), count(*),"
+    " min(meterusage), max(meterusage), last(time, meterusage)"
+)
+
+
+# Session-local and emptied by every commit or rollback.
+CREATE_STAGING_SQL = (
+    "CREATE TEMP TABLE IF NOT EXISTS meter_readings_staging"
+    " (LIKE meter_readings INCLUDING DEFAULTS) ON COMMIT DELETE ROWS;"
+)
+
+
+# Moves the staged rows into the hypertable and adds the rows actually
+# inserted to the daily summary, in one statement of the write transaction.
+# Readings already stored for the same meter and time are skipped.
+MERGE_STAGING_SQL = f"""
+    WITH moved AS (
+        INSERT INTO meter_readings (time, meterusage, meter_id)
+        SELECT time, meterusage, meter_id FROM meter_readings_staging
+        ON CONFLICT DO NOTHING
+        RETURNING time, meterusage, meter_id
+    )
+    INSERT INTO meter_daily_summary AS s
+    SELECT {DAILY_AGGREGATES} FROM moved GROUP BY 1, 2
+    ON CONFLICT (meter_id, day) DO UPDATE SET
+        total     = s.total + EXCLUDED.total,
+        readings  = s.readings + EXCLUDED.readings,
+        minimum   = LEAST(s.minimum, EXCLUDED.minimum),
+        maximum   = GREATEST(s.maximum, EXCLUDED.maximum),
+        peak_time = CASE WHEN EXCLUDED.maximum > s.maximum
+                         THEN EXCLUDED.peak_time ELSE s.peak_time END;
+"""
+
+
+def as_utc(value) -> datetime:
+    dt = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+# Run in the same transaction as every write to meter_readings.
+BUMP_VERSION_SQL = "UPDATE data_version SET version = version + 1;"
+
+# created tells a recreated database apart from one that was never written.
+DATA_VERSION_SQL = (
+    "SELECT (extract(epoch FROM created) * 1000000)::bigint, version"
+    " FROM data_version;"
+)
+
+
+def format_version(row) -> str:
+    return "%x-%d" % tuple(row) if row else "0-0"
+
+
+# Makes concurrent writers of a meter take turns at detection, also before
+# the meter has a state row for FOR UPDATE to lock: its first two writers
+# would otherwise both start from an empty window. Transaction-scoped and
+# taken in meter order, so writers of several meters cannot deadlock. Run
+# on its own: the state read after it must see the previous writer's commit,
+# which a snapshot taken before the lock was granted would miss.
+LOCK_METERS_SQL = (
+    "SELECT pg_advisory_xact_lock(hashtext('meter_anomaly_state'), hashtext(m))"
+    " FROM (SELECT m FROM unnest(%s::text[]) AS m ORDER BY m) AS meters;"
+)
+LOCK_ANOMALY_STATE_SQL = (
+    "SELECT meter_id, last_time, recent FROM meter_anomaly_state"
+    " WHERE meter_id = ANY(%s) FOR UPDATE;"
+)
+
+INSERT_ANOMALY_SQL = (
+    "INSERT INTO meter_anomalies"
+    " (meter_id, kind, start_time, end_time, value, score)"
+    " VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING;"
+)
+
+SAVE_ANOMALY_STATE_SQL = (
+    "INSERT INTO meter_anomaly_state (meter_id, last_time, recent)"
+    " VALUES (%s, %s, %s) ON CONFLICT (meter_id) DO UPDATE"
+    " SET last_time = EXCLUDED.last_time, recent = EXCLUDED.recent;"
+)
+
+
+def anomaly_readings(rows) -> tuple[list[tuple], list[str]]:
+    """Return written rows as ``(datetime, value, meter_id)`` and their meters."""
+    readings = [(as_utc(time), value, meter_id) for time, value, meter_id in rows]
+    return readings, sorted({meter_id for _, _, meter_id in readings})
+
+
+def late_spans(readings, states: dict) -> list[tuple]:
+    """Return ``(meter_id, first, last)`` of the readings behind their meter's state."""
+    spans = {}
+    for time, _, meter_id in readings:
+        state = states.get(meter_id)
+        if state is not None and time <= state[1]:
+            first, last = spans.get(meter_id, (time, time))
+            spans[meter_id] = (min(first, time), max(last, time))
+    return [(meter_id, *span) for meter_id, span in sorted(spans.items())]
+
+
+NEVER = datetime.min.replace(tzinfo=timezone.utc)
+
+
+# The readings just before a rescan, newest first.
+WINDOW_BEFORE_SQL = (
+    "SELECT time, meterusage FROM meter_readings"
+    " WHERE meter_id = %s AND time < %s ORDER BY time DESC LIMIT %s;"
+)
+
+# One page of a meter's readings in (after, until], in time order.
+RESCAN_PAGE_SQL = (
+    "SELECT time, meterusage, meter_id FROM meter_readings"
+    " WHERE meter_id = %s AND time > %s AND time <= %s ORDER BY time LIMIT %s;"
+)
+
+DELETE_ANOMALIES_SQL = (
+    "DELETE FROM meter_anomalies"
+    " WHERE meter_id = %s AND start_time > %s AND start_time <= %s;"
+)
+
+
+class Rescan:
+    """Detection replayed over the stored readings of one meter around a late write.
+
+    Replay starts from the window of readings just before the late ones and
+    stops once the window has moved ``ANOMALY_WINDOW`` readings past them,
+    or at ``end``, the meter's detector state. Anomalies after that do not
+    depend on the late readings. The drivers feed it a page at a time.
+    """
+
+    def __init__(self, meter_id: str, last: datetime, end: datetime, before) -> None:
+        self.meter_id = meter_id
+        self.last = last
+        self.end = end
+        self.after = before[0][0] if before else NEVER
+        recent = [value for _, value in reversed(before)]
+        self.detector = AnomalyDetector(
+            [(meter_id, self.after, recent)] if before else ()
+        )
+        # Replayed up to here; anomalies starting in (after, until] are redone.
+        self.until = self.after
+        self.flagged: list[tuple] = []
+        self.fed = 0
+        self._past = 0
+
+    def feed(self, page) -> bool:
+        """Replay a page of ``(time, value, meter_id)`` readings; True when done."""
+        for time, value, meter_id in page:
+            self.flagged += self.detector.feed(time, value, meter_id)
+            self.fed += 1
+            self.until = time
+            if time > self.last:
+                self._past += 1
+                if self._past == self.detector.window:
+                    return True
+        return len(page) < STREAM_ITERSIZE
+
+    def state(self) -> tuple | None:
+        """Return the meter's new detector state if replay reached ``end``."""
+        if self.until != self.end:
+            return None
+        return self.detector.states()[0]
+
+
+# SQL aggregate expression per AggregateMetrics aggregate name.
+_AGGREGATES = {
+    "avg": "avg(meterusage)",
+    "min": "min(meterusage)",
+    "max": "max(meterusage)",
+    "sum": "sum(meterusage)",
+    "count": "count(*)",
+    "last": "last(meterusage, time)",
+}
+
+
+# The same aggregates recombined from the partial aggregates of a rollup view.
+_ROLLUP_AGGREGATES = {
+    "avg": "sum(total) / sum(readings)",
+    "min": "min(minimum)",
+    "max": "max(maximum)",
+    "sum": "sum(total)",
+    "count": "sum(readings)",
+    "last": "last(latest, bucket)",
+}
+
+
+# Continuous aggregates, finest first: (view, bucket width, policy start_offset).
+ROLLUPS = (
+    ("meter_readings_hourly", timedelta(hours=1), timedelta(days=3)),
+    ("meter_readings_daily", timedelta(days=1), timedelta(days=7)),
+)
+
+
+# Default origin of time_bucket() for fixed-width buckets.
+_BUCKET_ORIGIN = datetime(2000, 1, 3, tzinfo=timezone.utc)
+
+
+def _filters(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+    after: datetime | None = None,
+    after_meter: str | None = None,
+    column: str = "time",
+) -> tuple[list[str], list]:
+    """Build WHERE clauses for the time window, meter selection and keyset cursor.
+
+    A single meter compiles to ``meter_id = %s`` so Postgres walks only that
+    meter's range of the ``(meter_id, time)`` index. The keyset cursor is
+    ``(after, after_meter)`` in ``ORDER BY time, meter_id`` order; without
+    ``after_meter`` it degrades to ``time > after``.
+    """
+    clauses, params = [], []
+    if start is not None:
+        clauses.append(f"{column} >= %s")
+        params.append(start)
+    if end is not None:
+        clauses.append(f"{column} < %s")
+        params.append(end)
+    if meter_ids:
+        if len(meter_ids) == 1:
+            clauses.append("meter_id = %s")
+            params.append(meter_ids[0])
+        else:
+            clauses.append("meter_id = ANY(%s)")
+            params.append(list(meter_ids))
+    if after is not None:
+        if after_meter is None:
+            clauses.append(f"{column} > %s")
+            params.append(after)
+        else:
+            # The plain bound keeps chunk exclusion; the row comparison breaks
+            # ties between meters reporting at the same instant.
+            clauses.append(f"{column} >= %s AND ({column}, meter_id) > (%s, %s)")
+            params.extend([after, after, after_meter])
+    return clauses, params
+
+
+def _pick_rollup(
+    bucket_width: timedelta | None,
+    bucket_months: int,
+    start: datetime | None,
+    end: datetime | None,
+) -> str | None:
+    """Return the coarsest rollup view that answers the request exactly.
+
+    A view qualifies when the requested bucket is a whole multiple of its
+    width (calendar months are whole days) and the window boundaries fall on
+    its bucket edges, so no partial view bucket leaks outside the window.
+    """
+    if not CONTINUOUS_AGGREGATES:
+        return None
+    for view, width, _ in reversed(ROLLUPS):
+        if bucket_months:
+            fits = width <= timedelta(days=1)
+        else:
+            fits = bucket_width % width == timedelta(0)
+        aligned = all(
+            t is None or (t - _BUCKET_ORIGIN) % width == timedelta(0)
+            for t in (start, end)
+        )
+        if fits and aligned:
+            return view
+    return None
+
+
+# extract() returns numeric, so microseconds survive exactly.
+_EPOCH_US_SQL = "(extract(epoch FROM time) * 1000000)::bigint"
+
+
+def readings_query(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+    after: datetime | None = None,
+    after_meter: str | None = None,
+    limit: int | None = None,
+    epoch_us: bool = False,
+) -> tuple[str, list]:
+    """Build the readings SELECT with all filters pushed into SQL.
+
+    Bounding ``time`` lets TimescaleDB exclude whole chunks and walk the time
+    index; ``after``/``after_meter`` is the keyset cursor used for pagination.
+    With ``epoch_us`` the time column is returned as integer Unix
+    microseconds, which skips building a ``datetime`` per row in the driver.
+    """
+    clauses, params = _filters(start, end, meter_ids, after, after_meter)
+
+    time_col = _EPOCH_US_SQL if epoch_us else "time"
+    sql = f"SELECT {time_col}, meterusage, meter_id FROM meter_readings"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY time, meter_id"
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql + ";", params
+
+
+# Binary COPY layout: an 11-byte signature, flags and header-extension
+# length, then per row a field count and a length before every field, and a
+# -1 field count as trailer.
+_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+# Row layouts: (count, len, epoch µs, len, value[, len, meter index]).
+_ROW_FIELDS = {1: "hiqid", 2: "hiqidii"}
+
+# Rows decoded per struct call.
+_UNPACK_BLOCK = 1024
+
+
+@lru_cache(maxsize=64)
+def _rows_struct(fields: str, rows: int) -> struct.Struct:
+    return struct.Struct(">" + fields * rows)
+
+
+def columns_query(
+    meter_ids: list[str],
+    start: datetime | None = None,
+    end: datetime | None = None,
+    after: datetime | None = None,
+    after_meter: str | None = None,
+    limit: int | None = None,
+) -> tuple[str, list]:
+    """Build the fixed-width SELECT behind :func:`server.orm.get_reading_columns`.
+
+    Meters are sent as their 1-based position in ``meter_ids`` (an int4) and
+    left out for a single meter, so every row has the same binary width.
+    """
+    clauses, params = _filters(start, end, meter_ids, after, after_meter)
+    columns = f"{_EPOCH_US_SQL}, meterusage"
+    if len(meter_ids) > 1:
+        columns += ", array_position(%s::text[], meter_id)"
+        params.insert(0, list(meter_ids))
+    sql = f"SELECT {columns} FROM meter_readings WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY time, meter_id"
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql, params
+
+
+def unpack_columns(data, meter_ids: list[str]) -> tuple[list, list, list | None]:
+    """Decode binary COPY output of :func:`columns_query` into columns.
+
+    Whole blocks of rows are unpacked by one precompiled struct, so no
+    Python code runs per row except mapping meter positions back to ids.
+    """
+    data = memoryview(data)
+    if bytes(data[:11]) != _COPY_SIGNATURE:
+        raise ValueError("Not binary COPY output.")
+    extension = int.from_bytes(data[15:19], "big")
+    body = data[19 + extension : -2]
+    fields = _ROW_FIELDS[min(len(meter_ids), 2)]
+    width = struct.calcsize(">" + fields)
+    rows, rest = divmod(len(body), width)
+    if rest:
+        raise ValueError("Unexpected binary COPY row layout.")
+
+    flat = []
+    whole = rows - rows % _UNPACK_BLOCK
+    for block in _rows_struct(fields, _UNPACK_BLOCK).iter_unpack(body[: whole * width]):
+        flat.extend(block)
+    flat.extend(_rows_struct(fields, rows - whole).unpack(body[whole * width :]))
+
+    step = len(fields)
+    times, values = flat[2::step], flat[4::step]
+    if len(meter_ids) == 1:
+        return times, values, None
+    return times, values, [meter_ids[i - 1] for i in flat[6::step]]
+
+
+# Loose index scan: hop from one meter to the next through the
+# (meter_id, time) index instead of scanning every reading.
+LIST_METERS_SQL = """
+    WITH RECURSIVE meters AS (
+        (SELECT meter_id FROM meter_readings ORDER BY meter_id LIMIT 1)
+        UNION ALL
+        SELECT (
+            SELECT r.meter_id FROM meter_readings r
+            WHERE r.meter_id > meters.meter_id
+            ORDER BY r.meter_id LIMIT 1
+        )
+        FROM meters
+        WHERE meters.meter_id IS NOT NULL
+    )
+    SELECT meter_id FROM meters WHERE meter_id IS NOT NULL;
+"""
+
+
+def aggregate_query(
+    aggregate: str = "avg",
+    bucket_width: timedelta | None = None,
+    bucket_months: int = 0,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+) -> tuple[str, list]:
+    """Build the bucketed SELECT for :func:`server.orm.aggregate_readings`.
+
+    Raises ValueError for an unknown aggregate or a non-positive bucket.
+    """
+    if aggregate not in _AGGREGATES:
+        raise ValueError("Unknown aggregate %r." % aggregate)
+    if bucket_months > 0 and bucket_width is None:
+        bucket = "%d months" % bucket_months
+    elif bucket_width is not None and bucket_width > timedelta(0) and not bucket_months:
+        bucket = bucket_width
+    else:
+        raise ValueError("Exactly one positive bucket width is required.")
+
+    view = _pick_rollup(bucket_width, bucket_months, start, end)
+    if view is None:
+        table, column, expr = "meter_readings", "time", _AGGREGATES[aggregate]
+    else:
+        table, column, expr = view, "bucket", _ROLLUP_AGGREGATES[aggregate]
+
+    clauses, params = _filters(start, end, meter_ids, column=column)
+    sql = (
+        f"SELECT time_bucket(%s::interval, {column}) AS bucket_start, {expr},"
+        f" meter_id FROM {table}"
+    )
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " GROUP BY bucket_start, meter_id ORDER BY bucket_start, meter_id;"
+    return sql, [bucket, *params]
+
+
+_DAY = timedelta(days=1)
+
+# Partial aggregates of raw readings, shaped like meter_daily_summary rows.
+_RAW_PARTIALS_SQL = (
+    "SELECT meter_id, sum(meterusage) AS total, count(*) AS readings,"
+    " min(meterusage) AS minimum, max(meterusage) AS maximum,"
+    " last(time, meterusage) AS peak_time FROM meter_readings"
+)
+_ROLLUP_PARTIALS_SQL = (
+    "SELECT meter_id, total, readings, minimum, maximum, peak_time"
+    " FROM meter_daily_summary"
+)
+
+
+def _day_floor(t: datetime) -> datetime:
+    return t.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _day_ceil(t: datetime) -> datetime:
+    floor = _day_floor(t)
+    return floor if floor == t else floor + _DAY
+
+
+def summary_query(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+) -> tuple[str, list]:
+    """Build the SELECT for :func:`server.orm.get_summary`.
+
+    Whole UTC days inside ``[start, end)`` come from ``meter_daily_summary``
+    and only the partial days at either edge are aggregated from raw
+    readings, so the cost grows with the number of days, not readings. All
+    parts have the same columns and are combined per meter.
+    """
+    first = None if start is None else _day_ceil(start)
+    last = None if end is None else _day_floor(end)
+    parts, params = [], []
+
+    def part(sql, lo, hi, column="time", group=""):
+        clauses, values = _filters(lo, hi, meter_ids, column=column)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        parts.append(sql + group)
+        params.extend(values)
+
+    raw = " GROUP BY meter_id"
+    if first is not None and last is not None and first > last:
+        # The window lies within a single day.
+        part(_RAW_PARTIALS_SQL, start, end, group=raw)
+    else:
+        part(_ROLLUP_PARTIALS_SQL, first, last, column="day")
+        if start is not None and start < first:
+            part(_RAW_PARTIALS_SQL, start, first, group=raw)
+        if end is not None and last < end:
+            part(_RAW_PARTIALS_SQL, last, end, group=raw)
+
+    sql = (
+        "SELECT meter_id, sum(total), sum(readings)::bigint, min(minimum),"
+        " max(maximum), last(peak_time, maximum)"
+        f" FROM ({' UNION ALL '.join(parts)}) AS parts"
+        " GROUP BY meter_id ORDER BY meter_id;"
+    )
+    return sql, params
+
+
+def anomalies_query(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    meter_ids: list[str] | None = None,
+    kinds: list[str] | None = None,
+    limit: int | None = None,
+) -> tuple[str, list]:
+    """Build the SELECT for :func:`server.orm.get_anomalies`."""
+    clauses, params = _filters(meter_ids=meter_ids)
+    # Intervals overlapping the window, not only those starting in it.
+    if start is not None:
+        clauses.append("end_time > %s")
+        params.append(start)
+    if end is not None:
+        clauses.append("start_time < %s")
+        params.append(end)
+    if kinds:
+        clauses.append("kind = ANY(%s)")
+        params.append(list(kinds))
+    sql = (
+        "SELECT meter_id, kind, start_time, end_time, value, score"
+        " FROM meter_anomalies"
+    )
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY start_time, meter_id, kind"
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+    return sql + ";", params
@@ -0,0 +1,278 @@
+import base64
+import binascii
+from datetime import datetime, timezone
+from itertools import repeat
+from operator import floordiv
+
+import metrics_pb2
+
+from .cache import response_cache
+from .monitoring import observe_rows
+from .settings import DB_REPLICA_HOSTS, DB_REPLICA_MAX_LAG_SECONDS, EPOCH_TIMES
+from .telemetry import stage
+from .timefmt import TimeFormatter, from_epoch_us
+
+# Request parsing, response building and response caching shared by the
+# threaded (server.servicer) and asyncio (server.aio_servicer) servicers;
+# only the data access and single-flight calls differ between them.
+
+MetricsResponse = getattr(metrics_pb2, "MetricsResponse")
+IngestResponse = getattr(metrics_pb2, "IngestResponse")
+ListMetersResponse = getattr(metrics_pb2, "ListMetersResponse")
+DataVersionResponse = getattr(metrics_pb2, "DataVersionResponse")
+SummaryResponse = getattr(metrics_pb2, "SummaryResponse")
+AnomaliesResponse = getattr(metrics_pb2, "AnomaliesResponse")
+AnomalyKind = getattr(metrics_pb2, "AnomalyKind")
+Aggregate = getattr(metrics_pb2, "Aggregate")
+
+
+def encode_page_token(last_time, last_meter: str) -> str:
+    return base64.urlsafe_b64encode(f"{last_time}|{last_meter}".encode()).decode()
+
+
+def decode_page_token(token: str) -> tuple[datetime, str | None]:
+    """Return the ``(time, meter_id)`` keyset position encoded in ``token``.
+
+    Tokens issued before meters existed carry only a time.
+    """
+    raw = base64.urlsafe_b64decode(token.encode()).decode()
+    time, sep, meter = raw.partition("|")
+    return datetime.fromisoformat(time), meter if sep else None
+
+
+def request_selection(request) -> dict:
+    """Translate the time window and meter filter shared by read requests."""
+    selection = {}
+    if request.HasField("start"):
+        selection["start"] = request.start.ToDatetime(tzinfo=timezone.utc)
+    if request.HasField("end"):
+        selection["end"] = request.end.ToDatetime(tzinfo=timezone.utc)
+    if request.meter_ids:
+        selection["meter_ids"] = list(request.meter_ids)
+    return selection
+
+
+def parse_read_filters(request) -> dict:
+    """Translate the MetricsRequest selection and page token into orm filters.
+
+    Raises ValueError for a malformed page token.
+    """
+    filters = request_selection(request)
+    if request.page_token:
+        try:
+            filters["after"], filters["after_meter"] = decode_page_token(
+                request.page_token
+            )
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise ValueError("Invalid page_token.") from None
+    return filters
+
+
+def aggregate_filters(request) -> tuple[str, dict]:
+    """Return the aggregate name and orm filters for an AggregateRequest."""
+    filters = request_selection(request)
+    if request.WhichOneof("bucket") == "bucket_width":
+        filters["bucket_width"] = request.bucket_width.ToTimedelta()
+    else:
+        filters["bucket_months"] = request.bucket_months
+    return Aggregate.Name(request.aggregate).lower(), filters
+
+
+def anomaly_filters(request) -> dict:
+    """Return the orm filters for an AnomaliesRequest."""
+    filters = request_selection(request)
+    if request.kinds:
+        filters["kinds"] = sorted({AnomalyKind.Name(k).lower() for k in request.kinds})
+    if request.limit:
+        filters["limit"] = request.limit
+    return filters
+
+
+def anomaly_scope(filters: dict) -> dict:
+    """Cache invalidation scope for a GetAnomalies response.
+
+    A gap flagged by a write starts at the previous reading, before the
+    written rows, so writes to the meters invalidate every time window.
+    """
+    return {"meter_ids": filters.get("meter_ids")}
+
+
+def _add_point(response, row) -> None:
+    point = response.data.add()
+    point.time = str(row[0])
+    point.meterusage = float(row[1])
+    point.meter_id = row[2]
+
+
+def time_format(filters: dict, columnar: bool) -> dict:
+    """Ask the orm for integer µs times for columns and formatted points."""
+    if columnar or EPOCH_TIMES:
+        return {**filters, "epoch_us": True}
+    return filters
+
+
+def _epoch_ms(times):
+    """Truncate epoch µs to the ms of ``time_unix_ms``, without a Python loop.
+
+    Page tokens keep the exact µs: a rounded or truncated time would resume
+    before or after the row it names.
+    """
+    return map(floordiv, times, repeat(1000))
+
+
+def build_response(rows, columnar: bool = False, meter_column: bool = True):
+    with stage("build"):
+        response = MetricsResponse()
+        if columnar:
+            if rows:
+                # Rows hold (epoch µs, value, meter); transpose them straight
+                # into the packed columns without creating a message per point.
+                times, values, meters = zip(*rows)
+                response.columns.time_unix_ms.extend(_epoch_ms(times))
+                response.columns.meterusage.extend(values)
+                if meter_column:
+                    response.columns.meter_id.extend(meters)
+        elif rows and isinstance(rows[0][0], int):
+            # Epoch microseconds; see time_format().
+            format_time = TimeFormatter()
+            add = response.data.add
+            for time, value, meter_id in rows:
+                add(time=format_time(time), meterusage=value, meter_id=meter_id)
+        else:
+            for row in rows:
+                _add_point(response, row)
+    observe_rows(response)
+    return response
+
+
+def _page_token(last_time, last_meter: str) -> str:
+    if isinstance(last_time, int):
+        last_time = from_epoch_us(last_time)
+    return encode_page_token(last_time, last_meter)
+
+
+def page_response(request, rows):
+    """Build a GetMetrics page from up to ``limit + 1`` fetched rows.
+
+    The extra row only signals that another page exists; it is dropped and
+    the last returned row becomes the next page token.
+    """
+    limit = request.limit
+    next_page_token = ""
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        last_time, _, last_meter = rows[-1]
+        next_page_token = _page_token(last_time, last_meter)
+
+    response = build_response(
+        rows, request.columnar, meter_column=len(request.meter_ids) != 1
+    )
+    response.next_page_token = next_page_token
+    return response
+
+
+def columns_page_response(request, times, values, meters):
+    """:func:`page_response` for columns from ``get_reading_columns``.
+
+    The columns are copied into the packed fields with one ``extend`` each.
+    """
+    limit = request.limit
+    next_page_token = ""
+    if limit and len(times) > limit:
+        times, values = times[:limit], values[:limit]
+        meters = meters[:limit] if meters is not None else None
+        last_meter = meters[-1] if meters is not None else request.meter_ids[0]
+        next_page_token = _page_token(times[-1], last_meter)
+
+    with stage("build"):
+        response = MetricsResponse(next_page_token=next_page_token)
+        response.columns.time_unix_ms.extend(_epoch_ms(times))
+        response.columns.meterusage.extend(values)
+        if meters is not None:
+            response.columns.meter_id.extend(meters)
+    observe_rows(response)
+    return response
+
+
+def aggregate_response(rows):
+    with stage("build"):
+        response = MetricsResponse()
+        for row in rows:
+            _add_point(response, row)
+    observe_rows(response)
+    return response
+
+
+def summary_response(rows):
+    with stage("build"):
+        response = SummaryResponse()
+        for meter_id, total, readings, minimum, maximum, peak_time in rows:
+            response.summaries.add(
+                meter_id=meter_id,
+                total=total,
+                readings=readings,
+                mean=total / readings,
+                minimum=minimum,
+                maximum=maximum,
+                peak_time=str(peak_time),
+            )
+    return response
+
+
+def anomalies_response(rows):
+    with stage("build"):
+        response = AnomaliesResponse()
+        for meter_id, kind, start, end, value, score in rows:
+            response.anomalies.add(
+                meter_id=meter_id,
+                kind=AnomalyKind.Value(kind.upper()),
+                start=str(start),
+                end=str(end),
+                value=value or 0.0,
+                score=score,
+            )
+    return response
+
+
+def cache_lookup(context, key: tuple) -> bytes | None:
+    """Return cached bytes for ``key`` and report hit/miss via ``x-cache``."""
+    data = response_cache.get(key)
+    context.set_trailing_metadata((("x-cache", "miss" if data is None else "hit"),))
+    return data
+
+
+# Reads may come from a replica this far behind the writes invalidated.
+_READ_LAG = DB_REPLICA_MAX_LAG_SECONDS if DB_REPLICA_HOSTS else 0.0
+
+
+def cache_store(key: tuple, selection: dict, response, generation: int) -> bytes:
+    """Serialize ``response``, cache it under ``key`` and return the bytes.
+
+    ``generation`` is the cache's, taken before the query ran. Responses
+    overlapping a write invalidated within the replica lag bound are not
+    cached, since the replica that answered may not have had the write.
+    """
+    with stage("cache_store"):
+        data = response.SerializeToString()
+    response_cache.put(
+        key,
+        data,
+        selection.get("start"),
+        selection.get("end"),
+        selection.get("meter_ids"),
+        generation,
+        _READ_LAG,
+    )
+    return data
+
+
+def flight_result(context, response, data, shared: bool):
+    """Pick what a single-flight caller returns.
+
+    The caller that ran the query returns its message; callers that joined
+    it return the serialized bytes, so the response is serialized once.
+    """
+    if not shared:
+        return response
+    context.set_trailing_metadata((("x-cache", "shared"),))
+    return data
@@ -1,23 +1,158 @@
 import logging
+from itertools import islice
 
-import metrics_pb2
+import grpc
 import metrics_pb2_grpc
 
-from .orm import get_readings
+from .cache import cache_key, response_cache
+from .ingest import IngestBuffer
+from .orm import (
+    aggregate_readings,
+    data_version,
+    get_anomalies,
+    get_reading_columns,
+    get_readings,
+    get_summary,
+    iter_readings,
+    list_meters,
+)
+from .responses import (
+    DataVersionResponse,
+    IngestResponse,
+    ListMetersResponse,
+    aggregate_filters,
+    aggregate_response,
+    anomalies_response,
+    anomaly_filters,
+    anomaly_scope,
+    build_response,
+    cache_lookup,
+    cache_store,
+    columns_page_response,
+    flight_result,
+    page_response,
+    parse_read_filters,
+    request_selection,
+    summary_response,
+    time_format,
+)
+from .settings import STREAM_CHUNK_SIZE
+from .singleflight import flight
 
 log = logging.getLogger(__name__)
 
-MetricsResponse = getattr(metrics_pb2, "MetricsResponse")
+
+def _read_filters(request, context) -> dict:
+    try:
+        return parse_read_filters(request)
+    except ValueError as exc:
+        context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(exc))
+
+
+def _cached(context, key: tuple, selection: dict, build):
+    """Serve ``key`` from the response cache, or build, cache and return it.
+
+    Hits return the cached serialized bytes as-is. Concurrent misses for
+    the same key share a single ``build()``. The ``x-cache`` trailing
+    metadata tells clients which path answered.
+    """
+    data = cache_lookup(context, key)
+    if data is not None:
+        return data
+
+    def miss():
+        # A write committing while build() runs must not be cached over.
+        generation = response_cache.generation()
+        response = build()
+        return response, cache_store(key, selection, response, generation)
+
+    (response, data), shared = flight.do(key, miss)
+    return flight_result(context, response, data, shared)
 
 
 class MetricsServicer(metrics_pb2_grpc.MetricsServiceServicer):
     def GetMetrics(self, request, context):
-        rows = get_readings()
+        filters = _read_filters(request, context)
+        key = cache_key(
+            "GetMetrics", **filters, limit=request.limit, columnar=request.columnar
+        )
+        return _cached(
+            context, key, filters, lambda: self._get_metrics(request, filters)
+        )
+
+    def _get_metrics(self, request, filters):
+        limit = request.limit
+        # Fetch one extra row to learn whether another page exists.
+        limit = limit + 1 if limit else None
+        if request.columnar and request.meter_ids:
+            # Known meters allow fixed-width rows, decoded in bulk.
+            columns = get_reading_columns(**filters, limit=limit)
+            return columns_page_response(request, *columns)
+        filters = time_format(filters, request.columnar)
+        return page_response(request, get_readings(**filters, limit=limit))
+
+    def StreamMetrics(self, request, context):
+        filters = time_format(_read_filters(request, context), request.columnar)
+        rows = iter_readings(**filters, limit=request.limit or None)
+        meter_column = len(request.meter_ids) != 1
+        while batch := list(islice(rows, STREAM_CHUNK_SIZE)):
+            yield build_response(batch, request.columnar, meter_column)
+
+    def AggregateMetrics(self, request, context):
+        aggregate, filters = aggregate_filters(request)
+
+        def build():
+            return aggregate_response(aggregate_readings(aggregate, **filters))
+
+        key = cache_key("AggregateMetrics", aggregate=aggregate, **filters)
+        try:
+            return _cached(context, key, filters, build)
+        except ValueError as exc:
+            # Raised to every caller sharing the query, so each aborts its own.
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(exc))
+
+    def IngestMetrics(self, request_iterator, context):
+        buffer = IngestBuffer()
+        buffer.consume(request.data for request in request_iterator)
+
+        log.info(
+            "Ingest stream finished: %d accepted, %d rejected.",
+            buffer.accepted,
+            buffer.rejected,
+        )
+        return IngestResponse(accepted=buffer.accepted, rejected=buffer.rejected)
+
+    def ListMeters(self, request, context):
+        return _cached(
+            context,
+            cache_key("ListMeters"),
+            {},
+            lambda: ListMetersResponse(meter_ids=list_meters()),
+        )
+
+    def GetDataVersion(self, request, context):
+        # Cached with no time range or meters, so every write invalidates it.
+        return _cached(
+            context,
+            cache_key("GetDataVersion"),
+            {},
+            lambda: DataVersionResponse(version=data_version()),
+        )
 
-        response = MetricsResponse()
-        for row in rows:
-            point = response.data.add()
-            point.time = str(row[0])
-            point.meterusage = float(row[1])
+    def GetSummary(self, request, context):
+        selection = request_selection(request)
+        return _cached(
+            context,
+            cache_key("GetSummary", **selection),
+            selection,
+            lambda: summary_response(get_summary(**selection)),
+        )
 
-        return response
+    def GetAnomalies(self, request, context):
+        filters = anomaly_filters(request)
+        return _cached(
+            context,
+            cache_key("GetAnomalies", **filters),
+            anomaly_scope(filters),
+            lambda: anomalies_response(get_anomalies(**filters)),
+        )
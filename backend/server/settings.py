@@ -11,13 +11,86 @@ DB_NAME = os.environ.get("DB_NAME", "metrics")
 DB_USER = os.environ.get("DB_USER", "postgres")
 DB_PASS = os.environ.get("DB_PASS", "postgres")
 
-# Connection pool
+# Read replicas: comma-separated host[:port] list sharing DB_NAME/USER/PASS
+DB_REPLICA_HOSTS = [
+    host.strip()
+    for host in os.environ.get("DB_REPLICA_HOSTS", "").split(",")
+    if host.strip()
+]
+# Replicas further behind the primary than this are skipped for reads
+DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get("DB_REPLICA_MAX_LAG_SECONDS", "5"))
+# Seconds between replication-lag checks of each replica
+DB_REPLICA_CHECK_SECONDS = float(os.environ.get("DB_REPLICA_CHECK_SECONDS", "5"))
+
+# Connection pool (one per database node)
 DB_POOL_MIN_CONN = int(os.environ.get("DB_POOL_MIN_CONN", "1"))
 DB_POOL_MAX_CONN = int(os.environ.get("DB_POOL_MAX_CONN", "10"))
+# Seconds a caller waits for a free connection before giving up
+DB_POOL_ACQUIRE_TIMEOUT = float(os.environ.get("DB_POOL_ACQUIRE_TIMEOUT", "5.0"))
+# Connections older than this many seconds are closed and replaced (0 = never)
+DB_POOL_MAX_AGE_SECONDS = float(os.environ.get("DB_POOL_MAX_AGE_SECONDS", "1800"))
+# Check connections with a round trip before handing them out
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Meters
+DEFAULT_METER_ID = os.environ.get("DEFAULT_METER_ID", "default")
+METER_PARTITIONS = int(os.environ.get("METER_PARTITIONS", "4"))
+
+# Fetch MetricPoint times as integer epoch microseconds and format them with
+# server.timefmt instead of having the driver build a datetime per row
+EPOCH_TIMES = os.environ.get("EPOCH_TIMES", "true").lower() in ("1", "true", "yes")
+
+# Streaming
+STREAM_ITERSIZE = int(os.environ.get("STREAM_ITERSIZE", "5000"))
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", "1000"))
+
+# Response cache (0 bytes disables it)
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", "67108864"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "60"))
+
+# Ingest (IngestMetrics buffers points until either threshold is reached)
+INGEST_FLUSH_ROWS = int(os.environ.get("INGEST_FLUSH_ROWS", "5000"))
+INGEST_FLUSH_SECONDS = float(os.environ.get("INGEST_FLUSH_SECONDS", "1.0"))
+
+# Continuous aggregates (hourly/daily rollups used to answer AggregateMetrics)
+CONTINUOUS_AGGREGATES = os.environ.get("CONTINUOUS_AGGREGATES", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Storage: chunk width, columnar compression of older chunks and retention
+# (PostgreSQL interval strings; an empty RETENTION keeps data forever)
+CHUNK_TIME_INTERVAL = os.environ.get("CHUNK_TIME_INTERVAL", "7 days")
+COMPRESSION = os.environ.get("COMPRESSION", "true").lower() in ("1", "true", "yes")
+COMPRESS_AFTER = os.environ.get("COMPRESS_AFTER", "7 days")
+RETENTION = os.environ.get("RETENTION", "")
+
+# Anomaly detection on written readings: expected cadence for gap detection,
+# rolling window length (readings) and |z| above which a reading is a spike
+ANOMALY_DETECTION = os.environ.get("ANOMALY_DETECTION", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+ANOMALY_CADENCE_SECONDS = float(os.environ.get("ANOMALY_CADENCE_SECONDS", "900"))
+ANOMALY_WINDOW = int(os.environ.get("ANOMALY_WINDOW", "96"))
+ANOMALY_Z_THRESHOLD = float(os.environ.get("ANOMALY_Z_THRESHOLD", "4.0"))
 
-# Data
+# Data (CSV_PATH may also be a directory of .csv files or a glob; files are
+# parsed by SEED_WORKERS processes, 0 meaning one per CPU)
 CSV_PATH = os.environ.get("CSV_PATH", "/data/meterusage.csv")
+SEED_BATCH_SIZE = int(os.environ.get("SEED_BATCH_SIZE", "50000"))
+SEED_WORKERS = int(os.environ.get("SEED_WORKERS", "0"))
 
 # gRPC server
 GRPC_PORT = int(os.environ.get("GRPC_PORT", "50051"))
 GRPC_WORKERS = int(os.environ.get("GRPC_WORKERS", "10"))
+# Prometheus /metrics endpoint (0 disables it)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
+# Serve with grpc.aio on an async Postgres pool instead of worker threads
+GRPC_ASYNC = os.environ.get("GRPC_ASYNC", "false").lower() in ("1", "true", "yes")
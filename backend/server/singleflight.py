@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+from .telemetry import Counter, current_rpc, register
+
+SHARED_TOTAL = register(
+    Counter(
+        "singleflight_shared_total",
+        "Calls answered by joining an identical call already in flight.",
+        labelnames=("method",),
+    )
+)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key runs ``fn``; callers arriving while it runs
+    wait and receive the same result or exception. Nothing is remembered
+    once the call finishes, so later callers run ``fn`` again (or hit the
+    response cache it filled).
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[tuple, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: tuple, fn) -> tuple:
+        """Return ``(result, shared)``; ``shared`` is True for joined calls."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            SHARED_TOTAL.inc(method=current_rpc.get() or "none")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """``asyncio`` counterpart of :class:`SingleFlight`.
+
+    ``fn`` is a coroutine function. It runs in its own task, so a caller
+    that is cancelled (client gone) does not cancel the call for the others.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[tuple, asyncio.Task] = {}
+
+    async def do(self, key: tuple, fn) -> tuple:
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            SHARED_TOTAL.inc(method=current_rpc.get() or "none")
+        else:
+            task = self._calls[key] = asyncio.ensure_future(self._run(key, fn))
+        return await asyncio.shield(task), shared
+
+    async def _run(self, key: tuple, fn):
+        try:
+            return await fn()
+        finally:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+flight = SingleFlight()
+aio_flight = AsyncSingleFlight()
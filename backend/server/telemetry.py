@@ -0,0 +1,241 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+# Seconds; covers sub-millisecond pool hits up to multi-second stalls.
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+SIZE_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                "%s expects labels %r, got %r" % (self.name, self.labelnames, labels)
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    """Monotonic counter, optionally split by labels.
+
+    With ``fn`` the value is read from the callback at collection time
+    instead of being incremented (for counters kept elsewhere).
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames=(), fn=None) -> None:
+        super().__init__(name, help, labelnames)
+        self._fn = fn
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self._fn is not None:
+            yield self.name, {}, self._fn()
+            return
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, self._labels(key), value
+
+
+class Gauge(Counter):
+    """Gauge that can go up and down, or is read from ``fn`` when collected."""
+
+    type = "gauge"
+
+    def __init__(
+        self, name: str, help: str, fn: Callable[[], float] | None = None, labelnames=()
+    ) -> None:
+        super().__init__(name, help, labelnames, fn)
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Thread-safe cumulative histogram with fixed upper bounds."""
+
+    type = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sum(series[0]) if series else 0
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = [
+                (key, list(counts), total)
+                for key, (counts, total) in self._series.items()
+            ]
+        for key, counts, total in series:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield self.name + "_bucket", {
+                    **labels,
+                    "le": repr(float(bound)),
+                }, cumulative
+            cumulative += counts[-1]
+            yield self.name + "_bucket", {**labels, "le": "+Inf"}, cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, cumulative
+
+
+_registry: dict = {}
+_registry_lock = threading.Lock()
+
+
+def register(metric):
+    """Add ``metric`` to the process registry and return it."""
+    with _registry_lock:
+        if metric.name in _registry:
+            raise ValueError("Metric %r is already registered." % metric.name)
+        _registry[metric.name] = metric
+    return metric
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text format."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# The RPC being served by the current thread or task, set by the monitoring
+# interceptors so that lower layers can label their timings.
+current_rpc: ContextVar[str] = ContextVar("current_rpc", default="")
+
+STAGE_SECONDS = register(
+    Histogram(
+        "rpc_stage_seconds",
+        "Time spent per RPC in each stage (acquire, execute, fetch, build, serialize).",
+        labelnames=("method", "stage"),
+    )
+)
+
+
+def stage(name: str):
+    """Time a ``with`` block as stage ``name`` of the current RPC."""
+    return STAGE_SECONDS.time(method=current_rpc.get() or "none", stage=name)
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    """Record an already-measured stage of the current RPC."""
+    STAGE_SECONDS.observe(seconds, method=current_rpc.get() or "none", stage=name)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # scrapes are too frequent to log
+        pass
+
+
+def start_http_server(port: int) -> ThreadingHTTPServer:
+    """Serve ``/metrics`` on ``port`` from a daemon thread."""
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log.info("Metrics endpoint listening on port %d", server.server_address[1])
+    return server
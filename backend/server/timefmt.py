@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_US_PER_DAY = 86_400_000_000
+_US_PER_SECOND = 1_000_000
+
+
+def from_epoch_us(us: int) -> datetime:
+    """Exact UTC datetime for integer Unix microseconds (no float rounding)."""
+    return EPOCH + timedelta(microseconds=us)
+
+
+class TimeFormatter:
+    """Format Unix microseconds exactly like ``str()`` of a UTC datetime.
+
+    ``"2021-01-01 00:15:00+00:00"``, with ``.ffffff`` only when there are
+    microseconds. The date prefix is rebuilt only when the day changes and
+    the time-of-day suffix is memoized per second of the day, so readings on
+    a regular cadence cost a ``divmod``, a dict lookup and a concatenation
+    each instead of building and printing a ``datetime``.
+
+    Instances are not thread-safe; use one per response or stream.
+    """
+
+    def __init__(self) -> None:
+        self._day = None
+        self._prefix = ""
+        self._clock: dict[int, str] = {}
+
+    def __call__(self, us: int) -> str:
+        day, of_day = divmod(us, _US_PER_DAY)
+        if day != self._day:
+            self._day = day
+            self._prefix = (EPOCH + timedelta(days=day)).date().isoformat() + " "
+        second, micro = divmod(of_day, _US_PER_SECOND)
+        if micro:
+            return self._prefix + _clock(second, micro)
+        clock = self._clock.get(second)
+        if clock is None:
+            # At most 86400 entries; a 15-minute cadence needs 96.
+            clock = self._clock[second] = _clock(second, 0)
+        return self._prefix + clock
+
+
+def _clock(second: int, micro: int) -> str:
+    hours, rest = divmod(second, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if micro:
+        return "%02d:%02d:%02d.%06d+00:00" % (hours, minutes, seconds, micro)
+    return "%02d:%02d:%02d+00:00" % (hours, minutes, seconds)
@@ -0,0 +1,244 @@
+"""Unit tests for server/aio_orm.py."""
+
+import struct
+import unittest
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from server import aio_orm
+from server.queries import (
+    CREATE_STAGING_SQL,
+    DELETE_ANOMALIES_SQL,
+    LOCK_ANOMALY_STATE_SQL,
+    LOCK_METERS_SQL,
+    MERGE_STAGING_SQL,
+    WINDOW_BEFORE_SQL,
+    anomalies_query,
+    columns_query,
+    readings_query,
+    summary_query,
+)
+
+
+class FakeAsyncCursor:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.execute = AsyncMock()
+        self.copy_rows = []
+        self.itersize = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for row in self.rows:
+            yield row
+
+    @asynccontextmanager
+    async def copy(self, sql, params=None):
+        self.copy_sql, self.copy_params = sql, params
+        copy = MagicMock()
+        copy.write_row = AsyncMock(side_effect=self.copy_rows.append)
+        # COPY TO STDOUT: the fake's rows are the output data blocks.
+        copy.__aiter__ = lambda _: self._iter()
+        yield copy
+
+
+def _patch_connection(rows=()):
+    """Patch the aio_orm connection helpers with a fake returning ``rows``."""
+    conn = MagicMock()
+    result = MagicMock()
+    result.fetchall = AsyncMock(return_value=list(rows))
+    result.fetchone = AsyncMock(return_value=rows[0] if rows else None)
+    conn.execute = AsyncMock(return_value=result)
+    conn.cursor.return_value = FakeAsyncCursor(rows)
+
+    @asynccontextmanager
+    async def connection():
+        yield conn
+
+    patcher = patch.multiple(
+        "server.aio_orm", connection=connection, read_connection=connection
+    )
+    return patcher, conn
+
+
+class TestGetReadings(unittest.IsolatedAsyncioTestCase):
+    async def test_executes_shared_readings_query(self):
+        rows = [(datetime(2021, 1, 1, tzinfo=timezone.utc), 1.0, "a")]
+        patcher, conn = _patch_connection(rows)
+        with patcher:
+            result = await aio_orm.get_readings(meter_ids=["a"], limit=5)
+
+        self.assertEqual(result, rows)
+        self.assertEqual(
+            conn.execute.await_args[0],
+            readings_query(meter_ids=["a"], limit=5),
+        )
+
+
+class TestGetReadingColumns(unittest.IsolatedAsyncioTestCase):
+    async def test_copies_binary_and_decodes(self):
+        data = b"PGCOPY\n\xff\r\n\x00" + bytes(8)
+        data += struct.pack(">hiqidii", 3, 8, 1000, 8, 1.5, 4, 2) + b"\xff\xff"
+        # Delivered in two blocks, split mid-row.
+        patcher, conn = _patch_connection([data[:30], data[30:]])
+        with patcher:
+            result = await aio_orm.get_reading_columns(["a", "b"], limit=1)
+
+        self.assertEqual(result, ([1000], [1.5], ["b"]))
+        cur = conn.cursor.return_value
+        sql, params = columns_query(["a", "b"], limit=1)
+        self.assertEqual(cur.copy_sql, f"COPY ({sql}) TO STDOUT WITH (FORMAT binary)")
+        self.assertEqual(cur.copy_params, params)
+
+
+class TestIterReadings(unittest.IsolatedAsyncioTestCase):
+    async def test_yields_rows_from_named_cursor(self):
+        rows = [(1, 1.0, "a"), (2, 2.0, "a")]
+        patcher, conn = _patch_connection(rows)
+        with patcher:
+            result = [row async for row in aio_orm.iter_readings(itersize=7)]
+
+        self.assertEqual(result, rows)
+        conn.cursor.assert_called_once_with(name="meter_readings_stream")
+        self.assertEqual(conn.cursor.return_value.itersize, 7)
+
+
+class TestAggregateReadings(unittest.IsolatedAsyncioTestCase):
+    async def test_unknown_aggregate_raises_before_connecting(self):
+        patcher, conn = _patch_connection()
+        with patcher, self.assertRaises(ValueError):
+            await aio_orm.aggregate_readings("median", bucket_months=1)
+        conn.execute.assert_not_awaited()
+
+
+class TestListMeters(unittest.IsolatedAsyncioTestCase):
+    async def test_returns_meter_ids(self):
+        patcher, _ = _patch_connection([("a",), ("b",)])
+        with patcher:
+            self.assertEqual(await aio_orm.list_meters(), ["a", "b"])
+
+
+class TestDataVersion(unittest.IsolatedAsyncioTestCase):
+    async def test_formats_version(self):
+        patcher, _ = _patch_connection([(255, 7)])
+        with patcher:
+            self.assertEqual(await aio_orm.data_version(), "ff-7")
+
+
+class TestGetSummary(unittest.IsolatedAsyncioTestCase):
+    async def test_runs_summary_query(self):
+        start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        rows = [("a", 3.0, 2, 1.0, 2.0, start)]
+        patcher, conn = _patch_connection(rows)
+        with patcher:
+            result = await aio_orm.get_summary(start=start, meter_ids=["a"])
+
+        self.assertEqual(result, rows)
+        conn.execute.assert_awaited_once_with(
+            *summary_query(start=start, meter_ids=["a"])
+        )
+
+
+class TestInsertReadings(unittest.IsolatedAsyncioTestCase):
+    @patch("server.aio_orm.ANOMALY_DETECTION", False)
+    @patch("server.aio_orm.response_cache")
+    async def test_copies_rows_and_invalidates_cache(self, mock_cache):
+        rows = [("2021-01-01 00:00:00", 1.0, "a"), ("2021-01-02 00:00:00", 2.0, "b")]
+        patcher, conn = _patch_connection()
+        with patcher:
+            count = await aio_orm.insert_readings(rows)
+
+        self.assertEqual(count, 2)
+        cur = conn.cursor.return_value
+        self.assertEqual(cur.copy_rows, rows)
+        self.assertIn("COPY meter_readings_staging", cur.copy_sql)
+        self.assertEqual(
+            [c.args[0] for c in cur.execute.await_args_list],
+            [
+                CREATE_STAGING_SQL,
+                MERGE_STAGING_SQL,
+                "UPDATE data_version SET version = version + 1;",
+            ],
+        )
+        mock_cache.invalidate.assert_called_once_with(
+            datetime(2021, 1, 1, tzinfo=timezone.utc),
+            datetime(2021, 1, 2, tzinfo=timezone.utc),
+            {"a", "b"},
+        )
+
+    @patch("server.aio_orm.ANOMALY_DETECTION", True)
+    @patch("server.aio_orm.response_cache")
+    async def test_detects_anomalies_in_the_write_transaction(self, mock_cache):
+        rows = [("2021-01-01 00:00:00", 1.0, "a"), ("2021-01-01 01:00:00", 2.0, "a")]
+        patcher, conn = _patch_connection()
+        cur = conn.cursor.return_value
+        cur.fetchall = AsyncMock(return_value=[])
+        cur.executemany = AsyncMock()
+        with patcher:
+            await aio_orm.insert_readings(rows)
+
+        statements = [c.args[0] for c in cur.execute.await_args_list]
+        self.assertEqual(
+            statements,
+            [
+                CREATE_STAGING_SQL,
+                MERGE_STAGING_SQL,
+                LOCK_METERS_SQL,
+                LOCK_ANOMALY_STATE_SQL,
+                "UPDATE data_version SET version = version + 1;",
+            ],
+        )
+        (flagged,), (saved,) = [c.args[1:] for c in cur.executemany.await_args_list]
+        self.assertEqual([a[1] for a in flagged], ["gap"])
+        self.assertEqual(saved[0][0], "a")
+        self.assertEqual(saved[0][2], [1.0, 2.0])
+
+    @patch("server.aio_orm.ANOMALY_DETECTION", True)
+    @patch("server.aio_orm.response_cache")
+    async def test_late_rows_rescan_their_meter(self, mock_cache):
+        t = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        last = t + timedelta(hours=1)
+        patcher, conn = _patch_connection()
+        cur = conn.cursor.return_value
+        cur.fetchall = AsyncMock(
+            side_effect=[
+                [("a", last, [1.0, 2.0])],
+                [(t - timedelta(minutes=15), 0.5)],
+                [(t, 1.0, "a"), (last, 2.0, "a")],
+            ]
+        )
+        cur.executemany = AsyncMock()
+        with patcher:
+            await aio_orm.insert_readings([("2021-01-01 00:00:00", 1.0, "a")])
+
+        statements = [c.args for c in cur.execute.await_args_list]
+        self.assertEqual(statements[4][0], WINDOW_BEFORE_SQL)
+        self.assertIn(
+            (DELETE_ANOMALIES_SQL, ("a", t - timedelta(minutes=15), last)),
+            statements,
+        )
+        saved = cur.executemany.await_args_list[-1].args[1]
+        self.assertEqual(saved, [("a", last, [0.5, 1.0, 2.0])])
+
+
+class TestGetAnomalies(unittest.IsolatedAsyncioTestCase):
+    async def test_runs_anomalies_query(self):
+        patcher, conn = _patch_connection([("a", "gap")])
+        with patcher:
+            result = await aio_orm.get_anomalies(kinds=["gap"])
+
+        self.assertEqual(result, [("a", "gap")])
+        conn.execute.assert_awaited_once_with(*anomalies_query(kinds=["gap"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
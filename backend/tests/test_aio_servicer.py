@@ -0,0 +1,230 @@
+"""Unit tests for server/aio_servicer.py."""
+
+import asyncio
+import unittest
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import grpc
+import metrics_pb2
+
+from server.aio_servicer import AsyncMetricsServicer
+from server.cache import response_cache
+
+MetricsRequest = getattr(metrics_pb2, "MetricsRequest")
+MetricsResponse = getattr(metrics_pb2, "MetricsResponse")
+AggregateRequest = getattr(metrics_pb2, "AggregateRequest")
+IngestRequest = getattr(metrics_pb2, "IngestRequest")
+MetricPoint = getattr(metrics_pb2, "MetricPoint")
+ListMetersRequest = getattr(metrics_pb2, "ListMetersRequest")
+
+
+class _Aborted(Exception):
+    pass
+
+
+def _make_context():
+    context = MagicMock()
+    context.abort = AsyncMock(side_effect=_Aborted)
+    return context
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+class TestAsyncGetMetrics(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        response_cache.clear()
+        self.servicer = AsyncMetricsServicer()
+        self.context = _make_context()
+
+    @patch("server.aio_servicer.aio_orm.get_readings", new_callable=AsyncMock)
+    async def test_pages_and_caches_response(self, mock_get):
+        mock_get.return_value = [
+            ("2021-01-01 00:00:00+00:00", 1.0, "a"),
+            ("2021-01-01 00:15:00+00:00", 2.0, "a"),
+        ]
+        request = MetricsRequest(limit=1)
+
+        response = await self.servicer.GetMetrics(request, self.context)
+        cached = await self.servicer.GetMetrics(request, self.context)
+
+        mock_get.assert_awaited_once_with(epoch_us=True, limit=2)
+        self.assertEqual(len(response.data), 1)
+        self.assertTrue(response.next_page_token)
+        self.assertEqual(MetricsResponse.FromString(cached), response)
+
+    @patch("server.aio_servicer.aio_orm.get_readings", new_callable=AsyncMock)
+    async def test_concurrent_identical_queries_share_one_fetch(self, mock_get):
+        async def slow_query(**kwargs):
+            await asyncio.sleep(0.01)
+            return [("2021-01-01 00:00:00+00:00", 1.0, "a")]
+
+        mock_get.side_effect = slow_query
+        contexts = [_make_context() for _ in range(3)]
+
+        first, *shared = await asyncio.gather(
+            *(self.servicer.GetMetrics(MetricsRequest(), c) for c in contexts)
+        )
+
+        mock_get.assert_awaited_once()
+        self.assertEqual([MetricsResponse.FromString(s) for s in shared], [first] * 2)
+        contexts[1].set_trailing_metadata.assert_called_with((("x-cache", "shared"),))
+
+    @patch("server.aio_servicer.aio_orm.get_reading_columns", new_callable=AsyncMock)
+    async def test_columnar_meter_selection_uses_bulk_columns(self, mock_columns):
+        mock_columns.return_value = ([1000000, 2000000], [1.0, 2.0], None)
+        request = MetricsRequest(columnar=True, meter_ids=["a"])
+
+        response = await self.servicer.GetMetrics(request, self.context)
+
+        mock_columns.assert_awaited_once_with(meter_ids=["a"], limit=None)
+        self.assertEqual(list(response.columns.time_unix_ms), [1000, 2000])
+        self.assertEqual(list(response.columns.meter_id), [])
+
+    async def test_invalid_page_token_aborts(self):
+        with self.assertRaises(_Aborted):
+            await self.servicer.GetMetrics(
+                MetricsRequest(page_token="!!"), self.context
+            )
+        self.context.abort.assert_awaited_once_with(
+            grpc.StatusCode.INVALID_ARGUMENT, "Invalid page_token."
+        )
+
+
+class TestAsyncStreamMetrics(unittest.IsolatedAsyncioTestCase):
+    @patch("server.aio_servicer.STREAM_CHUNK_SIZE", 2)
+    @patch("server.aio_servicer.aio_orm.iter_readings")
+    async def test_yields_chunks(self, mock_iter):
+        mock_iter.return_value = _aiter([(i, float(i), "a") for i in range(5)])
+
+        responses = [
+            r
+            async for r in AsyncMetricsServicer().StreamMetrics(
+                MetricsRequest(columnar=True), _make_context()
+            )
+        ]
+
+        self.assertEqual([len(r.columns.time_unix_ms) for r in responses], [2, 2, 1])
+        mock_iter.assert_called_once_with(epoch_us=True, limit=None)
+
+
+class TestAsyncAggregateMetrics(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        response_cache.clear()
+
+    @patch("server.aio_servicer.aio_orm.aggregate_readings", new_callable=AsyncMock)
+    async def test_value_error_aborts(self, mock_aggregate):
+        mock_aggregate.side_effect = ValueError("bad bucket")
+        request = AggregateRequest()
+        request.bucket_width.FromTimedelta(timedelta(hours=1))
+        context = _make_context()
+
+        with self.assertRaises(_Aborted):
+            await AsyncMetricsServicer().AggregateMetrics(request, context)
+        context.abort.assert_awaited_once_with(
+            grpc.StatusCode.INVALID_ARGUMENT, "bad bucket"
+        )
+
+
+class TestAsyncIngestMetrics(unittest.IsolatedAsyncioTestCase):
+    @patch("server.ingest.aio_orm.insert_readings", new_callable=AsyncMock)
+    async def test_reports_counts(self, mock_insert):
+        mock_insert.side_effect = lambda rows: len(rows)
+        requests = _aiter(
+            [
+                IngestRequest(
+                    data=[
+                        MetricPoint(time="2021-01-01 00:00:00", meterusage=1.0),
+                        MetricPoint(time="nope", meterusage=1.0),
+                    ]
+                )
+            ]
+        )
+
+        response = await AsyncMetricsServicer().IngestMetrics(requests, _make_context())
+
+        self.assertEqual((response.accepted, response.rejected), (1, 1))
+
+
+class TestAsyncListMeters(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        response_cache.clear()
+
+    @patch("server.aio_servicer.aio_orm.list_meters", new_callable=AsyncMock)
+    async def test_returns_meter_ids(self, mock_list):
+        mock_list.return_value = ["a", "b"]
+
+        response = await AsyncMetricsServicer().ListMeters(
+            ListMetersRequest(), _make_context()
+        )
+
+        self.assertEqual(list(response.meter_ids), ["a", "b"])
+
+
+class TestAsyncGetDataVersion(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        response_cache.clear()
+
+    @patch("server.aio_servicer.aio_orm.data_version", new_callable=AsyncMock)
+    async def test_returns_version(self, mock_version):
+        mock_version.return_value = "a-1"
+
+        response = await AsyncMetricsServicer().GetDataVersion(
+            metrics_pb2.DataVersionRequest(), _make_context()
+        )
+
+        self.assertEqual(response.version, "a-1")
+
+
+class TestAsyncGetSummary(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        response_cache.clear()
+
+    @patch("server.aio_servicer.aio_orm.get_summary", new_callable=AsyncMock)
+    async def test_returns_summaries(self, mock_summary):
+        mock_summary.return_value = [
+            ("a", 6.0, 3, 1.0, 3.0, "2021-01-01 00:30:00+00:00")
+        ]
+
+        response = await AsyncMetricsServicer().GetSummary(
+            metrics_pb2.SummaryRequest(meter_ids=["a"]), _make_context()
+        )
+
+        mock_summary.assert_awaited_once_with(meter_ids=["a"])
+        self.assertEqual(response.summaries[0].mean, 2.0)
+        self.assertEqual(response.summaries[0].peak_time, "2021-01-01 00:30:00+00:00")
+
+
+class TestAsyncGetAnomalies(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        response_cache.clear()
+
+    @patch("server.aio_servicer.aio_orm.get_anomalies", new_callable=AsyncMock)
+    async def test_returns_anomalies(self, mock_anomalies):
+        mock_anomalies.return_value = [
+            (
+                "a",
+                "spike",
+                "2021-01-01 00:30:00+00:00",
+                "2021-01-01 00:45:00+00:00",
+                40.0,
+                6.5,
+            )
+        ]
+
+        response = await AsyncMetricsServicer().GetAnomalies(
+            metrics_pb2.AnomaliesRequest(kinds=[metrics_pb2.SPIKE]), _make_context()
+        )
+
+        mock_anomalies.assert_awaited_once_with(kinds=["spike"])
+        (anomaly,) = response.anomalies
+        self.assertEqual(anomaly.kind, metrics_pb2.SPIKE)
+        self.assertEqual(anomaly.start, "2021-01-01 00:30:00+00:00")
+        self.assertEqual((anomaly.value, anomaly.score), (40.0, 6.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""Unit tests for server/anomaly.py."""
+
+import statistics
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from server.anomaly import GAP, SPIKE, AnomalyDetector, _Window
+
+T0 = datetime(2021, 1, 1, tzinfo=timezone.utc)
+STEP = timedelta(minutes=15)
+
+
+def _series(values, meter_id="m1", start=T0):
+    return [(start + i * STEP, v, meter_id) for i, v in enumerate(values)]
+
+
+class TestWindow(unittest.TestCase):
+    def test_score_uses_median_and_stddev_of_the_last_values(self):
+        window = _Window(4, [9.0, 1.0, 2.0])
+        self.assertIsNone(window.score(5.0))
+
+        for value in (3.0, 4.0, 10.0):
+            window.push(value)
+
+        recent = [2.0, 3.0, 4.0, 10.0]
+        self.assertEqual(list(window.values), recent)
+        self.assertAlmostEqual(
+            window.score(20.0),
+            (20.0 - statistics.median(recent)) / statistics.pstdev(recent),
+        )
+
+    def test_sums_stay_exact_over_many_pushes(self):
+        window = _Window(3)
+        for i in range(10_000):
+            window.push(1e6 + (i % 3))
+
+        # The window holds 1e6 + {0, 1, 2}; 1e6 + 1 is its median.
+        self.assertAlmostEqual(window.score(1e6 + 1), 0.0)
+        self.assertAlmostEqual(
+            window.score(1e6 + 2), 1 / statistics.pstdev([0, 1, 2]), places=9
+        )
+
+    def test_constant_window_scores_nothing(self):
+        window = _Window(2, [5.0, 5.0])
+        self.assertIsNone(window.score(100.0))
+
+
+class TestAnomalyDetector(unittest.TestCase):
+    def setUp(self):
+        self.detector = AnomalyDetector(cadence=STEP, window=8, threshold=4.0)
+
+    def test_regular_series_flags_nothing(self):
+        values = [10.0 + (i % 3) for i in range(50)]
+
+        self.assertEqual(self.detector.run(_series(values)), [])
+
+    def test_flags_missing_intervals_as_gap(self):
+        rows = _series([1.0] * 4)
+        rows.append((rows[-1][0] + 4 * STEP, 1.0, "m1"))
+
+        (gap,) = self.detector.run(rows)
+
+        self.assertEqual(gap, ("m1", GAP, T0 + 4 * STEP, T0 + 7 * STEP, None, 3.0))
+
+    def test_jitter_below_half_an_interval_is_not_a_gap(self):
+        rows = [(T0, 1.0, "m1"), (T0 + STEP * 1.4, 1.0, "m1")]
+
+        self.assertEqual(self.detector.run(rows), [])
+
+    def test_flags_spikes_and_dips_once_window_is_full(self):
+        # The spike stays in the window and widens it, so the dip is deeper.
+        values = [10.0 + (i % 3) for i in range(8)] + [40.0, 10.0, -50.0]
+
+        flagged = self.detector.run(_series(values))
+
+        self.assertEqual(
+            [(a[1], a[2], a[4]) for a in flagged],
+            [
+                (SPIKE, T0 + 8 * STEP, 40.0),
+                (SPIKE, T0 + 10 * STEP, -50.0),
+            ],
+        )
+        self.assertGreater(flagged[0][5], 4.0)
+        self.assertLess(flagged[1][5], -4.0)
+        self.assertEqual(flagged[0][3], T0 + 9 * STEP)
+
+    def test_meters_are_independent_and_sorted_per_meter(self):
+        rows = _series([1.0, 1.0], "a") + _series([1.0], "b", T0 + 5 * STEP)
+        rows.reverse()
+
+        self.assertEqual(self.detector.run(rows), [])
+
+    def test_late_and_duplicate_readings_are_skipped(self):
+        self.detector.run(_series([1.0, 2.0]))
+
+        self.assertEqual(self.detector.feed(T0, 99.0, "m1"), [])
+        self.assertEqual(self.detector.states(), [("m1", T0 + STEP, [1.0, 2.0])])
+
+    def test_resumes_from_saved_state(self):
+        values = [10.0 + (i % 3) for i in range(8)] + [40.0]
+        first = AnomalyDetector(cadence=STEP, window=8)
+        first.run(_series(values[:5]))
+
+        second = AnomalyDetector(first.states(), cadence=STEP, window=8)
+        flagged = second.run(_series(values[5:], start=T0 + 5 * STEP))
+
+        self.assertEqual([a[1] for a in flagged], [SPIKE])
+        self.assertEqual(second.states()[0][1], T0 + 8 * STEP)
+
+
+if __name__ == "__main__":
+    unittest.main()
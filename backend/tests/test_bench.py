@@ -0,0 +1,112 @@
+"""Unit tests for the bench package (data generator, results, stub store)."""
+
+import unittest
+from datetime import datetime, timezone
+
+from bench.datagen import iter_rows
+from bench.load import drive
+from bench.results import latency_summary, percentile
+from bench.stub import StubStore
+
+
+class TestResults(unittest.TestCase):
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_latency_summary_in_milliseconds(self):
+        summary = latency_summary([0.003, 0.001, 0.002])
+        self.assertEqual(summary["count"], 3)
+        self.assertAlmostEqual(summary["p50_ms"], 2.0)
+        self.assertAlmostEqual(summary["max_ms"], 3.0)
+
+
+class TestDatagen(unittest.TestCase):
+    def test_row_count_and_meters(self):
+        rows = list(iter_rows(10, meters=3))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(
+            {r[2] for r in rows}, {"meter-0000", "meter-0001", "meter-0002"}
+        )
+        self.assertEqual(rows[0][0], rows[2][0])
+        self.assertNotEqual(rows[2][0], rows[3][0])
+
+    def test_deterministic_for_seed(self):
+        self.assertEqual(list(iter_rows(50, seed=7)), list(iter_rows(50, seed=7)))
+        self.assertNotEqual(list(iter_rows(50, seed=7)), list(iter_rows(50, seed=8)))
+
+    def test_replays_profile(self):
+        values = [r[1] for r in iter_rows(4, profile=[100.0, 200.0])]
+        for value, base in zip(values, [100, 200, 100, 200]):
+            self.assertTrue(base * 0.9 <= value <= base * 1.1)
+
+
+class TestStubStore(unittest.TestCase):
+    def setUp(self):
+        self.store = StubStore(40, meters=4)
+
+    def test_limit_and_meter_filter(self):
+        rows = self.store.get_readings(meter_ids=["meter-0001"], limit=3)
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(r[2] == "meter-0001" for r in rows))
+
+    def test_time_range_is_half_open(self):
+        start = datetime(2019, 1, 1, 0, 30, tzinfo=timezone.utc)
+        end = datetime(2019, 1, 1, 1, 0, tzinfo=timezone.utc)
+        rows = self.store.get_readings(start=start, end=end)
+        self.assertEqual(len(rows), 8)
+        self.assertTrue(all(start <= r[0] < end for r in rows))
+
+    def test_keyset_after(self):
+        first = self.store.get_readings(limit=6)
+        rest = self.store.get_readings(after=first[-1][0], after_meter=first[-1][2])
+        self.assertEqual(first + rest, self.store.get_readings())
+
+    def test_epoch_us(self):
+        (row,) = self.store.get_readings(limit=1, epoch_us=True)
+        self.assertEqual(row[0], int(self.store.rows[0][0].timestamp()) * 1000000)
+
+    def test_summary_matches_readings(self):
+        (summary,) = self.store.get_summary(meter_ids=["meter-0001"])
+        rows = self.store.get_readings(meter_ids=["meter-0001"])
+        values = [v for _, v, _ in rows]
+        peak = max(rows, key=lambda r: r[1])[0]
+        self.assertEqual(
+            summary,
+            ("meter-0001", sum(values), len(values), min(values), max(values), peak),
+        )
+
+    def test_anomalies_filter_like_the_orm(self):
+        # Generated series are regular; drop two readings to open a gap.
+        del self.store.rows[4:12:4]
+        (gap,) = self.store.get_anomalies(meter_ids=["meter-0000"])
+        self.assertEqual(gap[:2], ("meter-0000", "gap"))
+        self.assertEqual(self.store.get_anomalies(kinds=["spike"]), [])
+        self.assertEqual(self.store.get_anomalies(end=gap[2]), [])
+
+
+class TestDrive(unittest.TestCase):
+    def test_counts_rows_and_errors(self):
+        calls = iter([5, ValueError("boom"), 5, 5])
+
+        def call():
+            outcome = next(calls)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        result = drive(call, concurrency=1, requests=4)
+        self.assertEqual(result["count"], 3)
+        self.assertEqual(result["errors"], 1)
+        self.assertEqual(result["rows"], 15)
+
+    def test_requires_stop_condition(self):
+        with self.assertRaises(ValueError):
+            drive(lambda: 0, concurrency=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,199 @@
+"""Unit tests for server/cache.py."""
+
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import grpc
+
+from server.cache import (
+    _RECENT_INVALIDATIONS,
+    AsyncPreserializedResponseInterceptor,
+    PreserializedResponseInterceptor,
+    ResponseCache,
+    cache_key,
+)
+
+
+def _t(day):
+    return datetime(2021, 1, day, tzinfo=timezone.utc)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCacheKey(unittest.TestCase):
+    def test_normalizes_parameter_and_meter_order(self):
+        self.assertEqual(
+            cache_key("GetMetrics", start=_t(1), meter_ids=["b", "a", "a"]),
+            cache_key("GetMetrics", meter_ids=["a", "b"], start=_t(1)),
+        )
+
+    def test_drops_none_values(self):
+        self.assertEqual(cache_key("M", limit=None), cache_key("M"))
+
+    def test_distinguishes_methods_and_values(self):
+        self.assertNotEqual(cache_key("A", limit=1), cache_key("B", limit=1))
+        self.assertNotEqual(cache_key("A", limit=1), cache_key("A", limit=2))
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ResponseCache(max_bytes=10, ttl=60, clock=self.clock)
+
+    def test_hit_and_miss_counters(self):
+        self.assertIsNone(self.cache.get("k"))
+        self.cache.put("k", b"abc")
+
+        self.assertEqual(self.cache.get("k"), b"abc")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_entries_expire_after_ttl(self):
+        self.cache.put("k", b"abc")
+        self.clock.now = 61
+
+        self.assertIsNone(self.cache.get("k"))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_evicts_least_recently_used_over_byte_budget(self):
+        self.cache.put("a", b"1234")
+        self.cache.put("b", b"1234")
+        self.cache.get("a")
+        self.cache.put("c", b"1234")
+
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), b"1234")
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.assertEqual(self.cache.stats()["bytes"], 8)
+
+    def test_skips_payloads_larger_than_budget(self):
+        self.cache.put("big", b"x" * 11)
+
+        self.assertIsNone(self.cache.get("big"))
+
+    def test_invalidates_only_overlapping_entries(self):
+        self.cache.put("jan1-3", b"1", start=_t(1), end=_t(3))
+        self.cache.put("jan5-", b"2", start=_t(5))
+        self.cache.put("m2", b"3", meter_ids=["m2"])
+        self.cache.put("all", b"4")
+
+        dropped = self.cache.invalidate(_t(2), _t(2), {"m1"})
+
+        self.assertEqual(dropped, 2)
+        self.assertIsNone(self.cache.get("jan1-3"))
+        self.assertIsNone(self.cache.get("all"))
+        self.assertEqual(self.cache.get("jan5-"), b"2")
+        self.assertEqual(self.cache.get("m2"), b"3")
+
+    def test_end_bound_is_exclusive(self):
+        self.cache.put("jan1-3", b"1", start=_t(1), end=_t(3))
+
+        self.cache.invalidate(_t(3), _t(4))
+
+        self.assertEqual(self.cache.get("jan1-3"), b"1")
+
+    def test_clear_drops_everything(self):
+        self.cache.put("a", b"1", start=_t(1), end=_t(2), meter_ids=["m1"])
+
+        self.cache.clear()
+
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_put_after_overlapping_invalidation_is_rejected(self):
+        # The query ran before the write committed, the put comes after.
+        generation = self.cache.generation()
+        self.cache.invalidate(_t(2), _t(2), {"m1"})
+
+        self.cache.put("a", b"1", _t(1), _t(3), ["m1"], generation)
+
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["rejections"], 1)
+
+    def test_put_after_unrelated_invalidation_is_kept(self):
+        generation = self.cache.generation()
+        self.cache.invalidate(_t(2), _t(2), {"m2"})
+        self.cache.invalidate(_t(5), _t(6), {"m1"})
+
+        self.cache.put("a", b"1", _t(1), _t(3), ["m1"], generation)
+
+        self.assertEqual(self.cache.get("a"), b"1")
+
+    def test_put_within_lag_of_overlapping_invalidation_is_rejected(self):
+        self.cache.invalidate(_t(2), _t(2), {"m1"})
+        self.clock.now = 4
+        generation = self.cache.generation()
+
+        # A replica up to 5 s behind may not have the write yet.
+        self.cache.put("a", b"1", _t(1), _t(3), ["m1"], generation, lag=5)
+        self.cache.put("m2", b"2", _t(1), _t(3), ["m2"], generation, lag=5)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("m2"), b"2")
+
+        self.clock.now = 6
+        self.cache.put("a", b"1", _t(1), _t(3), ["m1"], generation, lag=5)
+        self.assertEqual(self.cache.get("a"), b"1")
+
+    def test_put_older_than_remembered_invalidations_is_rejected(self):
+        generation = self.cache.generation()
+        for _ in range(_RECENT_INVALIDATIONS + 1):
+            self.cache.invalidate(_t(9), _t(9), {"m9"})
+
+        self.cache.put("a", b"1", _t(1), _t(3), ["m1"], generation)
+
+        self.assertIsNone(self.cache.get("a"))
+
+
+class TestPreserializedResponseInterceptor(unittest.TestCase):
+    def _intercept(self, handler):
+        return PreserializedResponseInterceptor().intercept_service(
+            lambda details: handler, MagicMock()
+        )
+
+    def test_serializer_passes_bytes_through(self):
+        handler = grpc.unary_unary_rpc_method_handler(
+            lambda req, ctx: None,
+            request_deserializer=bytes,
+            response_serializer=lambda msg: b"serialized",
+        )
+
+        wrapped = self._intercept(handler)
+
+        self.assertEqual(wrapped.response_serializer(b"cached"), b"cached")
+        self.assertEqual(wrapped.response_serializer(object()), b"serialized")
+        self.assertIs(wrapped.unary_unary, handler.unary_unary)
+
+    def test_leaves_streaming_handlers_alone(self):
+        handler = grpc.unary_stream_rpc_method_handler(lambda req, ctx: iter(()))
+
+        self.assertIs(self._intercept(handler), handler)
+
+    def test_unknown_method_returns_none(self):
+        self.assertIsNone(self._intercept(None))
+
+
+class TestAsyncPreserializedResponseInterceptor(unittest.IsolatedAsyncioTestCase):
+    async def test_wraps_awaited_handler(self):
+        handler = grpc.unary_unary_rpc_method_handler(
+            lambda req, ctx: None, response_serializer=lambda msg: b"serialized"
+        )
+
+        async def continuation(details):
+            return handler
+
+        wrapped = await AsyncPreserializedResponseInterceptor().intercept_service(
+            continuation, MagicMock()
+        )
+
+        self.assertEqual(wrapped.response_serializer(b"cached"), b"cached")
+        self.assertEqual(wrapped.response_serializer(object()), b"serialized")
+
+
+if __name__ == "__main__":
+    unittest.main()
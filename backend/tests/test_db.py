@@ -1,16 +1,21 @@
 """Unit tests for server/db.py."""
 
+import threading
+import time
 import unittest
-from unittest.mock import MagicMock, call, patch
+from unittest.mock import MagicMock, patch
 
 import psycopg2
+from psycopg2 import extensions
 
 import server.db as db_module
 
 
 def _reset_pool():
-    """Helper: reset the module-level _pool to None between tests."""
+    """Helper: reset the module-level pools between tests."""
     db_module._pool = None
+    db_module._replicas = []
+    db_module._router = db_module.ReplicaRouter(0)
 
 
 class TestWaitForDb(unittest.TestCase):
@@ -45,6 +50,17 @@ class TestWaitForDb(unittest.TestCase):
         self.assertEqual(mock_sleep.call_count, 2)
         mock_conn.close.assert_called_once()
 
+    @patch("server.db.time.sleep")
+    @patch("server.db.psycopg2.connect")
+    def test_backs_off_exponentially_up_to_max_delay(self, mock_connect, mock_sleep):
+        mock_connect.side_effect = [psycopg2.OperationalError("not ready")] * 4 + [
+            MagicMock()
+        ]
+
+        db_module.wait_for_db(retries=5, delay=1, max_delay=3)
+
+        self.assertEqual([c[0][0] for c in mock_sleep.call_args_list], [1, 2, 3, 3])
+
     @patch("server.db.time.sleep")
     @patch("server.db.psycopg2.connect")
     def test_raises_after_max_retries(self, mock_connect, mock_sleep):
@@ -63,7 +79,7 @@ class TestInitPool(unittest.TestCase):
     def tearDown(self):
         _reset_pool()
 
-    @patch("server.db.pool.ThreadedConnectionPool")
+    @patch("server.db.ConnectionPool")
     def test_creates_pool(self, mock_pool_cls):
         mock_pool = MagicMock()
         mock_pool_cls.return_value = mock_pool
@@ -81,7 +97,7 @@ class TestInitPool(unittest.TestCase):
         )
         self.assertIs(db_module._pool, mock_pool)
 
-    @patch("server.db.pool.ThreadedConnectionPool")
+    @patch("server.db.ConnectionPool")
     def test_init_pool_is_idempotent(self, mock_pool_cls):
         existing = MagicMock()
         db_module._pool = existing
@@ -168,5 +184,318 @@ class TestPutConn(unittest.TestCase):
         mock_pool.putconn.assert_not_called()
 
 
+class TestConnection(unittest.TestCase):
+    def setUp(self):
+        _reset_pool()
+
+    def tearDown(self):
+        _reset_pool()
+
+    def test_returns_connection_after_block(self):
+        mock_pool = MagicMock()
+        db_module._pool = mock_pool
+
+        with self.assertRaises(KeyError):
+            with db_module.connection() as conn:
+                self.assertIs(conn, mock_pool.getconn.return_value)
+                raise KeyError
+
+        mock_pool.putconn.assert_called_once_with(mock_pool.getconn.return_value)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _make_conn():
+    conn = MagicMock()
+    conn.closed = 0
+    conn.autocommit = False
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+@patch("server.db.psycopg2.connect")
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def _pool(self, mock_connect, minconn=0, maxconn=2, **kwargs):
+        mock_connect.side_effect = lambda **kw: _make_conn()
+        kwargs.setdefault("pre_ping", False)
+        return db_module.ConnectionPool(
+            minconn, maxconn, clock=self.clock, host="db", **kwargs
+        )
+
+    def test_opens_minconn_eagerly_and_more_on_demand(self, mock_connect):
+        conn_pool = self._pool(mock_connect, minconn=1)
+        self.assertEqual(mock_connect.call_count, 1)
+        mock_connect.assert_called_with(host="db")
+
+        first, second = conn_pool.getconn(), conn_pool.getconn()
+
+        self.assertIsNot(first, second)
+        self.assertEqual(mock_connect.call_count, 2)
+        self.assertEqual((conn_pool.in_use, conn_pool.idle), (2, 0))
+
+    def test_reuses_returned_connection(self, mock_connect):
+        conn_pool = self._pool(mock_connect)
+        conn = conn_pool.getconn()
+        conn_pool.putconn(conn)
+
+        self.assertIs(conn_pool.getconn(), conn)
+        self.assertEqual(mock_connect.call_count, 1)
+
+    def test_times_out_when_exhausted(self, mock_connect):
+        conn_pool = self._pool(mock_connect, maxconn=1)
+        conn_pool.getconn()
+
+        with self.assertRaises(db_module.PoolTimeout):
+            conn_pool.getconn(timeout=0)
+        self.assertEqual(conn_pool.waiters, 0)
+
+    def test_waiter_gets_connection_when_one_is_returned(self, mock_connect):
+        mock_connect.side_effect = lambda **kw: _make_conn()
+        conn_pool = db_module.ConnectionPool(0, 1, pre_ping=False)
+        conn = conn_pool.getconn()
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(conn_pool.getconn()))
+        waiter.start()
+        deadline = time.monotonic() + 5
+        while conn_pool.waiters == 0:
+            self.assertLess(time.monotonic(), deadline, "getconn() never waited")
+            time.sleep(0.001)
+
+        conn_pool.putconn(conn)
+        waiter.join(timeout=5)
+
+        self.assertEqual(result, [conn])
+        self.assertEqual(conn_pool.waiters, 0)
+
+    def test_replaces_connection_older_than_max_age(self, mock_connect):
+        conn_pool = self._pool(mock_connect, max_age=60)
+        conn = conn_pool.getconn()
+        conn_pool.putconn(conn)
+        self.clock.now = 30
+        self.assertIs(conn_pool.getconn(), conn)
+        conn_pool.putconn(conn)
+
+        self.clock.now = 61
+        fresh = conn_pool.getconn()
+
+        self.assertIsNot(fresh, conn)
+        conn.close.assert_called_once()
+
+    def test_pre_ping_replaces_dead_connection(self, mock_connect):
+        conn_pool = self._pool(mock_connect, pre_ping=True)
+        conn = conn_pool.getconn()
+        conn_pool.putconn(conn)
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.execute.side_effect = psycopg2.OperationalError("server closed")
+
+        fresh = conn_pool.getconn()
+
+        self.assertIsNot(fresh, conn)
+        conn.close.assert_called_once()
+        self.assertEqual(conn_pool.in_use, 1)
+
+    def test_pre_ping_restores_autocommit(self, mock_connect):
+        conn_pool = self._pool(mock_connect, pre_ping=True)
+        conn = conn_pool.getconn()
+        conn_pool.putconn(conn)
+
+        self.assertIs(conn_pool.getconn(), conn)
+        self.assertFalse(conn.autocommit)
+
+    def test_putconn_rolls_back_open_transaction(self, mock_connect):
+        conn_pool = self._pool(mock_connect)
+        conn = conn_pool.getconn()
+        conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+
+        conn_pool.putconn(conn)
+
+        conn.rollback.assert_called_once()
+        self.assertEqual(conn_pool.idle, 1)
+
+    def test_putconn_drops_closed_connection(self, mock_connect):
+        conn_pool = self._pool(mock_connect, maxconn=1)
+        conn = conn_pool.getconn()
+        conn.closed = 2
+
+        conn_pool.putconn(conn)
+
+        self.assertEqual((conn_pool.in_use, conn_pool.idle), (0, 0))
+        self.assertIsNot(conn_pool.getconn(), conn)
+
+    def test_failed_connect_frees_slot(self, mock_connect):
+        conn_pool = self._pool(mock_connect, maxconn=1)
+        mock_connect.side_effect = psycopg2.OperationalError("down")
+
+        with self.assertRaises(psycopg2.OperationalError):
+            conn_pool.getconn()
+
+        mock_connect.side_effect = lambda **kw: _make_conn()
+        conn_pool.getconn(timeout=0)
+
+    def test_closeall_closes_idle_connections(self, mock_connect):
+        conn_pool = self._pool(mock_connect, minconn=2)
+        idle = list(conn_pool._idle)
+
+        conn_pool.closeall()
+
+        for conn in idle:
+            conn.close.assert_called_once()
+        with self.assertRaises(db_module.pool.PoolError):
+            conn_pool.getconn()
+
+    def test_records_acquire_latency(self, mock_connect):
+        conn_pool = self._pool(mock_connect)
+        before = db_module.ACQUIRE_SECONDS.count()
+
+        conn_pool.getconn()
+
+        self.assertEqual(db_module.ACQUIRE_SECONDS.count(), before + 1)
+
+
+class TestReplicaRouter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.router = db_module.ReplicaRouter(
+            2, max_lag=5, check_interval=10, clock=self.clock
+        )
+
+    def test_unprobed_replicas_are_candidates(self):
+        self.assertEqual(self.router.order(), [0, 1])
+        self.assertEqual(self.router.order(), [1, 0])
+
+    def test_only_one_caller_claims_each_probe(self):
+        self.assertTrue(self.router.claim_probe(0))
+        self.assertFalse(self.router.claim_probe(0))
+
+        self.clock.now = 10
+        self.assertTrue(self.router.claim_probe(0))
+
+    def test_round_robins_healthy_replicas(self):
+        for index, lag in ((0, 0.0), (1, 1.0)):
+            self.router.claim_probe(index)
+            self.router.record(index, lag)
+
+        self.assertEqual(self.router.order(), [0, 1])
+        self.assertEqual(self.router.order(), [1, 0])
+
+    def test_skips_lagging_or_unreachable_replicas_until_next_probe(self):
+        self.router.claim_probe(0)
+        self.router.claim_probe(1)
+        self.assertFalse(self.router.record(0, 30.0))
+        self.assertFalse(self.router.record(1, None))
+
+        self.assertEqual(self.router.order(), [])
+
+        self.clock.now = 10
+        self.assertEqual(self.router.order(), [1, 0])
+
+    def test_no_replicas(self):
+        self.assertEqual(db_module.ReplicaRouter(0).order(), [])
+
+
+class TestReplicaAddress(unittest.TestCase):
+    def test_defaults_to_primary_port(self):
+        self.assertEqual(
+            db_module.replica_address("replica-1"), ("replica-1", db_module.DB_PORT)
+        )
+
+    def test_parses_port(self):
+        self.assertEqual(
+            db_module.replica_address("10.0.0.2:6432"), ("10.0.0.2", "6432")
+        )
+
+
+class TestGetReadConn(unittest.TestCase):
+    def setUp(self):
+        _reset_pool()
+        self.primary = MagicMock()
+        db_module._pool = self.primary
+
+    def tearDown(self):
+        _reset_pool()
+
+    def _add_replicas(self, *lags):
+        db_module._replicas = [MagicMock() for _ in lags]
+        db_module._router = db_module.ReplicaRouter(len(lags), max_lag=5)
+        for replica, lag in zip(db_module._replicas, lags):
+            conn = replica.getconn.return_value
+            cur = conn.cursor.return_value.__enter__.return_value
+            if isinstance(lag, Exception):
+                cur.execute.side_effect = lag
+            else:
+                cur.fetchone.return_value = (lag,)
+
+    def test_raises_when_pool_not_initialized(self):
+        db_module._pool = None
+        with self.assertRaises(RuntimeError):
+            db_module.get_read_conn()
+
+    def test_uses_primary_without_replicas(self):
+        self.assertIs(db_module.get_read_conn(), self.primary.getconn.return_value)
+
+    def test_uses_fresh_replica(self):
+        self._add_replicas(0.5)
+
+        conn = db_module.get_read_conn()
+
+        self.assertIs(conn, db_module._replicas[0].getconn.return_value)
+        self.primary.getconn.assert_not_called()
+
+    def test_balances_across_replicas(self):
+        self._add_replicas(0.0, 0.0)
+
+        first, second = db_module.get_read_conn(), db_module.get_read_conn()
+
+        self.assertIs(first, db_module._replicas[0].getconn.return_value)
+        self.assertIs(second, db_module._replicas[1].getconn.return_value)
+
+    def test_falls_back_to_primary_when_replica_lags(self):
+        self._add_replicas(60.0)
+        replica = db_module._replicas[0]
+
+        conn = db_module.get_read_conn()
+
+        self.assertIs(conn, self.primary.getconn.return_value)
+        replica.putconn.assert_called_once_with(
+            replica.getconn.return_value, close=False
+        )
+
+    def test_skips_replica_whose_lag_check_fails(self):
+        self._add_replicas(psycopg2.OperationalError("gone"), 0.0)
+
+        conn = db_module.get_read_conn()
+
+        self.assertIs(conn, db_module._replicas[1].getconn.return_value)
+        db_module._replicas[0].putconn.assert_called_once_with(
+            db_module._replicas[0].getconn.return_value, close=True
+        )
+
+    def test_skips_unreachable_replica(self):
+        self._add_replicas(0.0)
+        db_module._replicas[0].getconn.side_effect = psycopg2.OperationalError("down")
+
+        self.assertIs(db_module.get_read_conn(), self.primary.getconn.return_value)
+
+    def test_put_conn_returns_connection_to_its_replica(self):
+        self._add_replicas(0.0)
+        replica = db_module._replicas[0]
+        conn = db_module.get_read_conn()
+        replica.owns.side_effect = lambda c: c is conn
+
+        db_module.put_conn(conn)
+
+        replica.putconn.assert_called_once_with(conn)
+        self.primary.putconn.assert_not_called()
+
+
 if __name__ == "__main__":
     unittest.main()
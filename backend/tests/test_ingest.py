@@ -0,0 +1,168 @@
+"""Unit tests for server/ingest.py."""
+
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import metrics_pb2
+
+from server.ingest import AsyncIngestBuffer, IngestBuffer
+from server.settings import DEFAULT_METER_ID
+
+MetricPoint = getattr(metrics_pb2, "MetricPoint")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestIngestBuffer(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    @patch("server.ingest.insert_readings")
+    def test_buffers_until_row_threshold(self, mock_insert):
+        mock_insert.side_effect = lambda rows: len(rows)
+        buffer = IngestBuffer(flush_rows=3, flush_seconds=60, clock=self.clock)
+
+        buffer.add([MetricPoint(time="2021-01-01 00:00:00", meterusage=1.0)] * 2)
+        mock_insert.assert_not_called()
+
+        buffer.add([MetricPoint(time="2021-01-01 00:15:00", meterusage=2.0)])
+
+        mock_insert.assert_called_once()
+        self.assertEqual(len(mock_insert.call_args[0][0]), 3)
+        self.assertEqual(buffer.accepted, 3)
+
+    @patch("server.ingest.insert_readings")
+    def test_flushes_after_time_threshold(self, mock_insert):
+        mock_insert.side_effect = lambda rows: len(rows)
+        buffer = IngestBuffer(flush_rows=1000, flush_seconds=1.0, clock=self.clock)
+
+        buffer.add([MetricPoint(time="2021-01-01 00:00:00", meterusage=1.0)])
+        mock_insert.assert_not_called()
+
+        self.clock.now = 1.5
+        buffer.add([MetricPoint(time="2021-01-01 00:15:00", meterusage=2.0)])
+
+        mock_insert.assert_called_once_with(
+            [
+                ("2021-01-01 00:00:00+00:00", 1.0, DEFAULT_METER_ID),
+                ("2021-01-01 00:15:00+00:00", 2.0, DEFAULT_METER_ID),
+            ]
+        )
+
+    @patch("server.ingest.insert_readings")
+    def test_counts_rejected_points(self, mock_insert):
+        mock_insert.side_effect = lambda rows: len(rows)
+        buffer = IngestBuffer(flush_rows=1000, flush_seconds=60, clock=self.clock)
+
+        buffer.add(
+            [
+                MetricPoint(time="not a time", meterusage=1.0),
+                MetricPoint(time="2021-01-01 00:00:00", meterusage=float("nan")),
+                MetricPoint(time="2021-01-01 00:15:00", meterusage=3.0),
+            ]
+        )
+        buffer.flush()
+
+        self.assertEqual(buffer.accepted, 1)
+        self.assertEqual(buffer.rejected, 2)
+
+    @patch("server.ingest.insert_readings")
+    def test_flush_with_empty_buffer_does_not_write(self, mock_insert):
+        buffer = IngestBuffer(clock=self.clock)
+
+        buffer.flush()
+
+        mock_insert.assert_not_called()
+        self.assertEqual(buffer.accepted, 0)
+
+    @patch("server.ingest.insert_readings")
+    def test_consume_flushes_while_the_stream_is_quiet(self, mock_insert):
+        written = threading.Event()
+
+        def insert(rows):
+            written.set()
+            return len(rows)
+
+        def batches():
+            yield [MetricPoint(time="2021-01-01 00:00:00", meterusage=1.0)]
+            # No further batch arrives until the timer has written the first.
+            self.assertTrue(written.wait(5))
+            yield [MetricPoint(time="2021-01-01 00:15:00", meterusage=2.0)]
+
+        mock_insert.side_effect = insert
+        buffer = IngestBuffer(flush_rows=1000, flush_seconds=0.05)
+
+        buffer.consume(batches())
+
+        self.assertEqual(mock_insert.call_count, 2)
+        self.assertEqual(buffer.accepted, 2)
+
+    @patch("server.ingest.insert_readings")
+    def test_consume_raises_failed_timed_flush(self, mock_insert):
+        mock_insert.side_effect = RuntimeError("DB down")
+
+        def batches():
+            yield [MetricPoint(time="2021-01-01 00:00:00", meterusage=1.0)]
+            for _ in range(500):
+                if mock_insert.called:
+                    break
+                time.sleep(0.01)
+
+        buffer = IngestBuffer(flush_rows=1000, flush_seconds=0.05)
+
+        with self.assertLogs("server.ingest", "ERROR"):
+            with self.assertRaisesRegex(RuntimeError, "DB down"):
+                buffer.consume(batches())
+        mock_insert.assert_called_once()
+
+
+class TestAsyncIngestBuffer(unittest.IsolatedAsyncioTestCase):
+    @patch("server.ingest.aio_orm.insert_readings", new_callable=AsyncMock)
+    async def test_flushes_through_async_orm(self, mock_insert):
+        mock_insert.side_effect = lambda rows: len(rows)
+        buffer = AsyncIngestBuffer(flush_rows=2, flush_seconds=60, clock=FakeClock())
+
+        await buffer.add([MetricPoint(time="2021-01-01 00:00:00", meterusage=1.0)])
+        mock_insert.assert_not_awaited()
+
+        await buffer.add(
+            [
+                MetricPoint(time="2021-01-01 00:15:00", meterusage=2.0),
+                MetricPoint(time="bad", meterusage=3.0),
+            ]
+        )
+        await buffer.flush()
+
+        mock_insert.assert_awaited_once()
+        self.assertEqual(buffer.accepted, 2)
+        self.assertEqual(buffer.rejected, 1)
+
+    @patch("server.ingest.aio_orm.insert_readings", new_callable=AsyncMock)
+    async def test_consume_flushes_while_the_stream_is_quiet(self, mock_insert):
+        mock_insert.side_effect = lambda rows: len(rows)
+
+        async def batches():
+            yield [MetricPoint(time="2021-01-01 00:00:00", meterusage=1.0)]
+            while not mock_insert.await_count:
+                await asyncio.sleep(0.01)
+            yield [MetricPoint(time="2021-01-01 00:15:00", meterusage=2.0)]
+
+        buffer = AsyncIngestBuffer(flush_rows=1000, flush_seconds=0.05)
+
+        await asyncio.wait_for(buffer.consume(batches()), 5)
+
+        self.assertEqual(mock_insert.await_count, 2)
+        self.assertEqual(buffer.accepted, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+"""Unit tests for server/monitoring.py."""
+
+import unittest
+from unittest.mock import MagicMock
+
+import grpc
+import metrics_pb2
+
+from server import monitoring
+from server.monitoring import AsyncMetricsInterceptor, MetricsInterceptor
+from server.telemetry import STAGE_SECONDS, current_rpc, stage
+
+MetricsResponse = getattr(metrics_pb2, "MetricsResponse")
+
+
+def _details(method):
+    details = MagicMock()
+    details.method = f"/metrics.MetricsService/{method}"
+    return details
+
+
+def _context(code=None):
+    context = MagicMock()
+    context.code.return_value = code
+    return context
+
+
+class TestMetricsInterceptor(unittest.TestCase):
+    def _intercept(self, handler, method):
+        return MetricsInterceptor().intercept_service(
+            lambda details: handler, _details(method)
+        )
+
+    def test_unary_records_duration_status_and_bytes(self):
+        seen = []
+
+        def behavior(request, context):
+            seen.append(current_rpc.get())
+            with stage("execute"):
+                pass
+            return MetricsResponse()
+
+        handler = grpc.unary_unary_rpc_method_handler(
+            behavior, response_serializer=lambda msg: b"12345"
+        )
+        before = monitoring.RPC_SECONDS.count(method="UnaryTest")
+
+        wrapped = self._intercept(handler, "UnaryTest")
+        response = wrapped.unary_unary(None, _context())
+        wrapped.response_serializer(response)
+
+        self.assertEqual(seen, ["UnaryTest"])
+        self.assertEqual(current_rpc.get(), "")
+        self.assertEqual(monitoring.RPC_SECONDS.count(method="UnaryTest"), before + 1)
+        self.assertEqual(
+            monitoring.RPC_TOTAL.value(method="UnaryTest", code="OK"), before + 1
+        )
+        self.assertEqual(monitoring.RPC_IN_FLIGHT.value(method="UnaryTest"), 0)
+        self.assertEqual(STAGE_SECONDS.count(method="UnaryTest", stage="execute"), 1)
+        self.assertEqual(STAGE_SECONDS.count(method="UnaryTest", stage="serialize"), 1)
+        self.assertEqual(monitoring.RESPONSE_BYTES.count(method="UnaryTest"), 1)
+
+    def test_records_abort_status(self):
+        def behavior(request, context):
+            raise RuntimeError("aborted")
+
+        handler = grpc.unary_unary_rpc_method_handler(behavior)
+        wrapped = self._intercept(handler, "AbortTest")
+
+        with self.assertRaises(RuntimeError):
+            wrapped.unary_unary(None, _context(grpc.StatusCode.INVALID_ARGUMENT))
+
+        self.assertEqual(
+            monitoring.RPC_TOTAL.value(method="AbortTest", code="INVALID_ARGUMENT"), 1
+        )
+
+    def test_unhandled_error_counts_as_unknown(self):
+        def behavior(request, context):
+            raise RuntimeError("boom")
+
+        wrapped = self._intercept(
+            grpc.unary_unary_rpc_method_handler(behavior), "ErrorTest"
+        )
+
+        with self.assertRaises(RuntimeError):
+            wrapped.unary_unary(None, _context())
+
+        self.assertEqual(
+            monitoring.RPC_TOTAL.value(method="ErrorTest", code="UNKNOWN"), 1
+        )
+
+    def test_stream_stays_in_flight_until_exhausted(self):
+        handler = grpc.unary_stream_rpc_method_handler(
+            lambda request, context: iter([MetricsResponse(), MetricsResponse()])
+        )
+        wrapped = self._intercept(handler, "StreamTest")
+
+        responses = wrapped.unary_stream(None, _context())
+        next(responses)
+        self.assertEqual(monitoring.RPC_IN_FLIGHT.value(method="StreamTest"), 1)
+        list(responses)
+
+        self.assertEqual(monitoring.RPC_IN_FLIGHT.value(method="StreamTest"), 0)
+        self.assertEqual(monitoring.RPC_SECONDS.count(method="StreamTest"), 1)
+
+    def test_preserialized_bytes_are_not_timed_as_serialization(self):
+        handler = grpc.unary_unary_rpc_method_handler(
+            lambda request, context: b"cached",
+            response_serializer=lambda msg: msg,
+        )
+        wrapped = self._intercept(handler, "CachedTest")
+
+        wrapped.response_serializer(b"cached")
+
+        self.assertEqual(STAGE_SECONDS.count(method="CachedTest", stage="serialize"), 0)
+        self.assertEqual(monitoring.RESPONSE_BYTES.count(method="CachedTest"), 1)
+
+    def test_unknown_method_returns_none(self):
+        self.assertIsNone(self._intercept(None, "Missing"))
+
+
+class TestObserveRows(unittest.TestCase):
+    def test_counts_columnar_and_row_points(self):
+        token = current_rpc.set("RowsTest")
+        try:
+            response = MetricsResponse()
+            response.columns.time_unix_ms.extend([1, 2, 3])
+            monitoring.observe_rows(response)
+        finally:
+            current_rpc.reset(token)
+
+        samples = dict(
+            ((name, labels.get("method")), value)
+            for name, labels, value in monitoring.RESPONSE_ROWS.samples()
+        )
+        self.assertEqual(samples[("grpc_server_response_rows_sum", "RowsTest")], 3)
+
+
+class TestAsyncMetricsInterceptor(unittest.IsolatedAsyncioTestCase):
+    async def test_async_stream_records_rpc(self):
+        async def behavior(request, context):
+            yield MetricsResponse()
+            yield MetricsResponse()
+
+        handler = grpc.unary_stream_rpc_method_handler(behavior)
+
+        async def continuation(details):
+            return handler
+
+        wrapped = await AsyncMetricsInterceptor().intercept_service(
+            continuation, _details("AsyncStreamTest")
+        )
+        responses = [r async for r in wrapped.unary_stream(None, _context())]
+
+        self.assertEqual(len(responses), 2)
+        self.assertEqual(
+            monitoring.RPC_TOTAL.value(method="AsyncStreamTest", code="OK"), 1
+        )
+        self.assertEqual(monitoring.RPC_IN_FLIGHT.value(method="AsyncStreamTest"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,59 @@
 """Unit tests for server/orm.py."""
 
-import io
+import hashlib
+import os
+import struct
+import tempfile
 import unittest
+from datetime import datetime, timedelta, timezone
 from unittest.mock import MagicMock, call, patch
 
-from server.orm import _seed, get_readings, setup_db
+import psycopg2
+
+from server.orm import (
+    _CLAIM_SEED_SPANS_SQL,
+    _LOG_SEED_SPANS_SQL,
+    _RETENTION_PROCEDURE_SQL,
+    _UNDETECTED_SQL,
+    _CopyStream,
+    _clean_file,
+    _compress_chunks,
+    _configure_storage,
+    _copy_rows,
+    _detect_backlog,
+    _pending_sources,
+    _rescan,
+    _seed,
+    _seed_files,
+    _seed_paths,
+    _seed_source,
+    aggregate_readings,
+    data_version,
+    get_anomalies,
+    get_reading_columns,
+    get_readings,
+    get_summary,
+    insert_readings,
+    iter_readings,
+    list_meters,
+    parse_reading,
+    seed_db,
+    setup_db,
+)
+from server.queries import (
+    BUMP_VERSION_SQL,
+    CREATE_STAGING_SQL,
+    DELETE_ANOMALIES_SQL,
+    INSERT_ANOMALY_SQL,
+    LOCK_ANOMALY_STATE_SQL,
+    LOCK_METERS_SQL,
+    MERGE_STAGING_SQL,
+    RESCAN_PAGE_SQL,
+    SAVE_ANOMALY_STATE_SQL,
+    WINDOW_BEFORE_SQL,
+    columns_query,
+)
+from server.settings import COMPRESS_AFTER, DEFAULT_METER_ID
 
 
 def _make_cursor(fetchone_returns=None, fetchall_returns=None):
@@ -24,40 +73,110 @@ def _make_conn(cursor):
 
 class TestGetReadings(unittest.TestCase):
     @patch("server.orm.put_conn")
-    @patch("server.orm.get_conn")
-    def test_returns_all_rows(self, mock_get_conn, mock_put_conn):
-        rows = [("2021-01-01 00:00:00+00", 1.5), ("2021-01-01 01:00:00+00", 2.0)]
+    @patch("server.orm.get_read_conn")
+    def test_returns_all_rows(self, mock_get_read_conn, mock_put_conn):
+        rows = [
+            ("2021-01-01 00:00:00+00", 1.5, "m1"),
+            ("2021-01-01 01:00:00+00", 2.0, "m1"),
+        ]
         cur = _make_cursor(fetchall_returns=rows)
         conn = _make_conn(cur)
-        mock_get_conn.return_value = conn
+        mock_get_read_conn.return_value = conn
 
         result = get_readings()
 
         self.assertEqual(result, rows)
         cur.execute.assert_called_once_with(
-            "SELECT time, meterusage FROM meter_readings ORDER BY time;"
+            "SELECT time, meterusage, meter_id FROM meter_readings"
+            " ORDER BY time, meter_id;",
+            [],
         )
         cur.close.assert_called_once()
         mock_put_conn.assert_called_once_with(conn)
 
     @patch("server.orm.put_conn")
-    @patch("server.orm.get_conn")
-    def test_returns_empty_list_when_no_rows(self, mock_get_conn, mock_put_conn):
+    @patch("server.orm.get_read_conn")
+    def test_pushes_filters_into_sql(self, mock_get_read_conn, mock_put_conn):
+        cur = _make_cursor(fetchall_returns=[])
+        mock_get_read_conn.return_value = _make_conn(cur)
+        start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        end = datetime(2021, 2, 1, tzinfo=timezone.utc)
+        after = datetime(2021, 1, 15, tzinfo=timezone.utc)
+
+        get_readings(start=start, end=end, after=after, limit=100)
+
+        cur.execute.assert_called_once_with(
+            "SELECT time, meterusage, meter_id FROM meter_readings"
+            " WHERE time >= %s AND time < %s AND time > %s"
+            " ORDER BY time, meter_id LIMIT %s;",
+            [start, end, after, 100],
+        )
+
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_single_meter_uses_equality(self, mock_get_read_conn, mock_put_conn):
+        cur = _make_cursor(fetchall_returns=[])
+        mock_get_read_conn.return_value = _make_conn(cur)
+
+        get_readings(meter_ids=["m1"])
+
+        cur.execute.assert_called_once_with(
+            "SELECT time, meterusage, meter_id FROM meter_readings"
+            " WHERE meter_id = %s ORDER BY time, meter_id;",
+            ["m1"],
+        )
+
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_multiple_meters_and_keyset_cursor(self, mock_get_read_conn, mock_put_conn):
+        cur = _make_cursor(fetchall_returns=[])
+        mock_get_read_conn.return_value = _make_conn(cur)
+        after = datetime(2021, 1, 15, tzinfo=timezone.utc)
+
+        get_readings(meter_ids=["m1", "m2"], after=after, after_meter="m1")
+
+        cur.execute.assert_called_once_with(
+            "SELECT time, meterusage, meter_id FROM meter_readings"
+            " WHERE meter_id = ANY(%s)"
+            " AND time >= %s AND (time, meter_id) > (%s, %s)"
+            " ORDER BY time, meter_id;",
+            [["m1", "m2"], after, after, "m1"],
+        )
+
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_epoch_us_selects_integer_microseconds(
+        self, mock_get_read_conn, mock_put_conn
+    ):
+        cur = _make_cursor(fetchall_returns=[])
+        mock_get_read_conn.return_value = _make_conn(cur)
+
+        get_readings(epoch_us=True)
+
+        cur.execute.assert_called_once_with(
+            "SELECT (extract(epoch FROM time) * 1000000)::bigint, meterusage,"
+            " meter_id FROM meter_readings ORDER BY time, meter_id;",
+            [],
+        )
+
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_returns_empty_list_when_no_rows(self, mock_get_read_conn, mock_put_conn):
         cur = _make_cursor(fetchall_returns=[])
         conn = _make_conn(cur)
-        mock_get_conn.return_value = conn
+        mock_get_read_conn.return_value = conn
 
         result = get_readings()
 
         self.assertEqual(result, [])
 
     @patch("server.orm.put_conn")
-    @patch("server.orm.get_conn")
-    def test_always_returns_conn_on_exception(self, mock_get_conn, mock_put_conn):
+    @patch("server.orm.get_read_conn")
+    def test_always_returns_conn_on_exception(self, mock_get_read_conn, mock_put_conn):
         cur = MagicMock()
         cur.execute.side_effect = Exception("DB error")
         conn = _make_conn(cur)
-        mock_get_conn.return_value = conn
+        mock_get_read_conn.return_value = conn
 
         with self.assertRaises(Exception):
             get_readings()
@@ -65,23 +184,249 @@ class TestGetReadings(unittest.TestCase):
         mock_put_conn.assert_called_once_with(conn)
 
 
+class TestReadingColumns(unittest.TestCase):
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_copies_binary_and_decodes(self, mock_get_read_conn, mock_put_conn):
+        cur = MagicMock()
+        cur.mogrify.return_value = b"SELECT 1"
+        data = b"PGCOPY\n\xff\r\n\x00" + bytes(8)
+        data += struct.pack(">hiqid", 2, 8, 1000, 8, 1.5) + b"\xff\xff"
+        cur.copy_expert.side_effect = lambda sql, f: f.write(data)
+        conn = _make_conn(cur)
+        mock_get_read_conn.return_value = conn
+
+        result = get_reading_columns(["a"], limit=1)
+
+        self.assertEqual(result, ([1000], [1.5], None))
+        self.assertEqual(
+            cur.copy_expert.call_args[0][0],
+            "COPY (SELECT 1) TO STDOUT WITH (FORMAT binary)",
+        )
+        cur.mogrify.assert_called_once_with(*columns_query(["a"], limit=1))
+        mock_put_conn.assert_called_once_with(conn)
+
+
+class TestIterReadings(unittest.TestCase):
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_yields_rows_from_named_cursor(self, mock_get_read_conn, mock_put_conn):
+        rows = [
+            ("2021-01-01 00:00:00+00", 1.5, "m1"),
+            ("2021-01-01 01:00:00+00", 2.0, "m1"),
+        ]
+        cur = MagicMock()
+        cur.__iter__.return_value = iter(rows)
+        conn = _make_conn(cur)
+        mock_get_read_conn.return_value = conn
+
+        result = list(iter_readings(itersize=500))
+
+        self.assertEqual(result, rows)
+        conn.cursor.assert_called_once_with(name="meter_readings_stream")
+        self.assertEqual(cur.itersize, 500)
+        cur.execute.assert_called_once_with(
+            "SELECT time, meterusage, meter_id FROM meter_readings"
+            " ORDER BY time, meter_id;",
+            [],
+        )
+        cur.fetchall.assert_not_called()
+        cur.close.assert_called_once()
+        mock_put_conn.assert_called_once_with(conn)
+
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_returns_conn_when_consumer_stops_early(
+        self, mock_get_read_conn, mock_put_conn
+    ):
+        cur = MagicMock()
+        cur.__iter__.return_value = iter([("t1", 1.0), ("t2", 2.0)])
+        conn = _make_conn(cur)
+        mock_get_read_conn.return_value = conn
+
+        gen = iter_readings()
+        next(gen)
+        gen.close()
+
+        cur.close.assert_called_once()
+        mock_put_conn.assert_called_once_with(conn)
+
+
+class TestListMeters(unittest.TestCase):
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_returns_meter_ids_via_loose_index_scan(
+        self, mock_get_read_conn, mock_put_conn
+    ):
+        cur = _make_cursor(fetchall_returns=[("m1",), ("m2",)])
+        conn = _make_conn(cur)
+        mock_get_read_conn.return_value = conn
+
+        result = list_meters()
+
+        self.assertEqual(result, ["m1", "m2"])
+        self.assertIn("WITH RECURSIVE", cur.execute.call_args[0][0])
+        mock_put_conn.assert_called_once_with(conn)
+
+
+class TestDataVersion(unittest.TestCase):
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_formats_creation_time_and_counter(self, mock_get_read_conn, mock_put_conn):
+        cur = _make_cursor(fetchone_returns=(255, 7))
+        conn = _make_conn(cur)
+        mock_get_read_conn.return_value = conn
+
+        self.assertEqual(data_version(), "ff-7")
+        self.assertIn("FROM data_version", cur.execute.call_args[0][0])
+        mock_put_conn.assert_called_once_with(conn)
+
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_missing_row_is_version_zero(self, mock_get_read_conn, mock_put_conn):
+        cur = _make_cursor()
+        cur.fetchone.return_value = None
+        mock_get_read_conn.return_value = _make_conn(cur)
+
+        self.assertEqual(data_version(), "0-0")
+
+
+class TestAggregateReadings(unittest.TestCase):
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_buckets_with_time_bucket(self, mock_get_read_conn, mock_put_conn):
+        rows = [("2021-01-01 00:00:00+00", 55.0, "m1")]
+        cur = _make_cursor(fetchall_returns=rows)
+        conn = _make_conn(cur)
+        mock_get_read_conn.return_value = conn
+        start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+        result = aggregate_readings(
+            "max", bucket_width=timedelta(hours=1), start=start, meter_ids=["m1"]
+        )
+
+        self.assertEqual(result, rows)
+        cur.execute.assert_called_once_with(
+            "SELECT time_bucket(%s::interval, time) AS bucket_start, max(meterusage),"
+            " meter_id FROM meter_readings WHERE time >= %s AND meter_id = %s"
+            " GROUP BY bucket_start, meter_id ORDER BY bucket_start, meter_id;",
+            [timedelta(hours=1), start, "m1"],
+        )
+        mock_put_conn.assert_called_once_with(conn)
+
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_month_buckets_use_interval_string(self, mock_get_read_conn, mock_put_conn):
+        cur = _make_cursor(fetchall_returns=[])
+        mock_get_read_conn.return_value = _make_conn(cur)
+
+        aggregate_readings("last", bucket_months=3)
+
+        sql, params = cur.execute.call_args[0]
+        self.assertIn("last(meterusage, time)", sql)
+        self.assertEqual(params, ["3 months"])
+
+    @patch("server.queries.CONTINUOUS_AGGREGATES", True)
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_routes_to_coarsest_rollup(self, mock_get_read_conn, mock_put_conn):
+        cur = _make_cursor(fetchall_returns=[])
+        mock_get_read_conn.return_value = _make_conn(cur)
+        start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+        aggregate_readings("avg", bucket_width=timedelta(days=7), start=start)
+
+        sql, params = cur.execute.call_args[0]
+        self.assertEqual(
+            sql,
+            "SELECT time_bucket(%s::interval, bucket) AS bucket_start,"
+            " sum(total) / sum(readings), meter_id FROM meter_readings_daily"
+            " WHERE bucket >= %s"
+            " GROUP BY bucket_start, meter_id ORDER BY bucket_start, meter_id;",
+        )
+        self.assertEqual(params, [timedelta(days=7), start])
+
+    @patch("server.queries.CONTINUOUS_AGGREGATES", True)
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_unaligned_window_falls_back_to_finer_rollup(
+        self, mock_get_read_conn, mock_put_conn
+    ):
+        cur = _make_cursor(fetchall_returns=[])
+        mock_get_read_conn.return_value = _make_conn(cur)
+        start = datetime(2021, 1, 1, 6, tzinfo=timezone.utc)
+
+        aggregate_readings("max", bucket_months=1, start=start)
+
+        self.assertIn("FROM meter_readings_hourly", cur.execute.call_args[0][0])
+
+    @patch("server.queries.CONTINUOUS_AGGREGATES", True)
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_sub_hour_bucket_reads_raw_table(self, mock_get_read_conn, mock_put_conn):
+        cur = _make_cursor(fetchall_returns=[])
+        mock_get_read_conn.return_value = _make_conn(cur)
+
+        aggregate_readings("sum", bucket_width=timedelta(minutes=90))
+
+        self.assertIn("FROM meter_readings ", cur.execute.call_args[0][0])
+
+    @patch("server.orm.get_read_conn")
+    def test_rejects_unknown_aggregate(self, mock_get_read_conn):
+        with self.assertRaises(ValueError):
+            aggregate_readings("median", bucket_width=timedelta(hours=1))
+        mock_get_read_conn.assert_not_called()
+
+    @patch("server.orm.get_read_conn")
+    def test_rejects_missing_or_ambiguous_bucket(self, mock_get_read_conn):
+        with self.assertRaises(ValueError):
+            aggregate_readings("avg")
+        with self.assertRaises(ValueError):
+            aggregate_readings("avg", bucket_width=timedelta(0))
+        with self.assertRaises(ValueError):
+            aggregate_readings("avg", bucket_width=timedelta(hours=1), bucket_months=1)
+        mock_get_read_conn.assert_not_called()
+
+
+class TestGetSummary(unittest.TestCase):
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_combines_partials_per_meter(self, mock_get_read_conn, mock_put_conn):
+        peak = datetime(2021, 1, 1, 18, tzinfo=timezone.utc)
+        cur = _make_cursor(fetchall_returns=[("m1", 10.0, 4, 1.0, 4.0, peak)])
+        conn = _make_conn(cur)
+        mock_get_read_conn.return_value = conn
+
+        rows = get_summary(meter_ids=["m1"])
+
+        self.assertEqual(rows, [("m1", 10.0, 4, 1.0, 4.0, peak)])
+        sql = cur.execute.call_args[0][0]
+        self.assertIn("last(peak_time, maximum)", sql)
+        self.assertTrue(sql.endswith("GROUP BY meter_id ORDER BY meter_id;"))
+        mock_put_conn.assert_called_once_with(conn)
+
+
 class TestSetupDb(unittest.TestCase):
     def _cur_for_setup(self, row_count):
         cur = MagicMock()
         cur.fetchone.return_value = (row_count,)
+        cur.rowcount = 0
         return cur
 
     @patch("server.orm._seed")
     @patch("server.orm.put_conn")
     @patch("server.orm.get_conn")
-    def test_seeds_when_table_is_empty(self, mock_get_conn, mock_put_conn, mock_seed):
+    def test_only_runs_ddl(self, mock_get_conn, mock_put_conn, mock_seed):
         cur = self._cur_for_setup(0)
         conn = _make_conn(cur)
         mock_get_conn.return_value = conn
 
         setup_db()
 
-        mock_seed.assert_called_once_with(cur)
+        mock_seed.assert_not_called()
+        sql = " ".join(c[0][0] for c in cur.execute.call_args_list)
+        self.assertIn("CREATE TABLE IF NOT EXISTS seed_state", sql)
+        self.assertNotIn("COUNT(*)", sql)
         conn.commit.assert_called_once()
         cur.close.assert_called_once()
         mock_put_conn.assert_called_once_with(conn)
@@ -89,7 +434,25 @@ class TestSetupDb(unittest.TestCase):
     @patch("server.orm._seed")
     @patch("server.orm.put_conn")
     @patch("server.orm.get_conn")
-    def test_skips_seed_when_table_populated(
+    def test_creates_meter_dimension_and_index(
+        self, mock_get_conn, mock_put_conn, mock_seed
+    ):
+        cur = self._cur_for_setup(42)
+        mock_get_conn.return_value = _make_conn(cur)
+
+        setup_db()
+
+        sql = " ".join(c[0][0] for c in cur.execute.call_args_list)
+        self.assertIn("ADD COLUMN IF NOT EXISTS meter_id", sql)
+        self.assertIn("partitioning_column => 'meter_id'", sql)
+        self.assertIn("chunk_time_interval => %s::interval", sql)
+        self.assertIn("ON meter_readings (meter_id, time DESC)", sql)
+
+    @patch("server.orm.CONTINUOUS_AGGREGATES", True)
+    @patch("server.orm._seed")
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_creates_rollups_when_enabled(
         self, mock_get_conn, mock_put_conn, mock_seed
     ):
         cur = self._cur_for_setup(42)
@@ -98,8 +461,118 @@ class TestSetupDb(unittest.TestCase):
 
         setup_db()
 
-        mock_seed.assert_not_called()
-        conn.commit.assert_called_once()
+        sql = " ".join(c[0][0] for c in cur.execute.call_args_list)
+        self.assertIn(
+            "CREATE MATERIALIZED VIEW IF NOT EXISTS meter_readings_hourly", sql
+        )
+        self.assertIn(
+            "CREATE MATERIALIZED VIEW IF NOT EXISTS meter_readings_daily", sql
+        )
+        self.assertIn("add_continuous_aggregate_policy", sql)
+
+    @patch("server.orm.CONTINUOUS_AGGREGATES", True)
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_recreates_rollups_without_meter_id(self, mock_get_conn, mock_put_conn):
+        for outdated in (True, False):
+            cur = self._cur_for_setup(outdated)
+            mock_get_conn.return_value = _make_conn(cur)
+
+            setup_db()
+
+            sql = " ".join(c[0][0] for c in cur.execute.call_args_list)
+            for view in ("meter_readings_hourly", "meter_readings_daily"):
+                self.assertEqual(
+                    f"DROP MATERIALIZED VIEW {view} CASCADE" in sql, outdated
+                )
+
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_adds_meter_dimension_to_empty_time_only_hypertable(
+        self, mock_get_conn, mock_put_conn
+    ):
+        for has_data in (False, True):
+            cur = MagicMock()
+            # No meter_id dimension yet; then whether the table holds rows.
+            cur.fetchone.side_effect = [(False,), (has_data,)] + [(True,)] * 10
+            cur.rowcount = 0
+            mock_get_conn.return_value = _make_conn(cur)
+
+            setup_db()
+
+            sql = " ".join(c[0][0] for c in cur.execute.call_args_list)
+            self.assertEqual(
+                "add_dimension('meter_readings', 'meter_id'" in sql, not has_data
+            )
+
+    @patch("server.orm.COMPRESSION", False)
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_backfills_summary_only_when_created(self, mock_get_conn, mock_put_conn):
+        for created in (True, False):
+            cur = MagicMock()
+            cur.fetchone.return_value = (created,)
+            cur.rowcount = 0
+            mock_get_conn.return_value = _make_conn(cur)
+
+            setup_db()
+
+            sql = " ".join(c[0][0] for c in cur.execute.call_args_list)
+            self.assertIn("CREATE TABLE IF NOT EXISTS meter_daily_summary", sql)
+            self.assertEqual(
+                "INSERT INTO meter_daily_summary SELECT" in sql, created, created
+            )
+
+    @patch("server.orm.COMPRESSION", False)
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_unique_index_replaces_plain_index_once(self, mock_get_conn, mock_put_conn):
+        for missing, duplicates in ((True, 0), (True, 3), (False, 0)):
+            cur = MagicMock()
+            # The meter dimension and the summary exist; the unique index is
+            # missing or not.
+            cur.fetchone.side_effect = [(True,), (False,), (missing,)]
+            cur.rowcount = duplicates
+            mock_get_conn.return_value = _make_conn(cur)
+
+            setup_db()
+
+            sql = " ".join(c[0][0] for c in cur.execute.call_args_list)
+            self.assertEqual(
+                "CREATE UNIQUE INDEX meter_readings_meter_id_time_key" in sql, missing
+            )
+            self.assertEqual("DELETE FROM meter_readings a" in sql, missing)
+            self.assertEqual(
+                "DROP INDEX IF EXISTS meter_readings_meter_id_time_idx" in sql, missing
+            )
+            # The summary is rebuilt only when duplicates were deleted.
+            self.assertEqual("TRUNCATE meter_daily_summary" in sql, bool(duplicates))
+            self.assertEqual(
+                "INSERT INTO meter_daily_summary SELECT" in sql, bool(duplicates)
+            )
+
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_decides_adoption_only_for_a_single_seed_file(
+        self, mock_get_conn, mock_put_conn
+    ):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for name in ("a.csv", "b.csv"):
+            _write(os.path.join(tmp.name, name), "time,meterusage\n")
+        adopt_sql = "SELECT NOT EXISTS (SELECT 1 FROM seed_state)"
+        for csv_path, adopt in (
+            (os.path.join(tmp.name, "a.csv"), True),
+            (tmp.name, False),
+        ):
+            cur = self._cur_for_setup(True)
+            mock_get_conn.return_value = _make_conn(cur)
+
+            with patch("server.orm.CSV_PATH", csv_path):
+                self.assertEqual(setup_db(), adopt)
+
+            sql = " ".join(c[0][0] for c in cur.execute.call_args_list)
+            self.assertEqual(adopt_sql in sql, adopt)
 
     @patch("server.orm._seed")
     @patch("server.orm.put_conn")
@@ -118,65 +591,908 @@ class TestSetupDb(unittest.TestCase):
         mock_put_conn.assert_called_once_with(conn)
 
 
-class TestSeed(unittest.TestCase):
-    CSV_CONTENT = "time,meterusage\n2021-01-01 00:00:00,1.5\n2021-01-01 01:00:00,2.0\n"
+class TestConfigureStorage(unittest.TestCase):
+    def _sql(self, cur):
+        return [c[0][0] for c in cur.execute.call_args_list]
+
+    @patch("server.orm.RETENTION", "")
+    def test_enables_compression_and_policy(self):
+        cur = _make_cursor(fetchone_returns=(False,))
+
+        _configure_storage(cur)
 
-    @patch("builtins.open")
-    def test_inserts_valid_rows(self, mock_open):
-        mock_open.return_value.__enter__ = lambda s: io.StringIO(self.CSV_CONTENT)
-        mock_open.return_value.__exit__ = MagicMock(return_value=False)
+        sql = " ".join(self._sql(cur))
+        self.assertIn("set_chunk_time_interval", sql)
+        self.assertIn("timescaledb.compress_segmentby = 'meter_id'", sql)
+        self.assertIn("timescaledb.compress_orderby   = 'time DESC'", sql)
+        self.assertIn("add_compression_policy", sql)
+        self.assertIn("remove_retention_policy", sql)
+        self.assertNotIn("add_retention_policy", sql)
+
+    def test_does_not_alter_already_compressed_table(self):
+        cur = _make_cursor(fetchone_returns=(True,))
+
+        _configure_storage(cur)
+
+        sql = " ".join(self._sql(cur))
+        self.assertNotIn("ALTER TABLE", sql)
+        self.assertIn("add_compression_policy", sql)
+
+    @patch("server.orm.COMPRESSION", False)
+    def test_compression_disabled_only_removes_policy(self):
         cur = MagicMock()
 
-        _seed(cur)
+        _configure_storage(cur)
+
+        sql = " ".join(self._sql(cur))
+        self.assertIn("remove_compression_policy", sql)
+        self.assertNotIn("add_compression_policy", sql)
+        self.assertNotIn("ALTER TABLE", sql)
+
+    @patch("server.orm.RETENTION", "2 years")
+    def test_adds_retention_job_when_configured(self):
+        cur = _make_cursor(fetchone_returns=(True,))
+
+        _configure_storage(cur)
+
+        sql = self._sql(cur)
+        self.assertIn(_RETENTION_PROCEDURE_SQL, sql)
+        add_job = cur.execute.call_args_list[-1][0]
+        self.assertIn("add_job('meter_readings_retention', '1 day'", add_job[0])
+        self.assertEqual(add_job[1], ("2 years",))
+        self.assertNotIn("add_retention_policy", " ".join(sql))
+        # The summary and the data version follow the dropped chunks.
+        self.assertIn("drop_chunks(", _RETENTION_PROCEDURE_SQL)
+        self.assertIn("DELETE FROM meter_daily_summary", _RETENTION_PROCEDURE_SQL)
+        self.assertIn(
+            "UPDATE data_version SET version = version + 1", _RETENTION_PROCEDURE_SQL
+        )
+
+    @patch("server.orm.RETENTION", "")
+    def test_removes_retention_job_when_unset(self):
+        cur = _make_cursor(fetchone_returns=(True,))
+
+        _configure_storage(cur)
+
+        sql = " ".join(self._sql(cur))
+        self.assertIn("delete_job(job_id)", sql)
+        self.assertNotIn("add_job", sql)
+
+    def test_compress_chunks_compresses_old_uncompressed_chunks(self):
+        cur = _make_cursor(fetchone_returns=(3,))
+
+        _compress_chunks(cur)
+
+        sql, params = cur.execute.call_args[0]
+        self.assertIn("compress_chunk", sql)
+        self.assertIn("NOT is_compressed", sql)
+        self.assertEqual(params, (COMPRESS_AFTER,))
+        cur.connection.commit.assert_called_once()
+
+
+def _write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+
+class _TransactionalConn:
+    """A connection that, like psycopg2, opens a transaction on the first
+    statement and refuses to change autocommit inside one."""
+
+    def __init__(self, cur):
+        self.cur = cur
+        self.in_transaction = False
+        self.switches = []
+        self._autocommit = False
+        cur.execute.side_effect = self._execute
+
+    def _execute(self, *args):
+        if not self._autocommit:
+            self.in_transaction = True
+
+    def cursor(self, *args, **kwargs):
+        return self.cur
+
+    def commit(self):
+        self.in_transaction = False
+
+    rollback = commit
+
+    @property
+    def autocommit(self):
+        return self._autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        if self.in_transaction:
+            raise psycopg2.ProgrammingError(
+                "set_session cannot be used inside a transaction"
+            )
+        self.switches.append(value)
+        self._autocommit = value
+
+
+class TestSeedDb(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        for name in ("b.csv", "a.csv"):
+            _write(os.path.join(self.dir, name), "time,meterusage\n")
+
+    @patch("server.orm.ANOMALY_DETECTION", True)
+    @patch("server.orm.CONTINUOUS_AGGREGATES", True)
+    @patch("server.orm._detect_backlog")
+    @patch("server.orm._seed_files")
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_seeds_pending_files_then_detects_and_refreshes(
+        self, mock_get_conn, mock_put_conn, mock_seed_files, mock_detect
+    ):
+        cur = _make_cursor(fetchall_returns=[])
+        conn = _make_conn(cur)
+        mock_get_conn.return_value = conn
+
+        with patch("server.orm.CSV_PATH", self.dir):
+            seed_db()
+
+        paths = [os.path.join(self.dir, name) for name in ("a.csv", "b.csv")]
+        mock_seed_files.assert_called_once_with(paths, adopt=False)
+        mock_detect.assert_called_once_with(cur)
+        sql = " ".join(c[0][0] for c in cur.execute.call_args_list)
+        self.assertIn("CALL refresh_continuous_aggregate", sql)
+        self.assertFalse(conn.autocommit)
+        mock_put_conn.assert_called_once_with(conn)
+
+    @patch("server.orm.ANOMALY_DETECTION", False)
+    @patch("server.orm.COMPRESSION", False)
+    @patch("server.orm.CONTINUOUS_AGGREGATES", True)
+    @patch("server.orm._seed_files")
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_refreshes_rollups_outside_a_transaction(
+        self, mock_get_conn, mock_put_conn, mock_seed_files
+    ):
+        conn = _TransactionalConn(_make_cursor(fetchall_returns=[]))
+        mock_get_conn.return_value = conn
+
+        with patch("server.orm.CSV_PATH", self.dir):
+            seed_db()
+
+        # Only the seed-state reads ran, and nothing else committed them.
+        self.assertEqual(conn.switches, [True, False])
+        sql = " ".join(c[0][0] for c in conn.cur.execute.call_args_list)
+        self.assertIn("CALL refresh_continuous_aggregate", sql)
+
+    @patch("server.orm.ANOMALY_DETECTION", False)
+    @patch("server.orm._seed_files")
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_passes_on_the_adoption_decided_at_setup(
+        self, mock_get_conn, mock_put_conn, mock_seed_files
+    ):
+        mock_get_conn.return_value = _make_conn(_make_cursor(fetchall_returns=[]))
+        path = os.path.join(self.dir, "a.csv")
 
-        cur.executemany.assert_called_once()
-        args = cur.executemany.call_args[0]
-        rows = args[1]
-        self.assertEqual(len(rows), 2)
-        self.assertEqual(rows[0], ("2021-01-01 00:00:00", 1.5))
-        self.assertEqual(rows[1], ("2021-01-01 01:00:00", 2.0))
+        with patch("server.orm.CSV_PATH", path):
+            seed_db(adopt=True)
 
-    @patch("builtins.open")
-    def test_skips_nan_values(self, mock_open):
-        csv_with_nan = (
+        mock_seed_files.assert_called_once_with([path], adopt=True)
+
+    @patch("server.orm._seed_files")
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_rollback_on_exception(self, mock_get_conn, mock_put_conn, mock_seed_files):
+        conn = _make_conn(_make_cursor(fetchall_returns=[]))
+        mock_get_conn.return_value = conn
+        mock_seed_files.side_effect = Exception("DB error")
+
+        with patch("server.orm.CSV_PATH", self.dir), self.assertRaises(Exception):
+            seed_db()
+
+        conn.rollback.assert_called_once()
+        mock_put_conn.assert_called_once_with(conn)
+
+
+class TestSeedPaths(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        for name in ("2021-02.csv", "2021-01.csv", "notes.txt"):
+            _write(os.path.join(self.dir, name), "")
+        os.mkdir(os.path.join(self.dir, "old.csv"))
+
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def test_file(self):
+        self.assertEqual(
+            _seed_paths(self._path("notes.txt")), [self._path("notes.txt")]
+        )
+
+    def test_directory_lists_csv_files_in_order(self):
+        self.assertEqual(
+            _seed_paths(self.dir),
+            [self._path("2021-01.csv"), self._path("2021-02.csv")],
+        )
+
+    def test_glob(self):
+        self.assertEqual(_seed_paths(self._path("*-02.*")), [self._path("2021-02.csv")])
+
+    def test_missing_path_matches_nothing(self):
+        self.assertEqual(_seed_paths(self._path("missing.csv")), [])
+
+
+class TestPendingSources(unittest.TestCase):
+    def test_skips_unchanged_completed_files_without_hashing(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        loaded = _write(os.path.join(tmp.name, "a.csv"), "x")
+        touched = _write(os.path.join(tmp.name, "b.csv"), "y")
+        new = _write(os.path.join(tmp.name, "c.csv"), "z")
+        stat = os.stat(touched)
+        cur = _make_cursor(
+            fetchall_returns=[
+                (loaded, os.stat(loaded).st_size, os.stat(loaded).st_mtime),
+                (touched, stat.st_size, stat.st_mtime - 1),
+            ]
+        )
+
+        with patch("server.orm._file_checksum") as mock_checksum:
+            pending = _pending_sources(cur, [loaded, touched, new])
+
+        self.assertEqual(pending, [touched, new])
+        mock_checksum.assert_not_called()
+        self.assertIn("WHERE completed", cur.execute.call_args[0][0])
+
+
+class TestCleanFile(unittest.TestCase):
+    def _clean(self, content):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        source = _write(os.path.join(tmp.name, "source.csv"), content)
+        cleaned = os.path.join(tmp.name, "cleaned.csv")
+        checksum = _clean_file(source, cleaned)
+        self.assertEqual(checksum, hashlib.sha256(content.encode()).hexdigest())
+        with open(cleaned) as f:
+            return [tuple(line.split(",")) for line in f.read().splitlines()]
+
+    def test_writes_valid_rows(self):
+        rows = self._clean(
+            "time,meterusage\n2021-01-01 00:00:00,1.5\n2021-01-01 01:00:00,2.0\n"
+        )
+
+        self.assertEqual(
+            rows,
+            [
+                ("2021-01-01 00:00:00+00:00", "1.5", DEFAULT_METER_ID),
+                ("2021-01-01 01:00:00+00:00", "2.0", DEFAULT_METER_ID),
+            ],
+        )
+
+    def test_skips_nan_values(self):
+        rows = self._clean(
             "time,meterusage\n2021-01-01 00:00:00,nan\n2021-01-01 01:00:00,1.0\n"
         )
-        mock_open.return_value.__enter__ = lambda s: io.StringIO(csv_with_nan)
-        mock_open.return_value.__exit__ = MagicMock(return_value=False)
+
+        self.assertEqual([r[1] for r in rows], ["1.0"])
+
+    def test_skips_non_numeric_values(self):
+        rows = self._clean(
+            "time,meterusage\n2021-01-01 00:00:00,not_a_number\n"
+            "2021-01-01 01:00:00,3.0\n"
+        )
+
+        self.assertEqual([r[1] for r in rows], ["3.0"])
+
+    def test_skips_unparseable_times(self):
+        rows = self._clean(
+            "time,meterusage\nyesterday,1.0\n,2.0\n2021-01-01 01:00:00,3.0\n"
+        )
+
+        self.assertEqual(rows, [("2021-01-01 01:00:00+00:00", "3.0", DEFAULT_METER_ID)])
+
+    def test_reads_optional_meter_id_column(self):
+        rows = self._clean(
+            "time,meterusage,meter_id\n"
+            "2021-01-01 00:00:00,1.0,m1\n"
+            "2021-01-01 00:00:00,2.0,\n"
+        )
+
+        self.assertEqual(
+            rows,
+            [
+                ("2021-01-01 00:00:00+00:00", "1.0", "m1"),
+                ("2021-01-01 00:00:00+00:00", "2.0", DEFAULT_METER_ID),
+            ],
+        )
+
+    def test_comma_fraction_time_stays_one_field(self):
+        rows = self._clean('time,meterusage\n"2021-01-01T00:00:00,5",1.0\n')
+
+        self.assertEqual(
+            rows, [("2021-01-01 00:00:00.500000+00:00", "1.0", DEFAULT_METER_ID)]
+        )
+
+    def test_empty_csv_writes_nothing(self):
+        self.assertEqual(self._clean("time,meterusage\n"), [])
+
+
+class TestSeedFiles(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.paths = [
+            _write(
+                os.path.join(tmp.name, "%d.csv" % month),
+                "time,meterusage\n2021-%02d-01 00:00:00,%d.0\n" % (month, month),
+            )
+            for month in (1, 2, 3)
+        ]
+
+    @patch("server.orm.SEED_WORKERS", 2)
+    @patch("server.orm._load_file")
+    def test_parses_in_worker_processes_and_loads_each_file(self, mock_load):
+        loaded = {}
+
+        def load(path, cleaned, parsed, adopt):
+            with open(cleaned) as f:
+                loaded[path] = (f.read(), parsed.result(), adopt)
+
+        mock_load.side_effect = load
+
+        _seed_files(self.paths)
+
+        self.assertEqual(set(loaded), set(self.paths))
+        content, checksum, adopt = loaded[self.paths[1]]
+        self.assertEqual(
+            content, "2021-02-01 00:00:00+00:00,2.0,%s\n" % DEFAULT_METER_ID
+        )
+        with open(self.paths[1], "rb") as f:
+            self.assertEqual(checksum, hashlib.sha256(f.read()).hexdigest())
+        self.assertFalse(adopt)
+
+    @patch("server.orm.SEED_WORKERS", 1)
+    @patch("server.orm._load_file")
+    def test_failed_file_does_not_stop_the_others(self, mock_load):
+        def load(path, cleaned, parsed, adopt):
+            if path == self.paths[0]:
+                raise ValueError("boom")
+
+        mock_load.side_effect = load
+
+        with self.assertLogs("server.orm", "ERROR"), self.assertRaises(RuntimeError):
+            _seed_files(self.paths)
+
+        self.assertEqual(mock_load.call_count, 3)
+
+
+class TestSeedSource(unittest.TestCase):
+    CHECKSUM = "c0ffee"
+
+    def setUp(self):
+        tmp = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+        with tmp:
+            tmp.write("time,meterusage\n2021-01-01 00:00:00,1.5\n")
+        self.path = tmp.name
+        self.addCleanup(os.unlink, self.path)
+
+    def _executed(self, cur):
+        return [c[0][0] for c in cur.execute.call_args_list]
+
+    def _seed_source(self, cur, adopt=False):
+        _seed_source(cur, self.path, "cleaned.csv", self.CHECKSUM, adopt)
+
+    @patch("server.orm._seed")
+    def test_new_file_is_recorded_and_loaded(self, mock_seed):
+        cur = MagicMock()
+        cur.fetchone.side_effect = [None, (0, False)]
+
+        self._seed_source(cur)
+
+        mock_seed.assert_called_once_with(
+            cur, self.path, "cleaned.csv", self.CHECKSUM, 0
+        )
+        insert = next(s for s in self._executed(cur) if "INSERT INTO seed_state" in s)
+        self.assertIn("ON CONFLICT (checksum) DO NOTHING", insert)
+        self.assertNotIn("EXISTS", " ".join(self._executed(cur)))
+        self.assertIn("SET completed = TRUE", self._executed(cur)[-1])
+
+    @patch("server.orm._seed")
+    def test_identical_file_recorded_concurrently_resumes(self, mock_seed):
+        cur = MagicMock()
+        # Not there yet, the insert conflicts, then the other loader's row.
+        cur.fetchone.side_effect = [None, None, (40, False)]
+
+        self._seed_source(cur)
+
+        mock_seed.assert_called_once_with(
+            cur, self.path, "cleaned.csv", self.CHECKSUM, 40
+        )
+        self.assertEqual(
+            sum("FROM seed_state WHERE checksum" in s for s in self._executed(cur)),
+            2,
+        )
+
+    @patch("server.orm._seed")
+    def test_identical_file_loaded_concurrently_is_skipped(self, mock_seed):
+        cur = MagicMock()
+        cur.fetchone.side_effect = [None, None, (500, True)]
+
+        self._seed_source(cur)
+
+        mock_seed.assert_not_called()
+
+    @patch("server.orm._seed")
+    def test_partial_load_resumes_after_committed_rows(self, mock_seed):
+        cur = _make_cursor(fetchone_returns=(120, False))
+
+        self._seed_source(cur)
+
+        mock_seed.assert_called_once_with(
+            cur, self.path, "cleaned.csv", self.CHECKSUM, 120
+        )
+
+    @patch("server.orm._seed")
+    def test_moved_completed_file_is_not_reloaded(self, mock_seed):
+        cur = _make_cursor(fetchone_returns=(500, True))
+
+        self._seed_source(cur)
+
+        mock_seed.assert_not_called()
+        self.assertIn("UPDATE seed_state SET source", self._executed(cur)[-1])
+
+    @patch("server.orm._seed")
+    def test_adopts_data_seeded_before_seed_state(self, mock_seed):
+        cur = MagicMock()
+        cur.fetchone.side_effect = [None, (0, True)]
+
+        self._seed_source(cur, adopt=True)
+
+        mock_seed.assert_not_called()
+        insert = next(
+            c for c in cur.execute.call_args_list if "INSERT INTO seed_state" in c[0][0]
+        )
+        self.assertTrue(insert[0][1][-1])
+
+
+def _capture_copy(cur):
+    """Make ``cur.copy_expert`` drain its stream; return the list of payloads."""
+    payloads = []
+    cur.copy_expert.side_effect = lambda sql, stream: payloads.append(stream.read())
+    return payloads
+
+
+def _copied_rows(payloads):
+    return [tuple(line.split(",")) for p in payloads for line in p.splitlines()]
+
+
+class TestSeed(unittest.TestCase):
+    LINES = "2021-01-01 00:00:00,1.5,default\n2021-01-01 01:00:00,2.0,default\n"
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cleaned = os.path.join(tmp.name, "cleaned.csv")
+
+    def _seed(self, cur, lines=LINES, skip=0):
+        _write(self.cleaned, lines)
+        _seed(cur, "source.csv", self.cleaned, "c0ffee", skip)
+
+    @patch("server.orm.ANOMALY_DETECTION", True)
+    def test_copies_cleaned_lines_through_staging(self):
         cur = MagicMock()
+        payloads = _capture_copy(cur)
 
-        _seed(cur)
+        self._seed(cur)
 
-        args = cur.executemany.call_args[0]
-        rows = args[1]
-        self.assertEqual(len(rows), 1)
-        self.assertEqual(rows[0][1], 1.0)
+        self.assertIn(
+            "COPY meter_readings_staging", cur.copy_expert.call_args_list[0][0][0]
+        )
+        self.assertEqual(payloads, [self.LINES])
+        statements = [c[0][0] for c in cur.execute.call_args_list]
+        self.assertEqual(
+            statements[:3],
+            [CREATE_STAGING_SQL, MERGE_STAGING_SQL, _LOG_SEED_SPANS_SQL],
+        )
+        # Detection catches up after the seed, from the logged spans.
+        cur.executemany.assert_not_called()
 
-    @patch("builtins.open")
-    def test_skips_non_numeric_values(self, mock_open):
-        csv_bad = "time,meterusage\n2021-01-01 00:00:00,not_a_number\n2021-01-01 01:00:00,3.0\n"
-        mock_open.return_value.__enter__ = lambda s: io.StringIO(csv_bad)
-        mock_open.return_value.__exit__ = MagicMock(return_value=False)
+    def test_empty_file_inserts_nothing(self):
         cur = MagicMock()
 
-        _seed(cur)
+        self._seed(cur, lines="")
 
-        args = cur.executemany.call_args[0]
-        rows = args[1]
-        self.assertEqual(len(rows), 1)
-        self.assertEqual(rows[0][1], 3.0)
+        cur.copy_expert.assert_not_called()
+        cur.connection.commit.assert_not_called()
 
-    @patch("builtins.open")
-    def test_empty_csv_inserts_nothing(self, mock_open):
-        mock_open.return_value.__enter__ = lambda s: io.StringIO("time,meterusage\n")
-        mock_open.return_value.__exit__ = MagicMock(return_value=False)
+    @patch("server.orm.SEED_BATCH_SIZE", 1)
+    def test_commits_every_batch(self):
         cur = MagicMock()
+        payloads = _capture_copy(cur)
+
+        self._seed(cur)
+
+        self.assertEqual(payloads, self.LINES.splitlines(keepends=True))
+        self.assertEqual(cur.connection.commit.call_count, 2)
+        progress = [
+            c[0][1]
+            for c in cur.execute.call_args_list
+            if "rows_loaded = rows_loaded + %s" in c[0][0]
+        ]
+        self.assertEqual(progress, [(1, "c0ffee"), (1, "c0ffee")])
+
+    def test_resume_skips_loaded_rows(self):
+        cur = MagicMock()
+        payloads = _capture_copy(cur)
+
+        self._seed(cur, skip=1)
+
+        self.assertEqual(
+            _copied_rows(payloads), [("2021-01-01 01:00:00", "2.0", DEFAULT_METER_ID)]
+        )
+
+
+class TestDetectBacklog(unittest.TestCase):
+    T0 = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+    def _cursors(self, states, batches, spans=(None, None), rescanned=()):
+        cur = MagicMock()
+        cur.fetchall.side_effect = [[("m1",)], states, *rescanned]
+        cur.fetchone.return_value = spans
+        readings = MagicMock()
+        readings.fetchmany.side_effect = [*batches, []]
+        cur.connection.cursor.return_value = readings
+        return cur, readings
+
+    def test_feeds_readings_after_saved_state_in_time_order(self):
+        last = self.T0 - timedelta(minutes=15)
+        rows = [(self.T0, 1.0, "m1"), (self.T0 + timedelta(hours=1), 2.0, "m1")]
+        cur, readings = self._cursors([("m1", last, [0.5])], [rows])
+
+        with patch("server.orm.response_cache") as mock_cache:
+            _detect_backlog(cur)
+
+        advisory, lock = cur.execute.call_args_list[1:3]
+        self.assertEqual(advisory[0], (LOCK_METERS_SQL, (["m1"],)))
+        self.assertEqual(lock[0], (LOCK_ANOMALY_STATE_SQL, (["m1"],)))
+        readings.execute.assert_called_once_with(_UNDETECTED_SQL, ("m1", last))
+        readings.close.assert_called_once()
+        inserted, saved = cur.executemany.call_args_list
+        self.assertEqual(inserted[0][0], INSERT_ANOMALY_SQL)
+        self.assertEqual([a[1] for a in inserted[0][1]], ["gap"])
+        self.assertEqual(
+            saved[0],
+            (
+                SAVE_ANOMALY_STATE_SQL,
+                [("m1", self.T0 + timedelta(hours=1), [0.5, 1.0, 2.0])],
+            ),
+        )
+        # New anomalies are a write: clients must not revalidate to the old list.
+        self.assertEqual(cur.execute.call_args[0][0], BUMP_VERSION_SQL)
+        cur.connection.commit.assert_called_once()
+        mock_cache.invalidate.assert_called_once_with(meter_ids=["m1"])
+
+    def test_up_to_date_meter_saves_nothing(self):
+        cur, readings = self._cursors([("m1", self.T0, [1.0])], [])
+
+        _detect_backlog(cur)
+
+        cur.executemany.assert_not_called()
+        cur.connection.commit.assert_called_once()
+
+    def test_meter_without_state_reads_from_the_start(self):
+        cur, readings = self._cursors([], [[(self.T0, 1.0, "m1")]])
+
+        with patch("server.orm.response_cache") as mock_cache:
+            _detect_backlog(cur)
+
+        self.assertEqual(
+            readings.execute.call_args[0][1][1],
+            datetime.min.replace(tzinfo=timezone.utc),
+        )
+        (saved,) = cur.executemany.call_args_list
+        self.assertEqual(saved[0][1], [("m1", self.T0, [1.0])])
+        # Nothing was flagged, so cached responses stay valid.
+        self.assertNotIn(
+            BUMP_VERSION_SQL, [c[0][0] for c in cur.execute.call_args_list]
+        )
+        mock_cache.invalidate.assert_not_called()
+
+    def test_rescans_seed_spans_behind_saved_state(self):
+        # Readings either side were detected; the ones between were seeded
+        # afterwards and fill the gap flagged then.
+        step = timedelta(minutes=15)
+        filled = [(self.T0 + i * step, 1.0, "m1") for i in (1, 2)]
+        end = self.T0 + 3 * step
+        cur, readings = self._cursors(
+            [("m1", end, [1.0, 1.0])],
+            [],
+            spans=(filled[0][0], filled[-1][0]),
+            rescanned=[[(self.T0, 1.0)], [*filled, (end, 1.0, "m1")]],
+        )
+
+        with patch("server.orm.response_cache") as mock_cache:
+            _detect_backlog(cur)
+
+        statements = [c[0] for c in cur.execute.call_args_list]
+        self.assertIn((_CLAIM_SEED_SPANS_SQL, ("m1",)), statements)
+        self.assertIn((DELETE_ANOMALIES_SQL, ("m1", self.T0, end)), statements)
+        # The gap is gone and nothing replaces it, but the deletion is still
+        # a write.
+        self.assertEqual(cur.executemany.call_count, 1)
+        self.assertEqual(cur.execute.call_args[0][0], BUMP_VERSION_SQL)
+        mock_cache.invalidate.assert_called_once_with(meter_ids=["m1"])
+
+    def test_spans_after_saved_state_are_left_to_the_forward_pass(self):
+        t1 = self.T0 + timedelta(minutes=15)
+        cur, readings = self._cursors(
+            [("m1", self.T0, [1.0])], [[(t1, 1.0, "m1")]], spans=(t1, t1)
+        )
+
+        _detect_backlog(cur)
+
+        statements = [c[0][0] for c in cur.execute.call_args_list]
+        self.assertNotIn(WINDOW_BEFORE_SQL, statements)
+        readings.execute.assert_called_once_with(_UNDETECTED_SQL, ("m1", self.T0))
+
+
+class TestRescan(unittest.TestCase):
+    T0 = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    STEP = timedelta(minutes=15)
+
+    def _readings(self, start, count, value=1.0):
+        return [(self.T0 + (start + i) * self.STEP, value, "m1") for i in range(count)]
+
+    def test_replays_from_the_reading_before_the_late_ones(self):
+        before = [(self.T0, 1.0)]
+        late = self._readings(1, 2)
+        end = late[-1][0] + 4 * self.STEP
+        cur = MagicMock()
+        cur.fetchall.side_effect = [before, [*late, (end, 1.0, "m1")]]
+
+        rescan = _rescan(cur, "m1", late[0][0], late[-1][0], end)
+
+        self.assertEqual(
+            cur.execute.call_args_list,
+            [
+                call(WINDOW_BEFORE_SQL, ("m1", late[0][0], 96)),
+                call(RESCAN_PAGE_SQL, ("m1", self.T0, end, 5000)),
+                call(DELETE_ANOMALIES_SQL, ("m1", self.T0, end)),
+            ],
+        )
+        # The step from the last late reading to ``end`` is still a gap.
+        (inserted,) = cur.executemany.call_args_list
+        self.assertEqual(inserted[0][0], INSERT_ANOMALY_SQL)
+        self.assertEqual(
+            [(a[1], a[2], a[3]) for a in inserted[0][1]],
+            [("gap", late[-1][0] + self.STEP, end)],
+        )
+        self.assertEqual(rescan.state(), ("m1", end, [1.0] * 4))
+
+
+class TestParseReading(unittest.TestCase):
+    def test_accepts_iso_time_and_number(self):
+        self.assertEqual(
+            parse_reading("2021-01-01T01:00:00+01:00", "1.5", "m1"),
+            ("2021-01-01 01:00:00+01:00", 1.5, "m1"),
+        )
+
+    def test_defaults_meter_id(self):
+        self.assertEqual(
+            parse_reading("2021-01-01", 1.0),
+            ("2021-01-01 00:00:00+00:00", 1.0, DEFAULT_METER_ID),
+        )
+
+    def test_normalizes_times_postgres_would_misread(self):
+        # fromisoformat accepts a comma fraction; written raw it splits the CSV.
+        time, _, _ = parse_reading("2021-01-01T00:00:00,5", 1.0)
+        self.assertEqual(time, "2021-01-01 00:00:00.500000+00:00")
+        # ISO week date: Monday of week 1 of 2021.
+        time, _, _ = parse_reading("2021-W01-1", 1.0)
+        self.assertEqual(time, "2021-01-04 00:00:00+00:00")
+
+    def test_rejects_bad_time_or_value(self):
+        self.assertIsNone(parse_reading("yesterday", 1.0))
+        self.assertIsNone(parse_reading(None, 1.0))
+        self.assertIsNone(parse_reading("2021-01-01", "abc"))
+        self.assertIsNone(parse_reading("2021-01-01", float("nan")))
+        self.assertIsNone(parse_reading("2021-01-01", 1.0, 'm,"1'))
+
+
+class TestInsertReadings(unittest.TestCase):
+    @patch("server.orm.ANOMALY_DETECTION", False)
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_copies_and_commits(self, mock_get_conn, mock_put_conn):
+        cur = MagicMock()
+        payloads = _capture_copy(cur)
+        conn = _make_conn(cur)
+        mock_get_conn.return_value = conn
+
+        count = insert_readings([("2021-01-01 00:00:00", 1.5, "m1")])
+
+        self.assertEqual(count, 1)
+        self.assertEqual(payloads, ["2021-01-01 00:00:00,1.5,m1\n"])
+        self.assertIn("COPY meter_readings_staging", cur.copy_expert.call_args[0][0])
+        self.assertEqual(
+            [c[0][0] for c in cur.execute.call_args_list],
+            [
+                CREATE_STAGING_SQL,
+                MERGE_STAGING_SQL,
+                "UPDATE data_version SET version = version + 1;",
+            ],
+        )
+        conn.commit.assert_called_once()
+        mock_put_conn.assert_called_once_with(conn)
+
+    @patch("server.orm.response_cache")
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_invalidates_cached_responses_for_written_span(
+        self, mock_get_conn, mock_put_conn, mock_cache
+    ):
+        cur = MagicMock()
+        _capture_copy(cur)
+        mock_get_conn.return_value = _make_conn(cur)
+
+        insert_readings(
+            [
+                ("2021-01-02 00:00:00", 1.0, "m1"),
+                ("2021-01-01T00:00:00+00:00", 2.0, "m2"),
+            ]
+        )
+
+        mock_cache.invalidate.assert_called_once_with(
+            datetime(2021, 1, 1, tzinfo=timezone.utc),
+            datetime(2021, 1, 2, tzinfo=timezone.utc),
+            {"m1", "m2"},
+        )
+
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_rolls_back_on_error(self, mock_get_conn, mock_put_conn):
+        cur = MagicMock()
+        cur.copy_expert.side_effect = Exception("DB error")
+        conn = _make_conn(cur)
+        mock_get_conn.return_value = conn
+
+        with self.assertRaises(Exception):
+            insert_readings([("2021-01-01 00:00:00", 1.5, "m1")])
+
+        conn.rollback.assert_called_once()
+        conn.commit.assert_not_called()
+        mock_put_conn.assert_called_once_with(conn)
+
+
+class TestDetectAnomalies(unittest.TestCase):
+    ROWS = [
+        ("2021-01-01 00:00:00", 1.0, "m1"),
+        ("2021-01-01 01:00:00", 2.0, "m1"),
+        ("2021-01-01 00:00:00", 3.0, "m2"),
+    ]
+
+    @patch("server.orm.ANOMALY_DETECTION", True)
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_writes_flagged_intervals_and_state(self, mock_get_conn, mock_put_conn):
+        cur = MagicMock()
+        _capture_copy(cur)
+        last = datetime(2020, 12, 31, 23, 45, tzinfo=timezone.utc)
+        cur.fetchall.return_value = [("m1", last, [0.5])]
+        mock_get_conn.return_value = _make_conn(cur)
+
+        insert_readings(self.ROWS)
+
+        statements = [c[0][0] for c in cur.execute.call_args_list]
+        self.assertIn(MERGE_STAGING_SQL, statements)
+        lock = cur.execute.call_args_list[statements.index(LOCK_ANOMALY_STATE_SQL)]
+        self.assertEqual(lock[0][1], (["m1", "m2"],))
+        # Taken first, so a meter without a state row is locked too.
+        advisory = statements.index(LOCK_METERS_SQL)
+        self.assertEqual(advisory + 1, statements.index(LOCK_ANOMALY_STATE_SQL))
+        self.assertEqual(cur.execute.call_args_list[advisory][0][1], (["m1", "m2"],))
+        self.assertLess(
+            statements.index(MERGE_STAGING_SQL),
+            statements.index(LOCK_ANOMALY_STATE_SQL),
+        )
+        inserted, saved = cur.executemany.call_args_list
+        t = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        self.assertEqual(inserted[0][0], INSERT_ANOMALY_SQL)
+        self.assertEqual(
+            inserted[0][1],
+            [
+                (
+                    "m1",
+                    "gap",
+                    t + timedelta(minutes=15),
+                    t + timedelta(hours=1),
+                    None,
+                    3.0,
+                )
+            ],
+        )
+        self.assertEqual(saved[0][0], SAVE_ANOMALY_STATE_SQL)
+        self.assertEqual(
+            saved[0][1],
+            [("m1", t + timedelta(hours=1), [0.5, 1.0, 2.0]), ("m2", t, [3.0])],
+        )
+
+    @patch("server.orm.ANOMALY_DETECTION", True)
+    @patch("server.orm.response_cache")
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_conn")
+    def test_late_rows_rescan_their_meter(
+        self, mock_get_conn, mock_put_conn, mock_cache
+    ):
+        cur = MagicMock()
+        _capture_copy(cur)
+        t = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        last = t + timedelta(hours=1)
+        cur.fetchall.side_effect = [
+            [("m1", last, [1.0, 2.0])],
+            [(t - timedelta(minutes=15), 0.5)],
+            [(t, 1.0, "m1"), (last, 2.0, "m1")],
+        ]
+        mock_get_conn.return_value = _make_conn(cur)
+
+        insert_readings([("2021-01-01 00:00:00", 1.0, "m1")])
+
+        statements = [c[0][0] for c in cur.execute.call_args_list]
+        self.assertLess(
+            statements.index(LOCK_ANOMALY_STATE_SQL),
+            statements.index(WINDOW_BEFORE_SQL),
+        )
+        self.assertIn(DELETE_ANOMALIES_SQL, statements)
+        # The replay reached the saved state, so its window is what is saved.
+        saved = cur.executemany.call_args_list[-1]
+        self.assertEqual(
+            saved[0], (SAVE_ANOMALY_STATE_SQL, [("m1", last, [0.5, 1.0, 2.0])])
+        )
+        # Cached anomaly lists are dropped per meter, whatever the time span.
+        mock_cache.invalidate.assert_called_once()
+
+    @patch("server.orm.ANOMALY_DETECTION", False)
+    def test_disabled_detection_streams_rows(self):
+        cur = MagicMock()
+        payloads = _capture_copy(cur)
+
+        _copy_rows(cur, iter(self.ROWS))
+
+        self.assertEqual(len(_copied_rows(payloads)), 3)
+        cur.executemany.assert_not_called()
+
+
+class TestGetAnomalies(unittest.TestCase):
+    @patch("server.orm.put_conn")
+    @patch("server.orm.get_read_conn")
+    def test_returns_rows(self, mock_get_read_conn, mock_put_conn):
+        cur = _make_cursor(fetchall_returns=[("m1", "spike")])
+        conn = _make_conn(cur)
+        mock_get_read_conn.return_value = conn
+
+        self.assertEqual(get_anomalies(), [("m1", "spike")])
+        cur.execute.assert_called_once_with(
+            "SELECT meter_id, kind, start_time, end_time, value, score"
+            " FROM meter_anomalies ORDER BY start_time, meter_id, kind;",
+            [],
+        )
+        mock_put_conn.assert_called_once_with(conn)
+
+
+class TestCopyStream(unittest.TestCase):
+    def test_reads_rows_in_sized_chunks(self):
+        stream = _CopyStream([("t1", 1.5, "m1"), ("t2", 2.25, "m2")])
 
-        _seed(cur)
+        chunks = []
+        while chunk := stream.read(4):
+            chunks.append(chunk)
 
-        args = cur.executemany.call_args[0]
-        rows = args[1]
-        self.assertEqual(rows, [])
+        self.assertEqual("".join(chunks), "t1,1.5,m1\nt2,2.25,m2\n")
+        self.assertTrue(all(len(c) <= 4 for c in chunks))
+        self.assertEqual(stream.count, 2)
 
 
 if __name__ == "__main__":
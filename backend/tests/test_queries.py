@@ -0,0 +1,186 @@
+"""Unit tests for server/queries.py."""
+
+import struct
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from server.queries import (
+    Rescan,
+    anomalies_query,
+    columns_query,
+    late_spans,
+    summary_query,
+    unpack_columns,
+)
+
+
+def _copy_binary(rows):
+    """Encode ``(µs, value[, meter position])`` rows like binary COPY output."""
+    body = b"".join(
+        (
+            struct.pack(">hiqid", 2, 8, row[0], 8, row[1])
+            if len(row) == 2
+            else struct.pack(">hiqidii", 3, 8, row[0], 8, row[1], 4, row[2])
+        )
+        for row in rows
+    )
+    return b"PGCOPY\n\xff\r\n\x00" + bytes(8) + body + b"\xff\xff"
+
+
+class TestColumns(unittest.TestCase):
+    def test_query_sends_meter_positions_for_several_meters(self):
+        sql, params = columns_query(["a", "b"], start=datetime(2021, 1, 1), limit=3)
+
+        self.assertIn("array_position(%s::text[], meter_id)", sql)
+        self.assertIn("meter_id = ANY(%s)", sql)
+        self.assertTrue(sql.endswith("ORDER BY time, meter_id LIMIT %s"))
+        self.assertEqual(params, [["a", "b"], datetime(2021, 1, 1), ["a", "b"], 3])
+
+    def test_query_omits_meter_for_single_meter(self):
+        sql, params = columns_query(["a"])
+
+        self.assertNotIn("array_position", sql)
+        self.assertEqual(params, ["a"])
+
+    def test_unpacks_single_meter_rows(self):
+        data = _copy_binary([(1000, 1.5), (2000, 2.5)])
+
+        self.assertEqual(unpack_columns(data, ["a"]), ([1000, 2000], [1.5, 2.5], None))
+
+    @patch("server.queries._UNPACK_BLOCK", 2)
+    def test_unpacks_whole_blocks_and_remainder(self):
+        rows = [(i * 1000, i / 2, i % 2 + 1) for i in range(5)]
+
+        times, values, meters = unpack_columns(_copy_binary(rows), ["a", "b"])
+
+        self.assertEqual(times, [0, 1000, 2000, 3000, 4000])
+        self.assertEqual(values, [0.0, 0.5, 1.0, 1.5, 2.0])
+        self.assertEqual(meters, ["a", "b", "a", "b", "a"])
+
+    def test_empty_result(self):
+        self.assertEqual(unpack_columns(_copy_binary([]), ["a"]), ([], [], None))
+
+    def test_rejects_unexpected_layout(self):
+        with self.assertRaises(ValueError):
+            unpack_columns(b"not copy data", ["a"])
+        with self.assertRaises(ValueError):
+            unpack_columns(_copy_binary([(1, 1.0)]), ["a", "b"])
+
+
+class TestSummaryQuery(unittest.TestCase):
+    def _parts(self, start=None, end=None, meter_ids=None):
+        sql, params = summary_query(start, end, meter_ids)
+        inner = sql[sql.index("FROM (") + 6 : sql.rindex(") AS parts")]
+        return inner.split(" UNION ALL "), params
+
+    def test_aligned_window_reads_only_daily_summary(self):
+        start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        end = datetime(2021, 2, 1, tzinfo=timezone.utc)
+
+        parts, params = self._parts(start, end, ["m1"])
+
+        self.assertEqual(len(parts), 1)
+        self.assertIn("FROM meter_daily_summary", parts[0])
+        self.assertIn("day >= %s AND day < %s AND meter_id = %s", parts[0])
+        self.assertEqual(params, [start, end, "m1"])
+
+    def test_partial_edge_days_read_raw_readings(self):
+        start = datetime(2021, 1, 1, 6, tzinfo=timezone.utc)
+        end = datetime(2021, 1, 10, 12, tzinfo=timezone.utc)
+        day2 = datetime(2021, 1, 2, tzinfo=timezone.utc)
+        day10 = datetime(2021, 1, 10, tzinfo=timezone.utc)
+
+        parts, params = self._parts(start, end)
+
+        self.assertEqual(len(parts), 3)
+        self.assertIn("FROM meter_daily_summary", parts[0])
+        for raw in parts[1:]:
+            self.assertIn("FROM meter_readings WHERE time >= %s AND time < %s", raw)
+            self.assertTrue(raw.endswith(" GROUP BY meter_id"))
+        self.assertEqual(params, [day2, day10, start, day2, day10, end])
+
+    def test_window_within_one_day_reads_raw_readings(self):
+        start = datetime(2021, 1, 1, 6, tzinfo=timezone.utc)
+        end = datetime(2021, 1, 1, 18, tzinfo=timezone.utc)
+
+        parts, params = self._parts(start, end)
+
+        self.assertEqual(len(parts), 1)
+        self.assertIn("FROM meter_readings", parts[0])
+        self.assertEqual(params, [start, end])
+
+    def test_open_window_reads_whole_summary(self):
+        parts, params = self._parts()
+
+        self.assertEqual(parts, [parts[0]])
+        self.assertNotIn("WHERE", parts[0])
+        self.assertEqual(params, [])
+
+    def test_days_are_utc(self):
+        start = datetime(2021, 1, 1, tzinfo=timezone(timedelta(hours=2)))
+
+        _, params = self._parts(start)
+
+        # 2020-12-31 22:00 UTC: the rest of that day is read raw.
+        self.assertEqual(params[0], datetime(2021, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(params[1:], [start, params[0]])
+
+
+class TestAnomaliesQuery(unittest.TestCase):
+    def test_selects_intervals_overlapping_window(self):
+        start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        end = datetime(2021, 1, 2, tzinfo=timezone.utc)
+
+        sql, params = anomalies_query(start, end, ["m1"], ["gap"], 10)
+
+        self.assertEqual(
+            sql,
+            "SELECT meter_id, kind, start_time, end_time, value, score"
+            " FROM meter_anomalies WHERE meter_id = %s AND end_time > %s"
+            " AND start_time < %s AND kind = ANY(%s)"
+            " ORDER BY start_time, meter_id, kind LIMIT %s;",
+        )
+        self.assertEqual(params, ["m1", start, end, ["gap"], 10])
+
+
+class TestLateSpans(unittest.TestCase):
+    def test_spans_readings_at_or_before_their_meter_state(self):
+        t = [datetime(2021, 1, 1, h, tzinfo=timezone.utc) for h in range(4)]
+        states = {"m1": ("m1", t[2], []), "m2": ("m2", t[0], [])}
+        readings = [(t[2], 1.0, "m1"), (t[0], 1.0, "m1"), (t[3], 1.0, "m1")]
+        readings += [(t[1], 1.0, "m2"), (t[0], 1.0, "m3")]
+
+        # m2's reading is after its state and m3 has none: both run forward.
+        self.assertEqual(late_spans(readings, states), [("m1", t[0], t[2])])
+
+
+class TestRescan(unittest.TestCase):
+    T0 = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    STEP = timedelta(minutes=15)
+
+    def _readings(self, start, count, value=1.0):
+        return [(self.T0 + (start + i) * self.STEP, value, "m1") for i in range(count)]
+
+    def test_stops_once_the_window_has_moved_past_the_late_readings(self):
+        late = self._readings(0, 1)
+        after = self._readings(1, 200)
+        rescan = Rescan("m1", late[0][0], after[-1][0], [])
+
+        done = rescan.feed(late + after)
+
+        self.assertTrue(done)
+        self.assertEqual(rescan.until, after[95][0])
+        self.assertEqual(rescan.fed, 97)
+        # The saved state lies further on and is still valid.
+        self.assertIsNone(rescan.state())
+
+    def test_flags_spikes_scored_against_late_readings(self):
+        # Without the late, varying readings the window was flat and the
+        # spike unscored; replaying them scores it.
+        before = [(self.T0 + i * self.STEP, 1.0 + i % 2) for i in range(96)][::-1]
+        rescan = Rescan("m1", before[0][0], self.T0 + 97 * self.STEP, before)
+
+        rescan.feed([(self.T0 + 96 * self.STEP, 50.0, "m1")])
+
+        self.assertEqual([a[1] for a in rescan.flagged], ["spike"])
@@ -0,0 +1,97 @@
+"""Unit tests for server/responses.py."""
+
+import base64
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import metrics_pb2
+
+from server.cache import response_cache
+from server.responses import (
+    anomaly_scope,
+    build_response,
+    cache_lookup,
+    cache_store,
+    decode_page_token,
+    encode_page_token,
+    flight_result,
+    parse_read_filters,
+)
+
+MetricsRequest = getattr(metrics_pb2, "MetricsRequest")
+MetricsResponse = getattr(metrics_pb2, "MetricsResponse")
+
+
+class TestPageToken(unittest.TestCase):
+    def test_round_trips_time_and_meter(self):
+        t = datetime(2021, 1, 1, 0, 15, tzinfo=timezone.utc)
+
+        self.assertEqual(decode_page_token(encode_page_token(t, "m1")), (t, "m1"))
+
+    def test_time_only_token_has_no_meter(self):
+        token = base64.urlsafe_b64encode(b"2021-01-01 00:15:00+00:00").decode()
+
+        self.assertEqual(
+            decode_page_token(token),
+            (datetime(2021, 1, 1, 0, 15, tzinfo=timezone.utc), None),
+        )
+
+    def test_malformed_token_is_a_value_error(self):
+        request = MetricsRequest(page_token="not-a-token")
+
+        with self.assertRaisesRegex(ValueError, "Invalid page_token"):
+            parse_read_filters(request)
+
+
+class TestBuildResponse(unittest.TestCase):
+    def test_columnar_rows_truncate_epoch_us_to_ms(self):
+        response = build_response([(1_500_999, 2.5, "m1")], columnar=True)
+
+        self.assertEqual(list(response.columns.time_unix_ms), [1500])
+        self.assertEqual(list(response.columns.meterusage), [2.5])
+        self.assertEqual(list(response.columns.meter_id), ["m1"])
+
+    def test_single_meter_columns_omit_meter_ids(self):
+        response = build_response(
+            [(1_000, 2.5, "m1")], columnar=True, meter_column=False
+        )
+
+        self.assertEqual(list(response.columns.meter_id), [])
+
+
+class TestAnomalyScope(unittest.TestCase):
+    def test_drops_the_time_window(self):
+        filters = {"start": datetime(2021, 1, 1), "meter_ids": ["m1"], "limit": 5}
+
+        self.assertEqual(anomaly_scope(filters), {"meter_ids": ["m1"]})
+
+
+class TestCaching(unittest.TestCase):
+    def setUp(self):
+        response_cache.clear()
+        self.context = MagicMock()
+
+    def test_stored_response_is_looked_up_as_bytes(self):
+        response = MetricsResponse(next_page_token="t")
+        data = cache_store(("k",), {}, response, response_cache.generation())
+
+        self.assertEqual(cache_lookup(self.context, ("k",)), data)
+        self.context.set_trailing_metadata.assert_called_once_with(
+            (("x-cache", "hit"),)
+        )
+
+    def test_miss_is_reported(self):
+        self.assertIsNone(cache_lookup(self.context, ("k",)))
+        self.context.set_trailing_metadata.assert_called_once_with(
+            (("x-cache", "miss"),)
+        )
+
+    def test_shared_flight_returns_the_bytes(self):
+        response = MetricsResponse()
+
+        self.assertIs(flight_result(self.context, response, b"x", False), response)
+        self.assertEqual(flight_result(self.context, response, b"x", True), b"x")
+        self.context.set_trailing_metadata.assert_called_once_with(
+            (("x-cache", "shared"),)
+        )
@@ -1,15 +1,32 @@
 """Unit tests for server/servicer.py."""
 
+import base64
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from unittest.mock import MagicMock, patch
 
+import metrics_pb2
+
+from server.cache import response_cache
+from server.responses import decode_page_token, encode_page_token
 from server.servicer import MetricsServicer
+from server.settings import DEFAULT_METER_ID
+
+MetricsRequest = getattr(metrics_pb2, "MetricsRequest")
+MetricsResponse = getattr(metrics_pb2, "MetricsResponse")
+AggregateRequest = getattr(metrics_pb2, "AggregateRequest")
+IngestRequest = getattr(metrics_pb2, "IngestRequest")
+MetricPoint = getattr(metrics_pb2, "MetricPoint")
 
 
 class TestMetricsServicer(unittest.TestCase):
     def setUp(self):
+        response_cache.clear()
         self.servicer = MetricsServicer()
-        self.request = MagicMock()
+        self.request = MetricsRequest()
         self.context = MagicMock()
 
     @patch("server.servicer.get_readings")
@@ -24,8 +41,8 @@ class TestMetricsServicer(unittest.TestCase):
     @patch("server.servicer.get_readings")
     def test_get_metrics_maps_rows_to_response(self, mock_get_readings):
         mock_get_readings.return_value = [
-            ("2021-01-01 00:00:00+00", 1.5),
-            ("2021-01-01 01:00:00+00", 2.75),
+            ("2021-01-01 00:00:00+00", 1.5, "m1"),
+            ("2021-01-01 01:00:00+00", 2.75, "m2"),
         ]
 
         response = self.servicer.GetMetrics(self.request, self.context)
@@ -37,13 +54,14 @@ class TestMetricsServicer(unittest.TestCase):
 
         self.assertEqual(response.data[1].time, "2021-01-01 01:00:00+00")
         self.assertAlmostEqual(response.data[1].meterusage, 2.75)
+        self.assertEqual(response.data[1].meter_id, "m2")
 
     @patch("server.servicer.get_readings")
     def test_get_metrics_converts_time_to_string(self, mock_get_readings):
         from datetime import datetime, timezone
 
         dt = datetime(2021, 6, 15, 12, 0, 0, tzinfo=timezone.utc)
-        mock_get_readings.return_value = [(dt, 3.14)]
+        mock_get_readings.return_value = [(dt, 3.14, "m1")]
 
         response = self.servicer.GetMetrics(self.request, self.context)
 
@@ -53,7 +71,7 @@ class TestMetricsServicer(unittest.TestCase):
     def test_get_metrics_converts_meterusage_to_float(self, mock_get_readings):
         from decimal import Decimal
 
-        mock_get_readings.return_value = [("2021-01-01", Decimal("9.99"))]
+        mock_get_readings.return_value = [("2021-01-01", Decimal("9.99"), "m1")]
 
         response = self.servicer.GetMetrics(self.request, self.context)
 
@@ -62,7 +80,7 @@ class TestMetricsServicer(unittest.TestCase):
 
     @patch("server.servicer.get_readings")
     def test_get_metrics_single_row(self, mock_get_readings):
-        mock_get_readings.return_value = [("2021-03-10 08:30:00", 100.0)]
+        mock_get_readings.return_value = [("2021-03-10 08:30:00", 100.0, "m1")]
 
         response = self.servicer.GetMetrics(self.request, self.context)
 
@@ -70,6 +88,542 @@ class TestMetricsServicer(unittest.TestCase):
         self.assertEqual(response.data[0].time, "2021-03-10 08:30:00")
         self.assertAlmostEqual(response.data[0].meterusage, 100.0)
 
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_serves_repeat_requests_from_cache(self, mock_get_readings):
+        mock_get_readings.return_value = [("t1", 1.0, "m1")]
+
+        first = self.servicer.GetMetrics(self.request, self.context)
+        second = self.servicer.GetMetrics(MetricsRequest(), self.context)
+
+        mock_get_readings.assert_called_once()
+        self.assertIsInstance(second, bytes)
+        self.assertEqual(MetricsResponse.FromString(second), first)
+        self.context.set_trailing_metadata.assert_called_with((("x-cache", "hit"),))
+
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_shares_concurrent_identical_queries(self, mock_get_readings):
+        release = threading.Event()
+
+        def slow_query(**kwargs):
+            release.wait(5)
+            return [("t1", 1.0, "m1")]
+
+        mock_get_readings.side_effect = slow_query
+        with ThreadPoolExecutor(4) as pool:
+            calls = [
+                pool.submit(self.servicer.GetMetrics, MetricsRequest(), MagicMock())
+                for _ in range(4)
+            ]
+            time.sleep(0.05)
+            release.set()
+        results = [call.result() for call in calls]
+
+        mock_get_readings.assert_called_once()
+        messages = [r for r in results if not isinstance(r, bytes)]
+        self.assertEqual(len(messages), 1)
+        for result in results:
+            if isinstance(result, bytes):
+                self.assertEqual(MetricsResponse.FromString(result), messages[0])
+
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_cache_is_keyed_by_request(self, mock_get_readings):
+        mock_get_readings.return_value = []
+
+        self.servicer.GetMetrics(self.request, self.context)
+        self.servicer.GetMetrics(MetricsRequest(limit=5), self.context)
+
+        self.assertEqual(mock_get_readings.call_count, 2)
+
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_formats_epoch_microsecond_times(self, mock_get_readings):
+        t = datetime(2021, 1, 1, 0, 15, tzinfo=timezone.utc)
+        us = int(t.timestamp()) * 1_000_000
+        mock_get_readings.return_value = [(us, 1.0, "m1"), (us + 1, 2.0, "m1")]
+        self.request.limit = 1
+
+        response = self.servicer.GetMetrics(self.request, self.context)
+
+        self.assertEqual(response.data[0].time, str(t))
+        self.assertEqual(response.data[0].meter_id, "m1")
+        self.assertEqual(response.next_page_token, encode_page_token(t, "m1"))
+
+    @patch("server.responses.EPOCH_TIMES", False)
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_can_fetch_datetimes(self, mock_get_readings):
+        mock_get_readings.return_value = []
+
+        self.servicer.GetMetrics(self.request, self.context)
+
+        mock_get_readings.assert_called_once_with(limit=None)
+
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_passes_time_window(self, mock_get_readings):
+        mock_get_readings.return_value = []
+        start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        end = datetime(2021, 2, 1, tzinfo=timezone.utc)
+        self.request.start.FromDatetime(start)
+        self.request.end.FromDatetime(end)
+
+        self.servicer.GetMetrics(self.request, self.context)
+
+        mock_get_readings.assert_called_once_with(
+            start=start, end=end, epoch_us=True, limit=None
+        )
+
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_sets_next_page_token_when_more_rows(self, mock_get_readings):
+        t1 = datetime(2021, 1, 1, 0, 15, tzinfo=timezone.utc)
+        t2 = datetime(2021, 1, 1, 0, 30, tzinfo=timezone.utc)
+        t3 = datetime(2021, 1, 1, 0, 45, tzinfo=timezone.utc)
+        mock_get_readings.return_value = [
+            (t1, 1.0, "m1"),
+            (t2, 2.0, "m1"),
+            (t3, 3.0, "m1"),
+        ]
+        self.request.limit = 2
+
+        response = self.servicer.GetMetrics(self.request, self.context)
+
+        mock_get_readings.assert_called_once_with(epoch_us=True, limit=3)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.next_page_token, encode_page_token(t2, "m1"))
+
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_last_page_has_no_token(self, mock_get_readings):
+        mock_get_readings.return_value = [("t1", 1.0, "m1")]
+        self.request.limit = 2
+
+        response = self.servicer.GetMetrics(self.request, self.context)
+
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.next_page_token, "")
+
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_resumes_after_page_token(self, mock_get_readings):
+        mock_get_readings.return_value = []
+        last = datetime(2021, 1, 1, 0, 30, tzinfo=timezone.utc)
+        self.request.page_token = encode_page_token(last, "m1")
+
+        self.servicer.GetMetrics(self.request, self.context)
+
+        mock_get_readings.assert_called_once_with(
+            after=last, after_meter="m1", epoch_us=True, limit=None
+        )
+
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_accepts_time_only_page_token(self, mock_get_readings):
+        mock_get_readings.return_value = []
+        self.request.page_token = base64.urlsafe_b64encode(
+            b"2021-01-01 00:30:00+00:00"
+        ).decode()
+
+        self.servicer.GetMetrics(self.request, self.context)
+
+        mock_get_readings.assert_called_once_with(
+            after=datetime(2021, 1, 1, 0, 30, tzinfo=timezone.utc),
+            after_meter=None,
+            epoch_us=True,
+            limit=None,
+        )
+
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_filters_by_meter(self, mock_get_readings):
+        mock_get_readings.return_value = []
+        self.request.meter_ids.extend(["m1", "m2"])
+
+        self.servicer.GetMetrics(self.request, self.context)
+
+        mock_get_readings.assert_called_once_with(
+            meter_ids=["m1", "m2"], epoch_us=True, limit=None
+        )
+
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_columnar_fills_packed_columns(self, mock_get_readings):
+        mock_get_readings.return_value = [
+            (1609459200000000, 1.5, "m1"),
+            (1609460100000999, 2.5, "m2"),
+        ]
+        self.request.columnar = True
+
+        response = self.servicer.GetMetrics(self.request, self.context)
+
+        mock_get_readings.assert_called_once_with(epoch_us=True, limit=None)
+        self.assertEqual(len(response.data), 0)
+        self.assertEqual(
+            list(response.columns.time_unix_ms), [1609459200000, 1609460100000]
+        )
+        self.assertEqual(list(response.columns.meterusage), [1.5, 2.5])
+        self.assertEqual(list(response.columns.meter_id), ["m1", "m2"])
+
+    @patch("server.servicer.get_readings")
+    @patch("server.servicer.get_reading_columns")
+    def test_get_metrics_columnar_omits_meter_column_for_single_meter(
+        self, mock_get_columns, mock_get_readings
+    ):
+        mock_get_columns.return_value = ([1609459200000000], [1.5], None)
+        self.request.columnar = True
+        self.request.meter_ids.append("m1")
+
+        response = self.servicer.GetMetrics(self.request, self.context)
+
+        mock_get_readings.assert_not_called()
+        mock_get_columns.assert_called_once_with(meter_ids=["m1"], limit=None)
+        self.assertEqual(list(response.columns.time_unix_ms), [1609459200000])
+        self.assertEqual(list(response.columns.meterusage), [1.5])
+        self.assertEqual(list(response.columns.meter_id), [])
+
+    @patch("server.servicer.get_reading_columns")
+    def test_get_metrics_columnar_bulk_path_pages(self, mock_get_columns):
+        mock_get_columns.return_value = (
+            [1609459200000000, 1609460100000000],
+            [1.0, 2.0],
+            ["m1", "m2"],
+        )
+        self.request.columnar = True
+        self.request.limit = 1
+        self.request.meter_ids.extend(["m1", "m2"])
+
+        response = self.servicer.GetMetrics(self.request, self.context)
+
+        mock_get_columns.assert_called_once_with(meter_ids=["m1", "m2"], limit=2)
+        self.assertEqual(list(response.columns.time_unix_ms), [1609459200000])
+        self.assertEqual(list(response.columns.meter_id), ["m1"])
+        self.assertEqual(
+            response.next_page_token,
+            encode_page_token(datetime(2021, 1, 1, tzinfo=timezone.utc), "m1"),
+        )
+
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_columnar_page_token_round_trips(self, mock_get_readings):
+        mock_get_readings.return_value = [
+            (1609459200000000, 1.0, "m1"),
+            (1609460100000000, 2.0, "m1"),
+        ]
+        self.request.columnar = True
+        self.request.limit = 1
+
+        response = self.servicer.GetMetrics(self.request, self.context)
+
+        self.assertEqual(
+            response.next_page_token,
+            encode_page_token(datetime(2021, 1, 1, tzinfo=timezone.utc), "m1"),
+        )
+
+    @patch("server.servicer.get_reading_columns")
+    def test_get_metrics_columnar_page_token_keeps_microseconds(self, mock_get_columns):
+        # 00:00:00.000999 shows as ms 0 but must resume after the exact time,
+        # neither rounded up past 00:00:00.001 nor truncated back to .000.
+        mock_get_columns.return_value = (
+            [1609459200000999, 1609459200001000],
+            [1.0, 2.0],
+            None,
+        )
+        self.request.columnar = True
+        self.request.limit = 1
+        self.request.meter_ids.append("m1")
+
+        response = self.servicer.GetMetrics(self.request, self.context)
+
+        self.assertEqual(list(response.columns.time_unix_ms), [1609459200000])
+        last = datetime(2021, 1, 1, 0, 0, 0, 999, tzinfo=timezone.utc)
+        self.assertEqual(response.next_page_token, encode_page_token(last, "m1"))
+        self.assertEqual(decode_page_token(response.next_page_token), (last, "m1"))
+
+    @patch("server.servicer.get_readings")
+    def test_get_metrics_rejects_malformed_page_token(self, mock_get_readings):
+        self.request.page_token = "not-a-token"
+        self.context.abort.side_effect = Exception("aborted")
+
+        with self.assertRaises(Exception):
+            self.servicer.GetMetrics(self.request, self.context)
+
+        self.context.abort.assert_called_once()
+        mock_get_readings.assert_not_called()
+
+
+class TestStreamMetrics(unittest.TestCase):
+    def setUp(self):
+        response_cache.clear()
+        self.servicer = MetricsServicer()
+        self.request = MetricsRequest()
+        self.context = MagicMock()
+
+    @patch("server.servicer.STREAM_CHUNK_SIZE", 2)
+    @patch("server.servicer.iter_readings")
+    def test_splits_rows_into_chunks(self, mock_iter_readings):
+        mock_iter_readings.return_value = iter(
+            [(f"t{i}", float(i), "m1") for i in range(1, 6)]
+        )
+
+        chunks = list(self.servicer.StreamMetrics(self.request, self.context))
+
+        self.assertEqual([len(c.data) for c in chunks], [2, 2, 1])
+        self.assertEqual(chunks[0].data[0].time, "t1")
+        self.assertEqual(chunks[2].data[0].time, "t5")
+        self.assertAlmostEqual(chunks[2].data[0].meterusage, 5.0)
+
+    @patch("server.servicer.STREAM_CHUNK_SIZE", 2)
+    @patch("server.servicer.iter_readings")
+    def test_columnar_chunks(self, mock_iter_readings):
+        mock_iter_readings.return_value = iter(
+            [(1000000, 1.0, "m1"), (2000000, 2.0, "m1"), (3000999, 3.0, "m1")]
+        )
+        self.request.columnar = True
+
+        chunks = list(self.servicer.StreamMetrics(self.request, self.context))
+
+        mock_iter_readings.assert_called_once_with(epoch_us=True, limit=None)
+        self.assertEqual(
+            [list(c.columns.time_unix_ms) for c in chunks], [[1000, 2000], [3000]]
+        )
+        self.assertEqual(list(chunks[1].columns.meterusage), [3.0])
+
+    @patch("server.servicer.iter_readings")
+    def test_yields_nothing_when_no_data(self, mock_iter_readings):
+        mock_iter_readings.return_value = iter([])
+
+        chunks = list(self.servicer.StreamMetrics(self.request, self.context))
+
+        self.assertEqual(chunks, [])
+
+
+class TestAggregateMetrics(unittest.TestCase):
+    def setUp(self):
+        response_cache.clear()
+        self.servicer = MetricsServicer()
+        self.context = MagicMock()
+
+    @patch("server.servicer.aggregate_readings")
+    def test_maps_request_to_orm_call(self, mock_aggregate):
+        t = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        mock_aggregate.return_value = [(t, 42.0, "m1")]
+        request = AggregateRequest(aggregate=metrics_pb2.SUM)
+        request.bucket_width.FromTimedelta(timedelta(days=1))
+        request.start.FromDatetime(t)
+
+        response = self.servicer.AggregateMetrics(request, self.context)
+
+        mock_aggregate.assert_called_once_with(
+            "sum", start=t, bucket_width=timedelta(days=1)
+        )
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0].time, str(t))
+        self.assertAlmostEqual(response.data[0].meterusage, 42.0)
+        self.assertEqual(response.data[0].meter_id, "m1")
+
+    @patch("server.servicer.aggregate_readings")
+    def test_month_buckets(self, mock_aggregate):
+        mock_aggregate.return_value = []
+        request = AggregateRequest(bucket_months=1)
+
+        self.servicer.AggregateMetrics(request, self.context)
+
+        mock_aggregate.assert_called_once_with("avg", bucket_months=1)
+
+    @patch("server.servicer.aggregate_readings")
+    def test_invalid_arguments_abort(self, mock_aggregate):
+        mock_aggregate.side_effect = ValueError("bad bucket")
+        self.context.abort.side_effect = Exception("aborted")
+
+        with self.assertRaises(Exception):
+            self.servicer.AggregateMetrics(AggregateRequest(), self.context)
+
+        self.context.abort.assert_called_once()
+
+
+class TestIngestMetrics(unittest.TestCase):
+    def setUp(self):
+        response_cache.clear()
+        self.servicer = MetricsServicer()
+        self.context = MagicMock()
+
+    @patch("server.ingest.insert_readings")
+    def test_writes_stream_and_reports_counts(self, mock_insert):
+        mock_insert.side_effect = lambda rows: len(rows)
+        requests = iter(
+            [
+                IngestRequest(
+                    data=[
+                        MetricPoint(
+                            time="2021-01-01 00:00:00", meterusage=1.0, meter_id="m1"
+                        ),
+                        MetricPoint(time="garbage", meterusage=2.0),
+                    ]
+                ),
+                IngestRequest(
+                    data=[MetricPoint(time="2021-01-01 00:15:00", meterusage=3.0)]
+                ),
+            ]
+        )
+
+        response = self.servicer.IngestMetrics(requests, self.context)
+
+        self.assertEqual(response.accepted, 2)
+        self.assertEqual(response.rejected, 1)
+        written = [row for c in mock_insert.call_args_list for row in c[0][0]]
+        self.assertEqual(
+            written,
+            [
+                ("2021-01-01 00:00:00+00:00", 1.0, "m1"),
+                ("2021-01-01 00:15:00+00:00", 3.0, DEFAULT_METER_ID),
+            ],
+        )
+
+    @patch("server.ingest.insert_readings")
+    def test_empty_stream(self, mock_insert):
+        response = self.servicer.IngestMetrics(iter([]), self.context)
+
+        self.assertEqual(response.accepted, 0)
+        self.assertEqual(response.rejected, 0)
+        mock_insert.assert_not_called()
+
+
+class TestListMeters(unittest.TestCase):
+    def setUp(self):
+        response_cache.clear()
+
+    @patch("server.servicer.list_meters")
+    def test_returns_meter_ids(self, mock_list_meters):
+        mock_list_meters.return_value = ["m1", "m2"]
+
+        response = MetricsServicer().ListMeters(
+            metrics_pb2.ListMetersRequest(), MagicMock()
+        )
+
+        self.assertEqual(list(response.meter_ids), ["m1", "m2"])
+
+
+class TestGetDataVersion(unittest.TestCase):
+    def setUp(self):
+        response_cache.clear()
+
+    @patch("server.servicer.data_version")
+    def test_cached_until_a_write(self, mock_data_version):
+        mock_data_version.side_effect = ["a-1", "a-2"]
+        servicer = MetricsServicer()
+        request = metrics_pb2.DataVersionRequest()
+
+        first = servicer.GetDataVersion(request, MagicMock())
+        cached = servicer.GetDataVersion(request, MagicMock())
+        response_cache.invalidate(
+            datetime(2021, 1, 1, tzinfo=timezone.utc),
+            datetime(2021, 1, 1, tzinfo=timezone.utc),
+            {"m1"},
+        )
+        after_write = servicer.GetDataVersion(request, MagicMock())
+
+        self.assertEqual(first.version, "a-1")
+        self.assertEqual(
+            metrics_pb2.DataVersionResponse.FromString(cached).version, "a-1"
+        )
+        self.assertEqual(after_write.version, "a-2")
+
+    @patch("server.servicer.data_version")
+    def test_version_read_before_a_write_is_not_cached(self, mock_data_version):
+        versions = iter(["a-1", "a-2"])
+
+        def read_racing_a_write():
+            version = next(versions)
+            # A write commits and invalidates while the read is in flight.
+            response_cache.invalidate()
+            return version
+
+        mock_data_version.side_effect = read_racing_a_write
+        servicer = MetricsServicer()
+        request = metrics_pb2.DataVersionRequest()
+
+        servicer.GetDataVersion(request, MagicMock())
+        latest = servicer.GetDataVersion(request, MagicMock())
+
+        self.assertEqual(latest.version, "a-2")
+        self.assertEqual(mock_data_version.call_count, 2)
+
+
+class TestGetSummary(unittest.TestCase):
+    def setUp(self):
+        response_cache.clear()
+
+    @patch("server.servicer.get_summary")
+    def test_builds_summaries_and_caches_them(self, mock_get_summary):
+        start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        peak = datetime(2021, 1, 1, 18, 15, tzinfo=timezone.utc)
+        mock_get_summary.return_value = [("m1", 10.0, 4, 1.0, 4.0, peak)]
+        request = metrics_pb2.SummaryRequest(meter_ids=["m1"])
+        request.start.FromDatetime(start)
+        servicer = MetricsServicer()
+
+        response = servicer.GetSummary(request, MagicMock())
+        cached = servicer.GetSummary(request, MagicMock())
+
+        mock_get_summary.assert_called_once_with(start=start, meter_ids=["m1"])
+        (summary,) = response.summaries
+        self.assertEqual(summary.meter_id, "m1")
+        self.assertEqual(summary.total, 10.0)
+        self.assertEqual(summary.readings, 4)
+        self.assertEqual(summary.mean, 2.5)
+        self.assertEqual((summary.minimum, summary.maximum), (1.0, 4.0))
+        self.assertEqual(summary.peak_time, str(peak))
+        self.assertEqual(metrics_pb2.SummaryResponse.FromString(cached), response)
+
+
+class TestGetAnomalies(unittest.TestCase):
+    def setUp(self):
+        response_cache.clear()
+
+    @patch("server.servicer.get_anomalies")
+    def test_builds_anomalies_and_caches_them(self, mock_get_anomalies):
+        start = datetime(2021, 1, 1, tzinfo=timezone.utc)
+        gap_end = datetime(2021, 1, 1, 1, tzinfo=timezone.utc)
+        spike = datetime(2021, 1, 1, 2, tzinfo=timezone.utc)
+        mock_get_anomalies.return_value = [
+            ("m1", "gap", start, gap_end, None, 3.0),
+            ("m1", "spike", spike, spike + timedelta(minutes=15), 9.5, -4.5),
+        ]
+        request = metrics_pb2.AnomaliesRequest(
+            meter_ids=["m1"],
+            kinds=[metrics_pb2.SPIKE, metrics_pb2.GAP],
+            limit=10,
+        )
+        servicer = MetricsServicer()
+
+        response = servicer.GetAnomalies(request, MagicMock())
+        cached = servicer.GetAnomalies(request, MagicMock())
+
+        mock_get_anomalies.assert_called_once_with(
+            meter_ids=["m1"], kinds=["gap", "spike"], limit=10
+        )
+        gap, spike_anomaly = response.anomalies
+        self.assertEqual(gap.kind, metrics_pb2.GAP)
+        self.assertEqual((gap.start, gap.end), (str(start), str(gap_end)))
+        self.assertEqual((gap.value, gap.score), (0.0, 3.0))
+        self.assertEqual(spike_anomaly.kind, metrics_pb2.SPIKE)
+        self.assertEqual((spike_anomaly.value, spike_anomaly.score), (9.5, -4.5))
+        self.assertEqual(metrics_pb2.AnomaliesResponse.FromString(cached), response)
+
+    @patch("server.servicer.get_anomalies", return_value=[])
+    def test_any_write_to_the_meters_invalidates_every_window(self, mock_get):
+        request = metrics_pb2.AnomaliesRequest(meter_ids=["m1"])
+        request.end.FromDatetime(datetime(2021, 1, 1, tzinfo=timezone.utc))
+        servicer = MetricsServicer()
+        servicer.GetAnomalies(request, MagicMock())
+
+        # A gap ending at these rows may start before the cached window ends.
+        response_cache.invalidate(
+            datetime(2021, 2, 1, tzinfo=timezone.utc),
+            datetime(2021, 2, 2, tzinfo=timezone.utc),
+            ["m2"],
+        )
+        servicer.GetAnomalies(request, MagicMock())
+        self.assertEqual(mock_get.call_count, 1)
+
+        response_cache.invalidate(
+            datetime(2021, 2, 1, tzinfo=timezone.utc),
+            datetime(2021, 2, 2, tzinfo=timezone.utc),
+            ["m1"],
+        )
+        servicer.GetAnomalies(request, MagicMock())
+        self.assertEqual(mock_get.call_count, 2)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,118 @@
+"""Unit tests for server/singleflight.py."""
+
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from server.singleflight import AsyncSingleFlight, SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.flight = SingleFlight()
+
+    def _concurrent(self, fn, callers=5):
+        """Call ``fn`` from ``callers`` threads under one key at once."""
+        release = threading.Event()
+        started = threading.Event()
+
+        def blocked():
+            started.set()
+            release.wait(5)
+            return fn()
+
+        with ThreadPoolExecutor(callers) as pool:
+            leader = pool.submit(self.flight.do, "k", blocked)
+            started.wait(5)
+            followers = [
+                pool.submit(self.flight.do, "k", blocked) for _ in range(callers - 1)
+            ]
+            # Give the followers time to join before the leader finishes.
+            time.sleep(0.05)
+            release.set()
+        return leader, followers
+
+    def test_concurrent_calls_share_one_execution(self):
+        calls = []
+
+        def fn():
+            calls.append(1)
+            return "result"
+
+        leader, followers = self._concurrent(fn)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(leader.result(), ("result", False))
+        for follower in followers:
+            self.assertEqual(follower.result(), ("result", True))
+        self.assertEqual(self.flight.in_flight(), 0)
+
+    def test_errors_reach_every_caller(self):
+        def fn():
+            raise ValueError("boom")
+
+        leader, followers = self._concurrent(fn, callers=3)
+
+        for future in [leader, *followers]:
+            with self.assertRaises(ValueError):
+                future.result()
+        self.assertEqual(self.flight.in_flight(), 0)
+
+    def test_sequential_calls_run_again(self):
+        self.assertEqual(self.flight.do("k", lambda: 1), (1, False))
+        self.assertEqual(self.flight.do("k", lambda: 2), (2, False))
+
+    def test_keys_are_independent(self):
+        self.assertEqual(self.flight.do("a", lambda: 1), (1, False))
+        self.assertEqual(self.flight.do("b", lambda: 2), (2, False))
+
+
+class TestAsyncSingleFlight(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.flight = AsyncSingleFlight()
+
+    async def test_concurrent_calls_share_one_execution(self):
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(self.flight.do("k", fn) for _ in range(5)))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results[0], ("result", False))
+        self.assertEqual(results[1:], [("result", True)] * 4)
+        self.assertEqual(self.flight.in_flight(), 0)
+
+    async def test_errors_reach_every_caller(self):
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            *(self.flight.do("k", fn) for _ in range(3)), return_exceptions=True
+        )
+
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        self.assertEqual(self.flight.in_flight(), 0)
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        async def fn():
+            await asyncio.sleep(0.05)
+            return "result"
+
+        first = asyncio.ensure_future(self.flight.do("k", fn))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(self.flight.do("k", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        self.assertEqual(await second, ("result", True))
+
+
+if __name__ == "__main__":
+    unittest.main()
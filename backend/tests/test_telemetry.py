@@ -0,0 +1,142 @@
+"""Unit tests for server/telemetry.py."""
+
+import unittest
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+from server import telemetry
+from server.telemetry import (
+    Counter,
+    Gauge,
+    Histogram,
+    register,
+    render,
+    start_http_server,
+)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_samples_are_cumulative(self):
+        histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+
+        samples = list(histogram.samples())
+
+        self.assertEqual(
+            samples,
+            [
+                ("latency_seconds_bucket", {"le": "0.1"}, 2),
+                ("latency_seconds_bucket", {"le": "1.0"}, 3),
+                ("latency_seconds_bucket", {"le": "+Inf"}, 4),
+                ("latency_seconds_sum", {}, 3.65),
+                ("latency_seconds_count", {}, 4),
+            ],
+        )
+
+    def test_series_are_kept_per_label_set(self):
+        histogram = Histogram("rpc_seconds", "RPC time.", labelnames=("method",))
+        histogram.observe(0.1, method="A")
+        histogram.observe(0.2, method="A")
+        histogram.observe(0.3, method="B")
+
+        self.assertEqual(histogram.count(method="A"), 2)
+        self.assertEqual(histogram.count(method="B"), 1)
+        self.assertEqual(histogram.count(method="C"), 0)
+
+    def test_rejects_wrong_labels(self):
+        histogram = Histogram("rpc_seconds", "RPC time.", labelnames=("method",))
+
+        with self.assertRaises(ValueError):
+            histogram.observe(0.1, stage="x")
+
+    def test_time_observes_block_duration(self):
+        histogram = Histogram("block_seconds", "Block time.")
+
+        with histogram.time():
+            pass
+
+        self.assertEqual(histogram.count(), 1)
+
+
+class TestCounterAndGauge(unittest.TestCase):
+    def test_counter_accumulates_per_label_set(self):
+        counter = Counter("calls_total", "Calls.", labelnames=("code",))
+        counter.inc(code="OK")
+        counter.inc(2, code="OK")
+        counter.inc(code="UNKNOWN")
+
+        self.assertEqual(counter.value(code="OK"), 3)
+        self.assertEqual(
+            sorted(counter.samples(), key=lambda sample: sample[1]["code"]),
+            [
+                ("calls_total", {"code": "OK"}, 3),
+                ("calls_total", {"code": "UNKNOWN"}, 1),
+            ],
+        )
+
+    def test_callback_counter_reads_fn(self):
+        counter = Counter("hits_total", "Hits.", fn=lambda: 7)
+
+        self.assertEqual(list(counter.samples()), [("hits_total", {}, 7)])
+
+    def test_gauge_goes_up_and_down(self):
+        gauge = Gauge("in_flight", "In flight.", labelnames=("method",))
+        gauge.inc(method="A")
+        gauge.inc(method="A")
+        gauge.dec(method="A")
+
+        self.assertEqual(gauge.value(method="A"), 1)
+        gauge.set(5, method="A")
+        self.assertEqual(gauge.value(method="A"), 5)
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(telemetry, "_registry", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_render_uses_prometheus_text_format(self):
+        register(Gauge("pool_idle", "Idle connections.", lambda: 3))
+
+        self.assertEqual(
+            render(),
+            "# HELP pool_idle Idle connections.\n"
+            "# TYPE pool_idle gauge\n"
+            "pool_idle 3\n",
+        )
+
+    def test_render_formats_labels(self):
+        histogram = register(Histogram("wait_seconds", "Wait.", buckets=(1.0,)))
+        histogram.observe(0.5)
+
+        self.assertIn('wait_seconds_bucket{le="1.0"} 1\n', render())
+
+    def test_render_escapes_label_values(self):
+        counter = register(Counter("errors_total", "Errors.", labelnames=("msg",)))
+        counter.inc(msg='say "hi"')
+
+        self.assertIn('errors_total{msg="say \\"hi\\""} 1\n', render())
+
+    def test_http_server_serves_metrics(self):
+        register(Gauge("up", "Up.", lambda: 1))
+        server = start_http_server(0)
+        self.addCleanup(server.shutdown)
+        base = "http://127.0.0.1:%d" % server.server_address[1]
+
+        with urllib.request.urlopen(base + "/metrics") as response:
+            self.assertIn("up 1\n", response.read().decode())
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(base + "/other")
+
+    def test_duplicate_names_are_rejected(self):
+        register(Gauge("dup", "", lambda: 0))
+
+        with self.assertRaises(ValueError):
+            register(Gauge("dup", "", lambda: 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
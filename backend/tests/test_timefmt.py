@@ -0,0 +1,49 @@
+"""Unit tests for server/timefmt.py."""
+
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from server.timefmt import EPOCH, TimeFormatter, from_epoch_us
+
+
+def _us(dt):
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+class TestTimeFormatter(unittest.TestCase):
+    def test_matches_str_of_utc_datetime_on_a_regular_cadence(self):
+        fmt = TimeFormatter()
+        start = datetime(2019, 12, 31, 22, 0, tzinfo=timezone.utc)
+        for i in range(300):
+            dt = start + timedelta(minutes=15 * i)
+            self.assertEqual(fmt(_us(dt)), str(dt))
+
+    def test_microseconds_and_irregular_times(self):
+        fmt = TimeFormatter()
+        for dt in (
+            datetime(2021, 1, 1, 0, 0, 0, 1, tzinfo=timezone.utc),
+            datetime(2021, 6, 30, 23, 59, 59, 999999, tzinfo=timezone.utc),
+            datetime(2020, 2, 29, 12, 34, 56, tzinfo=timezone.utc),
+            datetime(1969, 12, 31, 23, 59, 59, 500000, tzinfo=timezone.utc),
+            EPOCH,
+        ):
+            self.assertEqual(fmt(_us(dt)), str(dt))
+
+    def test_days_can_go_backwards(self):
+        fmt = TimeFormatter()
+        later = datetime(2021, 1, 2, tzinfo=timezone.utc)
+        earlier = datetime(2021, 1, 1, 23, 45, tzinfo=timezone.utc)
+
+        self.assertEqual(fmt(_us(later)), str(later))
+        self.assertEqual(fmt(_us(earlier)), str(earlier))
+
+
+class TestFromEpochUs(unittest.TestCase):
+    def test_is_exact(self):
+        dt = datetime(2262, 1, 1, 0, 0, 0, 123457, tzinfo=timezone.utc)
+
+        self.assertEqual(from_epoch_us(_us(dt)), dt)
+
+
+if __name__ == "__main__":
+    unittest.main()
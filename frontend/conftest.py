@@ -0,0 +1,7 @@
+import sys
+import os
+
+# Ensure the frontend directory is on sys.path so that server.py and the
+# generated metrics_pb2 modules are importable regardless of where pytest is
+# invoked from.
+sys.path.insert(0, os.path.dirname(__file__))
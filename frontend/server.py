@@ -1,11 +1,33 @@
+import asyncio
+import bisect
+import csv
+import gzip
+import hashlib
+import io
 import json
 import logging
 import math
 import os
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from functools import partial
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from http import HTTPStatus
+from http.client import parse_headers
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain, cycle, repeat
+from urllib.parse import parse_qs, urlsplit
 
 import grpc
-from google.protobuf.empty_pb2 import Empty
+
+try:
+    import brotli
+except ImportError:  # optional; responses fall back to gzip
+    brotli = None
 
 import metrics_pb2
 import metrics_pb2_grpc
@@ -17,66 +39,1185 @@ GRPC_HOST = os.environ.get("GRPC_HOST", "grpc-server")
 GRPC_PORT = os.environ.get("GRPC_PORT", "50051")
 HTTP_PORT = int(os.environ.get("HTTP_PORT", "8000"))
 GRPC_TIMEOUT_SECONDS = float(os.environ.get("GRPC_TIMEOUT_SECONDS", "5"))
+# Exports stream the whole selection, so they get a much longer deadline.
+GRPC_STREAM_TIMEOUT_SECONDS = float(
+    os.environ.get("GRPC_STREAM_TIMEOUT_SECONDS", "300")
+)
+
+# Bodies smaller than this are not worth compressing.
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+
+# Comma-separated backend addresses; overrides GRPC_HOST/GRPC_PORT. Calls
+# are spread round-robin over all of them and over every address each DNS
+# name resolves to.
+GRPC_TARGETS = [
+    target.strip()
+    for target in os.environ.get("GRPC_TARGETS", f"{GRPC_HOST}:{GRPC_PORT}").split(",")
+    if target.strip()
+]
+# Channels (each with its own HTTP/2 connections) per backend address.
+GRPC_CHANNELS = int(os.environ.get("GRPC_CHANNELS", "2"))
+GRPC_KEEPALIVE_SECONDS = float(os.environ.get("GRPC_KEEPALIVE_SECONDS", "30"))
+# Attempts per call, including the first; 1 disables retries.
+GRPC_RETRY_ATTEMPTS = int(os.environ.get("GRPC_RETRY_ATTEMPTS", "3"))
+# Serve HTTP from one asyncio event loop with grpc.aio instead of a thread
+# per connection.
+HTTP_ASYNC = os.environ.get("HTTP_ASYNC", "false").lower() in ("1", "true", "yes")
+
+_METHOD_CONFIG = {"name": [{"service": "metrics.MetricsService"}]}
+if GRPC_RETRY_ATTEMPTS > 1:
+    # The frontend only reads, so a call that failed with UNAVAILABLE (backend
+    # restarting, connection reset) is safe to retry, usually on another
+    # replica.
+    _METHOD_CONFIG["retryPolicy"] = {
+        "maxAttempts": GRPC_RETRY_ATTEMPTS,
+        "initialBackoff": "0.1s",
+        "maxBackoff": "1s",
+        "backoffMultiplier": 2,
+        "retryableStatusCodes": ["UNAVAILABLE"],
+    }
+CHANNEL_OPTIONS = (
+    (
+        "grpc.service_config",
+        json.dumps(
+            {
+                "loadBalancingConfig": [{"round_robin": {}}],
+                "methodConfig": [_METHOD_CONFIG],
+            }
+        ),
+    ),
+    ("grpc.enable_retries", 1),
+    ("grpc.keepalive_time_ms", int(GRPC_KEEPALIVE_SECONDS * 1000)),
+    ("grpc.keepalive_timeout_ms", 10_000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    # Channels with equal arguments share connections unless told otherwise.
+    ("grpc.use_local_subchannel_pool", 1),
+)
+
+
+class ChannelPool:
+    """``size`` channels per backend address, handed out round-robin.
+
+    Targets are resolved through DNS with the ``round_robin`` balancer, so a
+    name backed by several ``grpc-server`` replicas spreads calls over all
+    of them. Channels whose backend is unreachable are skipped until they
+    reconnect. ``factory`` is ``grpc.insecure_channel`` or its ``grpc.aio``
+    counterpart.
+    """
+
+    def __init__(self, targets, size, factory) -> None:
+        self.channels = [
+            factory(
+                target if ":///" in target else "dns:///" + target,
+                options=CHANNEL_OPTIONS,
+            )
+            for _ in range(size)
+            for target in targets
+        ]
+        self._stubs = [metrics_pb2_grpc.MetricsServiceStub(c) for c in self.channels]
+        self._order = cycle(range(len(self.channels)))
+        self._failing = set()
+        for index, channel in enumerate(self.channels):
+            if not isinstance(channel, grpc.aio.Channel):
+                # Sync channels only report their state through callbacks.
+                channel.subscribe(partial(self._on_state, index), try_to_connect=True)
+
+    def _on_state(self, index, state) -> None:
+        if state == grpc.ChannelConnectivity.TRANSIENT_FAILURE:
+            self._failing.add(index)
+        else:
+            self._failing.discard(index)
+
+    def _healthy(self, index) -> bool:
+        channel = self.channels[index]
+        if isinstance(channel, grpc.aio.Channel):
+            state = channel.get_state()
+            return state != grpc.ChannelConnectivity.TRANSIENT_FAILURE
+        return index not in self._failing
+
+    def stub(self):
+        """Return the next healthy stub, or the next one if none is healthy."""
+        # Advance once per call, so the fallback still rotates.
+        start = next(self._order)
+        for offset in range(len(self._stubs)):
+            index = (start + offset) % len(self._stubs)
+            if self._healthy(index):
+                return self._stubs[index]
+        return self._stubs[start]
+
+
+# Channels start connecting when created, so each pool is built by the
+# serve() that uses it; grpc.aio channels also belong to an event loop.
+GRPC_POOL = None
+AIO_POOL = None
+
+_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+_SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+class _Histogram:
+    """Minimal labelled histogram rendered in the Prometheus text format."""
+
+    def __init__(self, name, help, buckets=_LATENCY_BUCKETS):
+        self.name, self.help, self.buckets = name, help, buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(k, list(c), t) for k, (c, t) in self._series.items()]
+        for key, counts, total in series:
+            labels = "".join(f'{k}="{v}",' for k, v in key)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else float(bound)
+                lines.append(f'{self.name}_bucket{{{labels}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels.rstrip(',')}}} {total}")
+            lines.append(f"{self.name}_count{{{labels.rstrip(',')}}} {cumulative}")
+        return lines
+
+
+class _Counter:
+    def __init__(self, name, help, type="counter"):
+        self.name, self.help, self.type = name, help, type
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            labels = ",".join(f'{k}="{v}"' for k, v in key)
+            lines.append(
+                f"{self.name}{{{labels}}} {value}" if labels else f"{self.name} {value}"
+            )
+        return lines
+
+
+HTTP_REQUESTS = _Counter("http_requests_total", "HTTP requests by route and status.")
+HTTP_IN_FLIGHT = _Counter(
+    "http_requests_in_flight", "HTTP requests being handled.", "gauge"
+)
+HTTP_SECONDS = _Histogram(
+    "http_request_seconds", "HTTP request handling time by route."
+)
+HTTP_RESPONSE_BYTES = _Histogram(
+    "http_response_bytes", "HTTP response body size by route.", _SIZE_BUCKETS
+)
+STAGE_SECONDS = _Histogram(
+    "frontend_stage_seconds",
+    "Time per backend RPC spent in the gRPC call, conversion and JSON encoding.",
+)
+COALESCED_REQUESTS = _Counter(
+    "frontend_coalesced_requests_total",
+    "Backend calls answered by joining an identical call already in flight.",
+)
+_METRICS = (
+    HTTP_REQUESTS,
+    HTTP_IN_FLIGHT,
+    HTTP_SECONDS,
+    HTTP_RESPONSE_BYTES,
+    STAGE_SECONDS,
+    COALESCED_REQUESTS,
+)
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in _METRICS for line in metric.render()) + "\n"
+
+
+@contextmanager
+def _stage(rpc, stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, rpc=rpc, stage=stage)
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent identical backend calls into one.
+
+    The first thread to ask for ``key`` runs ``fn``; threads asking while it
+    runs wait for it and get the same result or exception. Nothing is kept
+    afterwards, so responses are never served stale.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, rpc, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            COALESCED_REQUESTS.inc(rpc=rpc)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+
+class AsyncSingleFlight:
+    """:class:`SingleFlight` for coroutines on the asyncio server.
+
+    The call runs in its own task, so a client that disconnects does not
+    cancel it for the others waiting on it.
+    """
+
+    def __init__(self):
+        self._flights = {}
+
+    async def do(self, key, rpc, fn):
+        task = self._flights.get(key)
+        if task is None:
+            task = self._flights[key] = asyncio.ensure_future(self._run(key, fn))
+        else:
+            COALESCED_REQUESTS.inc(rpc=rpc)
+        return await asyncio.shield(task)
+
+    async def _run(self, key, fn):
+        try:
+            return await fn()
+        finally:
+            del self._flights[key]
+
+
+FLIGHT = SingleFlight()
+AIO_FLIGHT = AsyncSingleFlight()
+
+
+_GZIP_LEVEL = 6
+# Brotli's default quality (11) is far too slow for per-request compression.
+_BROTLI_QUALITY = 5
+_COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/")
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """Pick ``br`` (when available) or ``gzip`` from an Accept-Encoding header."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ("br", "gzip") if brotli else ("gzip",):
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
 
-GRPC_CHANNEL = grpc.insecure_channel(f"{GRPC_HOST}:{GRPC_PORT}")
-GRPC_STUB = metrics_pb2_grpc.MetricsServiceStub(GRPC_CHANNEL)
 
+def _compress(body: bytes, encoding: str, best: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if best else _BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=9 if best else _GZIP_LEVEL, mtime=0)
 
-def fetch_metrics():
-    response = GRPC_STUB.GetMetrics(Empty(), timeout=GRPC_TIMEOUT_SECONDS)
+
+class _StreamCompressor:
+    """Incremental gzip/brotli encoder, flushed after every chunk so that
+    each one can be sent and decoded as soon as it is produced."""
+
+    def __init__(self, encoding: str) -> None:
+        self._brotli = encoding == "br"
+        if self._brotli:
+            self._compressor = brotli.Compressor(quality=_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli:
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        if self._brotli:
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def etag_base(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()[:20]
+
+
+def matching_etag(if_none_match: str, base: str) -> str | None:
+    """Return the If-None-Match entity tag naming a representation of ``base``.
+
+    Each content encoding gets its own strong tag (``base-gzip``), so the
+    suffix is ignored here; ``W/`` is ignored as If-None-Match compares weakly.
+    """
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return '"%s"' % base
+        opaque = tag.removeprefix("W/").strip('"')
+        if opaque.partition("-")[0] == base:
+            return tag
+    return None
+
+
+class StaticFile:
+    """A file read once at startup and kept in memory, precompressed."""
+
+    def __init__(self, path: str, content_type: str) -> None:
+        with open(path, "rb") as f:
+            body = f.read()
+        self.content_type = content_type
+        self.etag = etag_base(body)
+        self.variants = {None: body, "gzip": _compress(body, "gzip", best=True)}
+        if brotli:
+            self.variants["br"] = _compress(body, "br", best=True)
+
+
+INDEX_HTML = StaticFile(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.html"),
+    "text/html; charset=utf-8",
+)
+
+
+def _parse_time(value: str) -> datetime:
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _meter_ids(query: str) -> list[str]:
+    """Collect ``meter_id`` params, given repeated and/or comma-separated."""
+    values = parse_qs(query).get("meter_id", [])
+    return [m for v in values for m in v.split(",") if m]
+
+
+def build_request(query: str):
+    """Map ``start``/``end``/``limit``/``page_token``/``meter_id`` query params
+    onto a MetricsRequest.
+
+    Raises ValueError on malformed parameters.
+    """
+    params = {k: v[-1] for k, v in parse_qs(query).items()}
+    request = metrics_pb2.MetricsRequest(columnar=True, meter_ids=_meter_ids(query))
+    if "start" in params:
+        request.start.FromDatetime(_parse_time(params["start"]))
+    if "end" in params:
+        request.end.FromDatetime(_parse_time(params["end"]))
+    if "limit" in params:
+        limit = int(params["limit"])
+        if limit < 0:
+            raise ValueError("limit must be non-negative")
+        request.limit = limit
+    if "page_token" in params:
+        request.page_token = params["page_token"]
+    return request
+
+
+_BUCKET_UNITS = {
+    "s": "seconds",
+    "m": "minutes",
+    "h": "hours",
+    "d": "days",
+    "w": "weeks",
+}
+_BUCKET_RE = re.compile(r"^(\d+)(mo|[smhdw])$")
+
+
+def build_aggregate_request(query: str):
+    """Map ``bucket`` (e.g. ``15m``, ``1h``, ``1d``, ``1mo``), ``aggregate``,
+    ``start``, ``end`` and ``meter_id`` query params onto an AggregateRequest.
+
+    Raises ValueError on malformed parameters.
+    """
+    params = {k: v[-1] for k, v in parse_qs(query).items()}
+    request = metrics_pb2.AggregateRequest(meter_ids=_meter_ids(query))
+    match = _BUCKET_RE.match(params.get("bucket", "1h"))
+    if not match or int(match.group(1)) == 0:
+        raise ValueError("bucket must look like 15m, 1h, 1d, 1w or 1mo")
+    count, unit = int(match.group(1)), match.group(2)
+    if unit == "mo":
+        request.bucket_months = count
+    else:
+        request.bucket_width.FromTimedelta(timedelta(**{_BUCKET_UNITS[unit]: count}))
+    request.aggregate = metrics_pb2.Aggregate.Value(
+        params.get("aggregate", "avg").upper()
+    )
+    if "start" in params:
+        request.start.FromDatetime(_parse_time(params["start"]))
+    if "end" in params:
+        request.end.FromDatetime(_parse_time(params["end"]))
+    return request
+
+
+def build_summary_request(query: str):
+    """Map ``start``, ``end`` and ``meter_id`` query params onto a SummaryRequest.
+
+    Raises ValueError on malformed parameters.
+    """
+    params = {k: v[-1] for k, v in parse_qs(query).items()}
+    request = metrics_pb2.SummaryRequest(meter_ids=_meter_ids(query))
+    if "start" in params:
+        request.start.FromDatetime(_parse_time(params["start"]))
+    if "end" in params:
+        request.end.FromDatetime(_parse_time(params["end"]))
+    return request
+
+
+def build_anomalies_request(query: str):
+    """Map ``start``, ``end``, ``meter_id``, ``kind`` (``gap``/``spike``) and
+    ``limit`` query params onto an AnomaliesRequest.
+
+    Raises ValueError on malformed parameters.
+    """
+    params = {k: v[-1] for k, v in parse_qs(query).items()}
+    kinds = [k for v in parse_qs(query).get("kind", []) for k in v.split(",") if k]
+    request = metrics_pb2.AnomaliesRequest(
+        meter_ids=_meter_ids(query),
+        kinds=[metrics_pb2.AnomalyKind.Value(k.upper()) for k in kinds],
+    )
+    if "start" in params:
+        request.start.FromDatetime(_parse_time(params["start"]))
+    if "end" in params:
+        request.end.FromDatetime(_parse_time(params["end"]))
+    if "limit" in params:
+        limit = int(params["limit"])
+        if limit < 0:
+            raise ValueError("limit must be non-negative")
+        request.limit = limit
+    return request
+
+
+def _to_json_points(response):
     return [
         {
             "time": p.time,
+            "meter_id": p.meter_id,
             "meterusage": None if math.isnan(p.meterusage) else p.meterusage,
         }
         for p in response.data
     ]
 
 
-class Handler(BaseHTTPRequestHandler):
+def _to_json_summaries(response):
+    return [
+        {
+            "meter_id": m.meter_id,
+            "total": m.total,
+            "readings": m.readings,
+            "mean": m.mean,
+            "minimum": m.minimum,
+            "maximum": m.maximum,
+            "peak_time": m.peak_time,
+        }
+        for m in response.summaries
+    ]
+
+
+def _to_json_anomalies(response):
+    gap = metrics_pb2.GAP
+    return [
+        {
+            "meter_id": a.meter_id,
+            "kind": metrics_pb2.AnomalyKind.Name(a.kind).lower(),
+            "start": a.start,
+            "end": a.end,
+            # Gaps have no reading.
+            "value": None if a.kind == gap else a.value,
+            "score": a.score,
+        }
+        for a in response.anomalies
+    ]
+
+
+def _columns_to_json_points(columns, meter_ids):
+    # The server omits the meter column when exactly one meter was requested.
+    meters = columns.meter_id or repeat(meter_ids[0] if meter_ids else "")
+    return [
+        {
+            "time": str(datetime.fromtimestamp(ms / 1000, tz=timezone.utc)),
+            "meter_id": m,
+            "meterusage": None if math.isnan(v) else v,
+        }
+        for ms, v, m in zip(columns.time_unix_ms, columns.meterusage, meters)
+    ]
+
+
+def _metrics_data(request, response):
+    if request.columnar:
+        return _columns_to_json_points(response.columns, request.meter_ids)
+    return _to_json_points(response)
+
+
+def fetch_metrics(request):
+    with _stage("GetMetrics", "grpc"):
+        response = GRPC_POOL.stub().GetMetrics(request, timeout=GRPC_TIMEOUT_SECONDS)
+    with _stage("GetMetrics", "convert"):
+        data = _metrics_data(request, response)
+    return {"data": data, "next_page_token": response.next_page_token}
+
+
+def fetch_aggregate(request):
+    with _stage("AggregateMetrics", "grpc"):
+        response = GRPC_POOL.stub().AggregateMetrics(
+            request, timeout=GRPC_TIMEOUT_SECONDS
+        )
+    with _stage("AggregateMetrics", "convert"):
+        return {"data": _to_json_points(response)}
+
+
+def fetch_summary(request):
+    with _stage("GetSummary", "grpc"):
+        response = GRPC_POOL.stub().GetSummary(request, timeout=GRPC_TIMEOUT_SECONDS)
+    return {"summaries": _to_json_summaries(response)}
+
+
+def fetch_anomalies(request):
+    with _stage("GetAnomalies", "grpc"):
+        response = GRPC_POOL.stub().GetAnomalies(request, timeout=GRPC_TIMEOUT_SECONDS)
+    return {"anomalies": _to_json_anomalies(response)}
+
+
+def fetch_meters(request):
+    with _stage("ListMeters", "grpc"):
+        response = GRPC_POOL.stub().ListMeters(request, timeout=GRPC_TIMEOUT_SECONDS)
+    return {"meter_ids": list(response.meter_ids)}
+
+
+def fetch_data_version():
+    with _stage("GetDataVersion", "grpc"):
+        response = GRPC_POOL.stub().GetDataVersion(
+            metrics_pb2.DataVersionRequest(), timeout=GRPC_TIMEOUT_SECONDS
+        )
+    return response.version
+
+
+def stream_metrics(request):
+    """Yield JSON-ready point lists, one per StreamMetrics message.
+
+    Only one message is held at a time, so memory stays constant however
+    many points the selection covers.
+    """
+    responses = GRPC_POOL.stub().StreamMetrics(
+        request, timeout=GRPC_STREAM_TIMEOUT_SECONDS
+    )
+    try:
+        while True:
+            with _stage("StreamMetrics", "grpc"):
+                response = next(responses, None)
+            if response is None:
+                return
+            with _stage("StreamMetrics", "convert"):
+                points = _columns_to_json_points(response.columns, request.meter_ids)
+            yield points
+    finally:
+        # Stops the backend stream when the client went away mid-download.
+        responses.cancel()
+
+
+async def aio_fetch_metrics(request):
+    with _stage("GetMetrics", "grpc"):
+        response = await AIO_POOL.stub().GetMetrics(
+            request, timeout=GRPC_TIMEOUT_SECONDS
+        )
+    with _stage("GetMetrics", "convert"):
+        data = _metrics_data(request, response)
+    return {"data": data, "next_page_token": response.next_page_token}
+
+
+async def aio_fetch_aggregate(request):
+    with _stage("AggregateMetrics", "grpc"):
+        response = await AIO_POOL.stub().AggregateMetrics(
+            request, timeout=GRPC_TIMEOUT_SECONDS
+        )
+    with _stage("AggregateMetrics", "convert"):
+        return {"data": _to_json_points(response)}
+
+
+async def aio_fetch_summary(request):
+    with _stage("GetSummary", "grpc"):
+        response = await AIO_POOL.stub().GetSummary(
+            request, timeout=GRPC_TIMEOUT_SECONDS
+        )
+    return {"summaries": _to_json_summaries(response)}
+
+
+async def aio_fetch_anomalies(request):
+    with _stage("GetAnomalies", "grpc"):
+        response = await AIO_POOL.stub().GetAnomalies(
+            request, timeout=GRPC_TIMEOUT_SECONDS
+        )
+    return {"anomalies": _to_json_anomalies(response)}
+
+
+async def aio_fetch_meters(request):
+    with _stage("ListMeters", "grpc"):
+        response = await AIO_POOL.stub().ListMeters(
+            request, timeout=GRPC_TIMEOUT_SECONDS
+        )
+    return {"meter_ids": list(response.meter_ids)}
+
+
+async def aio_fetch_data_version():
+    with _stage("GetDataVersion", "grpc"):
+        response = await AIO_POOL.stub().GetDataVersion(
+            metrics_pb2.DataVersionRequest(), timeout=GRPC_TIMEOUT_SECONDS
+        )
+    return response.version
+
+
+async def aio_stream_metrics(request):
+    """Async version of :func:`stream_metrics`."""
+    call = AIO_POOL.stub().StreamMetrics(request, timeout=GRPC_STREAM_TIMEOUT_SECONDS)
+    responses = aiter(call)
+    try:
+        while True:
+            with _stage("StreamMetrics", "grpc"):
+                response = await anext(responses, None)
+            if response is None:
+                return
+            with _stage("StreamMetrics", "convert"):
+                points = _columns_to_json_points(response.columns, request.meter_ids)
+            yield points
+    finally:
+        call.cancel()
+
+
+class _JsonExport:
+    # Same document as /api/metrics, minus next_page_token.
+    content_type = "application/json"
+    filename = None
+    head, tail = b'{"data": [', b"]}"
+
+    def __init__(self) -> None:
+        self._separator = b""
+
+    def encode(self, points) -> bytes:
+        if not points:
+            return b""
+        chunk = self._separator + json.dumps(points)[1:-1].encode()
+        self._separator = b", "
+        return chunk
+
+
+class _NdjsonExport:
+    content_type = "application/x-ndjson"
+    filename = "meterusage.ndjson"
+    head = tail = b""
+
+    def encode(self, points) -> bytes:
+        return "".join(json.dumps(p) + "\n" for p in points).encode()
+
+
+class _CsvExport:
+    content_type = "text/csv; charset=utf-8"
+    filename = "meterusage.csv"
+    head, tail = b"time,meter_id,meterusage\r\n", b""
+
+    def encode(self, points) -> bytes:
+        out = io.StringIO()
+        csv.writer(out).writerows(
+            (p["time"], p["meter_id"], p["meterusage"]) for p in points
+        )
+        return out.getvalue().encode()
+
+
+class _ApiHandler:
+    """Routes, request metrics and response writing shared by both servers.
+
+    Subclasses supply ``path``, ``headers``, ``wfile``, ``close_connection``
+    and ``send_response``/``send_header``/``end_headers``, and implement
+    the routes that call the backend.
+    """
+
+    _EXPORTS = {
+        "/api/metrics/stream": _JsonExport,
+        "/api/export.ndjson": _NdjsonExport,
+        "/api/export.csv": _CsvExport,
+    }
+    _ROUTES = (
+        "/api/metrics",
+        "/api/aggregate",
+        "/api/summary",
+        "/api/anomalies",
+        "/api/meters",
+        *_EXPORTS,
+        "/metrics",
+        "/",
+    )
+    _RPCS = {
+        "/api/metrics": "GetMetrics",
+        "/api/aggregate": "AggregateMetrics",
+        "/api/summary": "GetSummary",
+        "/api/anomalies": "GetAnomalies",
+        "/api/meters": "ListMeters",
+        **dict.fromkeys(_EXPORTS, "StreamMetrics"),
+    }
+    _BUILDERS = {
+        "/api/metrics": build_request,
+        "/api/aggregate": build_aggregate_request,
+        "/api/summary": build_summary_request,
+        "/api/anomalies": build_anomalies_request,
+        "/api/meters": lambda query: metrics_pb2.ListMetersRequest(),
+        **dict.fromkeys(_EXPORTS, build_request),
+    }
+
+    @property
+    def _stage_rpc(self):
+        return self._RPCS.get(self._route, self._route)
+
+    def begin_request(self):
+        url = urlsplit(self.path)
+        path = "/" if url.path == "/index.html" else url.path
+        self._route = path if path in self._ROUTES else "other"
+        self._status, self._body_bytes, self._etag = 0, 0, None
+        self._started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        return url
+
+    def end_request(self):
+        HTTP_IN_FLIGHT.inc(-1)
+        HTTP_SECONDS.observe(time.perf_counter() - self._started, route=self._route)
+        HTTP_RESPONSE_BYTES.observe(self._body_bytes, route=self._route)
+        HTTP_REQUESTS.inc(route=self._route, status=self._status)
+
+    def route_local(self, url):
+        """Serve the routes that need no backend call."""
+        if url.path == "/metrics":
+            self.send_body(
+                200,
+                "text/plain; version=0.0.4; charset=utf-8",
+                render_metrics().encode(),
+            )
+        elif url.path in ("/", "/index.html"):
+            self.send_static(INDEX_HTML)
+        else:
+            self.send_body(404, "text/plain; charset=utf-8", b"Not Found")
+
+    def build_api_request(self, url):
+        """Return the gRPC request for an API route, or send a 400 and None."""
+        try:
+            return self._BUILDERS[url.path](url.query)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return None
+
+    def backend_error(self, error):
+        log.error("gRPC call failed: %s", error)
+        self.send_json(502, {"error": str(error)})
+
+    def _send_headers(self, status, content_type, encoding, compressible):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        if compressible:
+            self.send_header("Vary", "Accept-Encoding")
+        if self._etag and status == 200:
+            suffix = "-" + encoding if encoding else ""
+            self.send_header("ETag", '"%s%s"' % (self._etag, suffix))
+            # Cache, but revalidate every time; unchanged data costs a 304.
+            self.send_header("Cache-Control", "no-cache")
+
+    def _accepted_encoding(self):
+        return negotiate_encoding(self.headers.get("Accept-Encoding", ""))
+
+    def send_body(self, status, content_type, body):
+        """Send ``body``, compressed when the client accepts it and it pays off."""
+        compressible = content_type.startswith(_COMPRESSIBLE)
+        encoding = None
+        if compressible and len(body) >= COMPRESS_MIN_BYTES:
+            encoding = self._accepted_encoding()
+            if encoding:
+                with _stage(self._stage_rpc, "compress"):
+                    body = _compress(body, encoding)
+        self._send_headers(status, content_type, encoding, compressible)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self._body_bytes = len(body)
+
+    def send_static(self, static):
+        self._etag = static.etag
+        if self.not_modified():
+            return
+        encoding = self._accepted_encoding()
+        body = static.variants.get(encoding, static.variants[None])
+        encoding = encoding if encoding in static.variants else None
+        self._send_headers(200, static.content_type, encoding, True)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self._body_bytes = len(body)
+
+    def encode_json(self, payload) -> bytes:
+        with _stage(self._stage_rpc, "encode"):
+            return json.dumps(payload).encode()
+
+    def send_json(self, status, payload):
+        self.send_body(status, "application/json", self.encode_json(payload))
+
+    def flight_key(self, path, request):
+        # Deterministic bytes, so equal queries map to the same key whatever
+        # the order of their query parameters.
+        return path, request.SerializeToString(deterministic=True)
+
+    def not_modified(self) -> bool:
+        """Answer 304 if If-None-Match names the current ETag; True if sent."""
+        tag = self._etag and matching_etag(
+            self.headers.get("If-None-Match", ""), self._etag
+        )
+        if not tag:
+            return False
+        self.send_response(304)
+        self.send_header("ETag", tag)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        self.end_headers()
+        return True
+
+    def conditional(self, version, url) -> bool:
+        """Derive the ETag from the backend data version; True if 304 was sent.
+
+        The tag covers the version and the full query, so any write, or a
+        different query, yields a new tag.
+        """
+        self._etag = etag_base(f"{version}|{url.path}?{url.query}".encode())
+        return self.not_modified()
+
+    def start_chunked(self, encoder):
+        """Send the headers of a chunked export; return its compressor, if any."""
+        encoding = self._accepted_encoding()
+        self._send_headers(200, encoder.content_type, encoding, True)
+        self.send_header("Transfer-Encoding", "chunked")
+        if encoder.filename:
+            self.send_header(
+                "Content-Disposition", 'attachment; filename="%s"' % encoder.filename
+            )
+        self.end_headers()
+        return _StreamCompressor(encoding) if encoding else None
+
+    def encode_chunk(self, encoder, points) -> bytes:
+        with _stage(self._stage_rpc, "encode"):
+            return encoder.encode(points)
+
+    def write_chunk(self, compressor, data):
+        if compressor is not None and data:
+            with _stage(self._stage_rpc, "compress"):
+                data = compressor.compress(data)
+        if data:
+            self.wfile.write(b"%X\r\n%s\r\n" % (len(data), data))
+            self._body_bytes += len(data)
+
+    def end_chunked(self, compressor):
+        if compressor is not None:
+            self.write_chunk(None, compressor.finish())
+        self.wfile.write(b"0\r\n\r\n")
+
+    def abort_chunked(self, error):
+        # The status is already out, so close without the terminating chunk:
+        # the client sees a truncated body instead of a silently short one.
+        log.error("Streaming response aborted: %s", error)
+        self.close_connection = True
+
+
+class Handler(_ApiHandler, BaseHTTPRequestHandler):
     def log_message(self, format, *args):  # silence default access log spam
         log.info("%s - %s", self.address_string(), format % args)
 
+    # Chunked transfer encoding and keep-alive need HTTP/1.1; every other
+    # response carries a Content-Length.
+    protocol_version = "HTTP/1.1"
+
+    _FETCHERS = {
+        "/api/metrics": fetch_metrics,
+        "/api/aggregate": fetch_aggregate,
+        "/api/summary": fetch_summary,
+        "/api/anomalies": fetch_anomalies,
+        "/api/meters": fetch_meters,
+    }
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
     def do_GET(self):
-        if self.path == "/api/metrics":
-            try:
-                data = fetch_metrics()
-                body = json.dumps({"data": data}).encode()
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self.send_header("Content-Length", str(len(body)))
-                self.end_headers()
-                self.wfile.write(body)
-            except Exception as e:
-                log.error("gRPC call failed: %s", e)
-                msg = json.dumps({"error": str(e)}).encode()
-                self.send_response(502)
-                self.send_header("Content-Type", "application/json")
-                self.send_header("Content-Length", str(len(msg)))
-                self.end_headers()
-                self.wfile.write(msg)
-
-        elif self.path in ("/", "/index.html"):
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            index_path = os.path.join(base_dir, "index.html")
-            with open(index_path, "rb") as f:
-                body = f.read()
-            self.send_response(200)
-            self.send_header("Content-Type", "text/html; charset=utf-8")
-            self.send_header("Content-Length", str(len(body)))
-            self.end_headers()
-            self.wfile.write(body)
+        url = self.begin_request()
+        try:
+            self.route(url)
+        finally:
+            self.end_request()
 
+    def route(self, url):
+        if url.path not in self._RPCS:
+            self.route_local(url)
+            return
+        try:
+            version = FLIGHT.do("version", "GetDataVersion", fetch_data_version)
+        except Exception as e:
+            log.warning("Data version unavailable, serving without ETag: %s", e)
         else:
-            self.send_response(404)
-            self.end_headers()
+            if self.conditional(version, url):
+                return
+        request = self.build_api_request(url)
+        if request is None:
+            return
+        if url.path in self._EXPORTS:
+            self.send_export(self._EXPORTS[url.path](), request)
+            return
+        try:
+            body = self.fetch_body(url.path, request)
+        except Exception as e:
+            self.backend_error(e)
+            return
+        self.send_body(200, "application/json", body)
+
+    def fetch_body(self, path, request) -> bytes:
+        """Fetch and encode the JSON body, shared with identical requests."""
+        return FLIGHT.do(
+            self.flight_key(path, request),
+            self._stage_rpc,
+            lambda: self.encode_json(self._FETCHERS[path](request)),
+        )
+
+    def send_export(self, encoder, request):
+        batches = stream_metrics(request)
+        try:
+            # Wait for the first message so that a failed call can still be
+            # reported as a 502.
+            first = next(batches, [])
+        except Exception as e:
+            self.backend_error(e)
+            return
+        compressor = self.start_chunked(encoder)
+        try:
+            self.write_chunk(compressor, encoder.head)
+            for points in chain([first], batches):
+                self.write_chunk(compressor, self.encode_chunk(encoder, points))
+            self.write_chunk(compressor, encoder.tail)
+        except Exception as e:
+            self.abort_chunked(e)
+            return
+        self.end_chunked(compressor)
+
+
+# Idle keep-alive connections are closed after this many seconds.
+_KEEPALIVE_SECONDS = 75
+# Pending connections queued by the kernel before accept().
+_LISTEN_BACKLOG = 1024
+
+
+class AsyncHandler(_ApiHandler):
+    """One client connection on the asyncio server.
+
+    Serves the same routes and responses as :class:`Handler` (HTTP/1.1 GET
+    with keep-alive), calling the backend through ``grpc.aio`` so an idle or
+    waiting client costs a coroutine rather than a thread.
+    """
+
+    _FETCHERS = {
+        "/api/metrics": aio_fetch_metrics,
+        "/api/aggregate": aio_fetch_aggregate,
+        "/api/summary": aio_fetch_summary,
+        "/api/anomalies": aio_fetch_anomalies,
+        "/api/meters": aio_fetch_meters,
+    }
+
+    def __init__(self, reader, writer) -> None:
+        self.reader = reader
+        self.wfile = writer
+        peer = writer.get_extra_info("peername")
+        self.client = peer[0] if peer else "-"
+        self.close_connection = False
+
+    def send_response(self, code, message=None):
+        self._status = code
+        self._head = [
+            "HTTP/1.1 %d %s" % (code, message or HTTPStatus(code).phrase),
+            "Date: %s" % formatdate(usegmt=True),
+        ]
+
+    def send_header(self, keyword, value):
+        self._head.append("%s: %s" % (keyword, value))
+
+    def end_headers(self):
+        if self.close_connection:
+            self._head.append("Connection: close")
+        self.wfile.write(("\r\n".join(self._head) + "\r\n\r\n").encode("latin-1"))
+
+    async def serve(self):
+        try:
+            while not self.close_connection and await self.handle_one():
+                await self.wfile.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, TimeoutError):
+            pass
+        except Exception:
+            log.exception("Error while serving %s", self.client)
+        finally:
+            self.wfile.close()
+
+    async def handle_one(self) -> bool:
+        """Read and answer one request; False once the client is done."""
+        try:
+            head = await asyncio.wait_for(
+                self.reader.readuntil(b"\r\n\r\n"), _KEEPALIVE_SECONDS
+            )
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return False
+        request_line, _, header_block = head.partition(b"\r\n")
+        self.requestline = request_line.decode("latin-1")
+        try:
+            method, self.path, version = self.requestline.split()
+        except ValueError:
+            return False
+        self.headers = parse_headers(io.BytesIO(header_block))
+        connection = self.headers.get("Connection", "").lower()
+        self.close_connection = version != "HTTP/1.1" or connection == "close"
+        if length := int(self.headers.get("Content-Length") or 0):
+            await self.reader.readexactly(length)
+
+        if method == "GET":
+            await self.do_GET()
+        else:
+            self._route, self._body_bytes, self._etag = "other", 0, None
+            self.send_body(501, "text/plain; charset=utf-8", b"Not Implemented")
+        log.info(
+            '%s - "%s" %s %s',
+            self.client,
+            self.requestline,
+            self._status,
+            self._body_bytes or "-",
+        )
+        return True
+
+    async def do_GET(self):
+        url = self.begin_request()
+        try:
+            await self.route(url)
+        finally:
+            self.end_request()
+
+    async def route(self, url):
+        if url.path not in self._RPCS:
+            self.route_local(url)
+            return
+        try:
+            version = await AIO_FLIGHT.do(
+                "version", "GetDataVersion", aio_fetch_data_version
+            )
+        except Exception as e:
+            log.warning("Data version unavailable, serving without ETag: %s", e)
+        else:
+            if self.conditional(version, url):
+                return
+        request = self.build_api_request(url)
+        if request is None:
+            return
+        if url.path in self._EXPORTS:
+            await self.send_export(self._EXPORTS[url.path](), request)
+            return
+        try:
+            body = await self.fetch_body(url.path, request)
+        except Exception as e:
+            self.backend_error(e)
+            return
+        self.send_body(200, "application/json", body)
+
+    async def fetch_body(self, path, request) -> bytes:
+        async def fetch():
+            return self.encode_json(await self._FETCHERS[path](request))
+
+        return await AIO_FLIGHT.do(
+            self.flight_key(path, request), self._stage_rpc, fetch
+        )
+
+    async def send_export(self, encoder, request):
+        batches = aio_stream_metrics(request)
+        try:
+            try:
+                first = await anext(batches, [])
+            except Exception as e:
+                self.backend_error(e)
+                return
+            compressor = self.start_chunked(encoder)
+            try:
+                self.write_chunk(compressor, encoder.head)
+                self.write_chunk(compressor, self.encode_chunk(encoder, first))
+                async for points in batches:
+                    # Wait for the client to drain its socket, so a slow
+                    # reader holds back the gRPC stream instead of buffering.
+                    await self.wfile.drain()
+                    self.write_chunk(compressor, self.encode_chunk(encoder, points))
+                self.write_chunk(compressor, encoder.tail)
+            except Exception as e:
+                self.abort_chunked(e)
+                return
+            self.end_chunked(compressor)
+        finally:
+            await batches.aclose()
 
 
 def serve():
+    global GRPC_POOL
+    GRPC_POOL = ChannelPool(GRPC_TARGETS, GRPC_CHANNELS, grpc.insecure_channel)
     server = ThreadingHTTPServer(("0.0.0.0", HTTP_PORT), Handler)
     log.info("HTTP server listening on port %d", HTTP_PORT)
     server.serve_forever()
 
 
+async def serve_async():
+    global AIO_POOL
+    AIO_POOL = ChannelPool(GRPC_TARGETS, GRPC_CHANNELS, grpc.aio.insecure_channel)
+
+    async def handle(reader, writer):
+        await AsyncHandler(reader, writer).serve()
+
+    server = await asyncio.start_server(
+        handle, "0.0.0.0", HTTP_PORT, backlog=_LISTEN_BACKLOG
+    )
+    log.info("Async HTTP server listening on port %d", HTTP_PORT)
+    async with server:
+        await server.serve_forever()
+
+
 if __name__ == "__main__":
-    serve()
+    if HTTP_ASYNC:
+        asyncio.run(serve_async())
+    else:
+        serve()
@@ -0,0 +1,393 @@
+"""Unit tests for frontend/server.py."""
+
+import asyncio
+import gzip
+import io
+import threading
+import time
+import unittest
+import zlib
+from unittest.mock import MagicMock, patch
+
+import grpc
+
+import server
+from server import (
+    AsyncSingleFlight,
+    ChannelPool,
+    SingleFlight,
+    _ApiHandler,
+    _StreamCompressor,
+    matching_etag,
+    negotiate_encoding,
+)
+
+
+def _unchunk(data: bytes) -> list[bytes]:
+    """Split a chunked transfer-encoded body into its chunks; check the framing."""
+    chunks = []
+    while True:
+        size, sep, data = data.partition(b"\r\n")
+        assert sep, "chunk size line not terminated"
+        size = int(size, 16)
+        if size == 0:
+            assert data == b"\r\n", "missing final CRLF"
+            return chunks
+        chunk, data = data[:size], data[size:]
+        assert data.startswith(b"\r\n"), "chunk data not terminated"
+        chunks.append(chunk)
+        data = data[2:]
+
+
+class FakeHandler(_ApiHandler):
+    """Records what :class:`_ApiHandler` writes instead of using a socket."""
+
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+        self.wfile = io.BytesIO()
+        self.sent = []
+        self._route = "/api/export.csv"
+        self._body_bytes = 0
+        self._etag = None
+
+    def send_response(self, code, message=None):
+        self.sent.append(("status", code))
+
+    def send_header(self, keyword, value):
+        self.sent.append((keyword, value))
+
+    def end_headers(self):
+        self.sent.append(("end",))
+
+
+class TestNegotiateEncoding(unittest.TestCase):
+    def test_accepts_gzip_with_positive_q(self):
+        self.assertEqual(negotiate_encoding("gzip"), "gzip")
+        self.assertEqual(negotiate_encoding("deflate, GZIP;q=0.5"), "gzip")
+
+    def test_q_zero_refuses_an_encoding(self):
+        self.assertIsNone(negotiate_encoding("gzip;q=0"))
+        self.assertIsNone(negotiate_encoding("gzip; q=0.0, identity"))
+
+    def test_wildcard_applies_to_unnamed_encodings_only(self):
+        self.assertEqual(negotiate_encoding("*;q=0.1"), "gzip")
+        self.assertIsNone(negotiate_encoding("gzip;q=0, *"))
+
+    def test_malformed_q_counts_as_refusal(self):
+        self.assertIsNone(negotiate_encoding("gzip;q=high"))
+
+    def test_no_acceptable_encoding(self):
+        self.assertIsNone(negotiate_encoding(""))
+        self.assertIsNone(negotiate_encoding("identity, deflate"))
+
+    def test_prefers_brotli_when_available(self):
+        with patch.object(server, "brotli", MagicMock()):
+            self.assertEqual(negotiate_encoding("gzip, br"), "br")
+            self.assertEqual(negotiate_encoding("br;q=0, gzip"), "gzip")
+        with patch.object(server, "brotli", None):
+            self.assertEqual(negotiate_encoding("br, gzip"), "gzip")
+            self.assertIsNone(negotiate_encoding("br"))
+
+
+class TestMatchingEtag(unittest.TestCase):
+    def test_matches_any_encoding_suffix_of_the_base(self):
+        self.assertEqual(matching_etag('"abc123"', "abc123"), '"abc123"')
+        self.assertEqual(matching_etag('"abc123-gzip"', "abc123"), '"abc123-gzip"')
+        self.assertEqual(matching_etag('"abc123-br"', "abc123"), '"abc123-br"')
+
+    def test_compares_weakly(self):
+        self.assertEqual(matching_etag('W/"abc123-gzip"', "abc123"), 'W/"abc123-gzip"')
+
+    def test_picks_the_matching_tag_from_a_list(self):
+        self.assertEqual(
+            matching_etag('"old", "abc123-br" , "other"', "abc123"), '"abc123-br"'
+        )
+
+    def test_star_matches_the_base(self):
+        self.assertEqual(matching_etag("*", "abc123"), '"abc123"')
+
+    def test_other_tags_do_not_match(self):
+        self.assertIsNone(matching_etag('"abc124-gzip"', "abc123"))
+        self.assertIsNone(matching_etag('"abc1"', "abc123"))
+        self.assertIsNone(matching_etag("", "abc123"))
+
+
+class TestChunkedResponse(unittest.TestCase):
+    def test_frames_chunks_and_terminates_the_body(self):
+        handler = FakeHandler()
+
+        handler.write_chunk(None, b"time,meterusage\n")
+        handler.write_chunk(None, b"x" * 300)
+        handler.end_chunked(None)
+
+        self.assertEqual(
+            _unchunk(handler.wfile.getvalue()), [b"time,meterusage\n", b"x" * 300]
+        )
+        self.assertIn(b"\r\n12C\r\n", handler.wfile.getvalue())
+        self.assertEqual(handler._body_bytes, 316)
+
+    def test_empty_chunk_is_not_written(self):
+        # A zero-length chunk would end the body early.
+        handler = FakeHandler()
+
+        handler.write_chunk(None, b"")
+        handler.end_chunked(None)
+
+        self.assertEqual(handler.wfile.getvalue(), b"0\r\n\r\n")
+
+    def test_start_sends_headers_and_returns_a_compressor(self):
+        handler = FakeHandler({"Accept-Encoding": "gzip"})
+
+        compressor = handler.start_chunked(server._CsvExport())
+
+        self.assertIsInstance(compressor, _StreamCompressor)
+        self.assertIn(("Transfer-Encoding", "chunked"), handler.sent)
+        self.assertIn(("Content-Encoding", "gzip"), handler.sent)
+        self.assertEqual(handler.sent[-1], ("end",))
+
+    def test_compressed_chunks_decode_to_the_body(self):
+        handler = FakeHandler({"Accept-Encoding": "gzip"})
+        compressor = handler.start_chunked(server._CsvExport())
+
+        handler.write_chunk(compressor, b"a,1\n" * 100)
+        handler.write_chunk(compressor, b"b,2\n" * 100)
+        handler.end_chunked(compressor)
+
+        body = b"".join(_unchunk(handler.wfile.getvalue()))
+        self.assertEqual(gzip.decompress(body), b"a,1\n" * 100 + b"b,2\n" * 100)
+
+
+class TestStreamCompressor(unittest.TestCase):
+    PARTS = [b'{"time": "2021-01-01 00:00:00", "meterusage": 1.5}\n' * 50] * 3
+
+    def test_gzip_pieces_decode_as_they_arrive(self):
+        compressor = _StreamCompressor("gzip")
+        decoder = zlib.decompressobj(31)
+
+        pieces = []
+        for part in self.PARTS:
+            piece = compressor.compress(part)
+            # Flushed, so everything sent so far decodes without the rest.
+            self.assertEqual(decoder.decompress(piece), part)
+            pieces.append(piece)
+        pieces.append(compressor.finish())
+
+        self.assertEqual(gzip.decompress(b"".join(pieces)), b"".join(self.PARTS))
+
+    @unittest.skipUnless(server.brotli, "Brotli is not installed")
+    def test_brotli_pieces_decode_as_they_arrive(self):
+        compressor = _StreamCompressor("br")
+        decoder = server.brotli.Decompressor()
+
+        pieces = []
+        for part in self.PARTS:
+            piece = compressor.compress(part)
+            self.assertEqual(decoder.process(piece), part)
+            pieces.append(piece)
+        pieces.append(compressor.finish())
+
+        self.assertEqual(
+            server.brotli.decompress(b"".join(pieces)), b"".join(self.PARTS)
+        )
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached in %ss" % timeout)
+        time.sleep(0.001)
+
+
+def _coalesced(rpc):
+    return server.COALESCED_REQUESTS._values.get((("rpc", rpc),), 0)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def _run_concurrently(self, flight, fn, followers=3):
+        """Run ``fn`` in a leader thread while ``followers`` threads ask for
+        the same key; return every caller's result or exception."""
+        release = threading.Event()
+        coalesced = _coalesced("Test")
+        outcomes = []
+
+        def leader_fn():
+            release.wait(5)
+            return fn()
+
+        def call(func):
+            try:
+                outcomes.append(flight.do("key", "Test", func))
+            except Exception as e:
+                outcomes.append(e)
+
+        threads = [threading.Thread(target=call, args=(leader_fn,))]
+        threads[0].start()
+        _wait_until(lambda: "key" in flight._flights)
+        for _ in range(followers):
+            threads.append(threading.Thread(target=call, args=(self.fail,)))
+            threads[-1].start()
+        # Followers count themselves as coalesced just before they wait.
+        _wait_until(lambda: _coalesced("Test") == coalesced + followers)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+
+        outcomes = self._run_concurrently(flight, lambda: calls.append(1) or "rows")
+
+        self.assertEqual(outcomes, ["rows"] * 4)
+        self.assertEqual(calls, [1])
+        self.assertEqual(flight._flights, {})
+
+    def test_error_reaches_every_caller(self):
+        flight = SingleFlight()
+        error = grpc.RpcError("backend down")
+
+        def fail():
+            raise error
+
+        outcomes = self._run_concurrently(flight, fail)
+
+        self.assertEqual(len(outcomes), 4)
+        for outcome in outcomes:
+            self.assertIs(outcome, error)
+        # Nothing is kept: the next call runs again.
+        self.assertEqual(flight._flights, {})
+        self.assertEqual(flight.do("key", "Test", lambda: "rows"), "rows")
+
+
+class TestAsyncSingleFlight(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_callers_share_one_call(self):
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await release.wait()
+            return "rows"
+
+        callers = [
+            asyncio.create_task(flight.do("key", "Test", fetch)) for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await asyncio.gather(*callers), ["rows"] * 3)
+        self.assertEqual(calls, [1])
+        self.assertEqual(flight._flights, {})
+
+    async def test_error_reaches_every_caller(self):
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        error = grpc.RpcError("backend down")
+
+        async def fail():
+            await release.wait()
+            raise error
+
+        callers = [
+            asyncio.create_task(flight.do("key", "Test", fail)) for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+
+        outcomes = await asyncio.gather(*callers, return_exceptions=True)
+        for outcome in outcomes:
+            self.assertIs(outcome, error)
+        self.assertEqual(flight._flights, {})
+
+    async def test_cancelled_caller_does_not_cancel_the_call(self):
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "rows"
+
+        leader = asyncio.create_task(flight.do("key", "Test", fetch))
+        follower = asyncio.create_task(flight.do("key", "Test", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await follower, "rows")
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+
+
+class TestChannelPool(unittest.TestCase):
+    def _pool(self, targets=("a:1", "b:1"), size=1):
+        factory = MagicMock(side_effect=lambda target, options: MagicMock())
+        return ChannelPool(list(targets), size, factory), factory
+
+    def _picked(self, pool, n):
+        return [pool._stubs.index(pool.stub()) for _ in range(n)]
+
+    def test_opens_size_channels_per_target_through_dns(self):
+        pool, factory = self._pool(size=2)
+
+        self.assertEqual(len(pool.channels), 4)
+        self.assertEqual(
+            [c.args[0] for c in factory.call_args_list],
+            ["dns:///a:1", "dns:///b:1"] * 2,
+        )
+        for channel in pool.channels:
+            channel.subscribe.assert_called_once()
+
+    def test_keeps_explicit_resolver_scheme(self):
+        _, factory = self._pool(targets=("ipv4:///10.0.0.1:50051",))
+
+        self.assertEqual(factory.call_args.args[0], "ipv4:///10.0.0.1:50051")
+
+    def test_round_robins_over_channels(self):
+        pool, _ = self._pool(targets=("a:1", "b:1", "c:1"))
+
+        self.assertEqual(self._picked(pool, 6), [0, 1, 2, 0, 1, 2])
+
+    def test_skips_failing_channels_until_they_recover(self):
+        pool, _ = self._pool(targets=("a:1", "b:1", "c:1"))
+
+        pool._on_state(1, grpc.ChannelConnectivity.TRANSIENT_FAILURE)
+        self.assertEqual(self._picked(pool, 4), [0, 2, 2, 0])
+
+        pool._on_state(1, grpc.ChannelConnectivity.READY)
+        self.assertEqual(set(self._picked(pool, 3)), {0, 1, 2})
+
+    def test_falls_back_to_round_robin_when_all_fail(self):
+        pool, _ = self._pool()
+
+        for index in range(2):
+            pool._on_state(index, grpc.ChannelConnectivity.TRANSIENT_FAILURE)
+
+        self.assertEqual(self._picked(pool, 3), [0, 1, 0])
+
+    def test_aio_channels_report_their_state_when_asked(self):
+        channels = [MagicMock(spec=grpc.aio.Channel) for _ in range(2)]
+        states = iter(channels)
+        pool = ChannelPool(["a:1", "b:1"], 1, lambda target, options: next(states))
+        channels[0].get_state.return_value = grpc.ChannelConnectivity.TRANSIENT_FAILURE
+        channels[1].get_state.return_value = grpc.ChannelConnectivity.IDLE
+
+        self.assertEqual(self._picked(pool, 2), [1, 1])
+
+    def test_pools_are_created_by_serve_not_on_import(self):
+        self.assertIsNone(server.GRPC_POOL)
+        self.assertIsNone(server.AIO_POOL)
+        self.addCleanup(setattr, server, "GRPC_POOL", None)
+
+        with patch("server.ThreadingHTTPServer"), patch(
+            "server.grpc.insecure_channel"
+        ) as factory:
+            server.serve()
+
+        self.assertIsInstance(server.GRPC_POOL, ChannelPool)
+        self.assertEqual(
+            factory.call_count, len(server.GRPC_TARGETS) * server.GRPC_CHANNELS
+        )